@@ -1,6 +1,29 @@
-from .celery import app as celery_app
+"""members package.
 
-__all__ = ('celery_app',)
+The Celery app and the version are resolved on first access, so importing the project (every web
+worker, Celery worker and manage.py run) neither boots Celery nor runs git. Module ``__getattr__``
+(PEP 562) needs Python 3.7, so the module's class provides it instead.
+"""
+import sys
+import types
+
+
+class _Package(types.ModuleType):
+
+    def __getattr__(self, name):
+        if name == 'celery_app':
+            from .celery import app
+            return app
+        if name == '__version__':
+            try:
+                from ._static_version import get_versions
+            except ImportError:  # a source checkout that was never built or installed
+                from ._version import get_versions
+            version = self.__dict__['__version__'] = get_versions()['version']
+            return version
+        raise AttributeError("module {!r} has no attribute {!r}".format(self.__name__, name))
 
-from . import _version
-__version__ = _version.get_versions()['version']
+
+sys.modules[__name__].__class__ = _Package
+
+__all__ = ('celery_app',)
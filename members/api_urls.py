@@ -0,0 +1,38 @@
+"""URL configuration of the JSON API, served by ``members.handlers.APIHandler``.
+
+These views need no sessions, CSRF cookies, users or messages. ``members.urls`` includes them too,
+so they resolve the same way through the full site.
+"""
+from django.conf.urls import url
+from members.profiling import profiles_view, profile_view
+from members.views import metrics_view
+from subscribers.views import (GetSubsByAccountId, GetSubById, GetSubByPhoneNumber, GetSubByClientMemberId,
+    CreateMember, SearchMembers, GetChanges, ExportMembers, GetImportJob, ResumeImportJob, GetAccountStats)
+
+urlpatterns = [
+    url(r'^api/get_members_by_acc_id/(?P<account_id>\w+)/$', GetSubsByAccountId.as_view(),
+        name='get_members_by_acc_id'),
+    url(r'^api/get_member_by_id/(?P<id>\w+)/$', GetSubById.as_view(),
+        name='get_member_by_id'),
+    url(r'^api/get_member_by_phone/(?P<phone_number>\w+)/$', GetSubByPhoneNumber.as_view(),
+        name='get_member_by_phone'),
+    url(r'^api/get_member_by_client_id/(?P<client_member_id>\w+)/$', GetSubByClientMemberId.as_view(),
+        name='get_member_by_client_id'),
+    url(r'^api/search_members/$', SearchMembers.as_view(),
+        name='search_members'),
+    url(r'^api/changes/$', GetChanges.as_view(),
+        name='changes'),
+    url(r'^api/account_stats/$', GetAccountStats.as_view(),
+        name='account_stats'),
+    url(r'^api/export_members/(?P<export_format>csv|ndjson)/$', ExportMembers.as_view(),
+        name='export_members'),
+    url(r'^api/create_member/', CreateMember.as_view(),
+        name='create_member'),
+    url(r'^api/imports/(?P<job_id>\d+)/$', GetImportJob.as_view(),
+        name='import_job'),
+    url(r'^api/imports/(?P<job_id>\d+)/resume/$', ResumeImportJob.as_view(),
+        name='resume_import_job'),
+    url(r'^api/metrics/$', metrics_view, name='metrics'),
+    url(r'^api/profiles/$', profiles_view, name='profiles'),
+    url(r'^api/profiles/(?P<profile_id>[\w.-]+)/$', profile_view, name='profile'),
+]
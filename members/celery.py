@@ -8,6 +8,9 @@ from celery import Celery
 # set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'members.settings')
 
+from members import tracing
+from subscribers import connections, querylog  # noqa needs the settings module
+
 app = Celery('members')
 
 # Using a string here means the worker doesn't have to serialize
@@ -19,6 +22,11 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # Load task modules from all registered Django app configs.
 app.autodiscover_tasks()
 
+# Keep the database connections of worker processes open between tasks.
+connections.connect_worker_signals()
+querylog.connect_worker_signals()
+tracing.connect_worker_signals()
+
 
 @app.task(bind=True)
 def debug_task(self):
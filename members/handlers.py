@@ -0,0 +1,65 @@
+"""WSGI handlers, giving the JSON API a shorter middleware chain than the rest of the site."""
+import logging
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.core.handlers.exception import convert_exception_to_response
+from django.core.handlers.wsgi import WSGIHandler, get_path_info
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger('django.request')
+
+
+class APIHandler(WSGIHandler):
+    """A WSGI handler running ``API_MIDDLEWARE`` and resolving against ``API_URLCONF`` only."""
+
+    def load_middleware(self):
+        """Build the chain the way BaseHandler does, from API_MIDDLEWARE instead of MIDDLEWARE."""
+        self._view_middleware = []
+        self._template_response_middleware = []
+        self._exception_middleware = []
+
+        handler = convert_exception_to_response(self._get_response)
+        for middleware_path in reversed(settings.API_MIDDLEWARE):
+            middleware = import_string(middleware_path)
+            try:
+                mw_instance = middleware(handler)
+            except MiddlewareNotUsed as exc:
+                if settings.DEBUG:
+                    logger.debug('MiddlewareNotUsed(%r): %s', middleware_path, exc)
+                continue
+            if mw_instance is None:
+                raise ImproperlyConfigured('Middleware factory %s returned None.' % middleware_path)
+
+            if hasattr(mw_instance, 'process_view'):
+                self._view_middleware.insert(0, mw_instance.process_view)
+            if hasattr(mw_instance, 'process_template_response'):
+                self._template_response_middleware.append(mw_instance.process_template_response)
+            if hasattr(mw_instance, 'process_exception'):
+                self._exception_middleware.append(mw_instance.process_exception)
+
+            handler = convert_exception_to_response(mw_instance)
+
+        self._middleware_chain = handler
+
+    def get_response(self, request):
+        request.urlconf = settings.API_URLCONF
+        return super().get_response(request)
+
+
+class APIDispatcher(object):
+    """Send the requests under ``API_PATH_PREFIX`` to an ``APIHandler`` and every other request to the site.
+
+    Paths are told apart by prefix alone, the handler taking a request is the only one resolving it.
+    The site views under the prefix, listed in ``API_SITE_PATHS``, stay with the site.
+    """
+
+    def __init__(self, site):
+        self.site = site
+        self.api = APIHandler()
+
+    def __call__(self, environ, start_response):
+        path = get_path_info(environ)
+        if path.startswith(settings.API_PATH_PREFIX) and not path.startswith(tuple(settings.API_SITE_PATHS)):
+            return self.api(environ, start_response)
+        return self.site(environ, start_response)
@@ -0,0 +1,42 @@
+"""In-process counters and timers, exposed by the metrics endpoint."""
+
+import threading
+from collections import defaultdict
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_timers = {}
+
+
+def incr(name, value=1):
+    """Add value to a counter."""
+    with _lock:
+        _counters[name] += value
+
+
+def observe(name, seconds):
+    """Record one duration for a timer."""
+    with _lock:
+        timer = _timers.setdefault(name, [0, 0.0, 0.0])
+        timer[0] += 1
+        timer[1] += seconds
+        timer[2] = max(timer[2], seconds)
+
+
+def snapshot():
+    """Return a copy of every counter and timer."""
+    with _lock:
+        return {
+            'counters': dict(_counters),
+            'timers': {
+                name: {'count': count, 'total_ms': total * 1000, 'max_ms': longest * 1000}
+                for name, (count, total, longest) in _timers.items()
+            },
+        }
+
+
+def reset():
+    """Forget everything recorded so far, e.g. in a freshly forked worker."""
+    with _lock:
+        _counters.clear()
+        _timers.clear()
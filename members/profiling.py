@@ -0,0 +1,105 @@
+"""On-demand profiling of single requests.
+
+A request carrying ``X-Profile: <PROFILE_TOKEN>``, or picked at ``PROFILE_SAMPLE_RATE``, runs
+under cProfile. The stats are saved to ``PROFILE_DIR`` in pstats format (readable by ``python -m
+pstats``, snakeviz or speedscope) and the response names them in ``X-Profile-Id``. Requests that
+aren't profiled only pay for a header lookup.
+"""
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import random
+import re
+import time
+import uuid
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, JsonResponse
+
+from members import metrics
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+SORT_KEYS = ('cumulative', 'tottime', 'calls')
+_PROFILE_ID = re.compile(r'^[\w.-]+$')
+
+
+def _authorised(request):
+    token = request.META.get(PROFILE_HEADER)
+    return bool(settings.PROFILE_TOKEN and token and hmac.compare_digest(token, settings.PROFILE_TOKEN))
+
+
+class ProfilingMiddleware(object):
+    """Profile the rest of the middleware chain and the view of selected requests."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def _selected(self, request):
+        # Downloads send the token too, but aren't worth a profile of their own.
+        if request.path_info.startswith('/api/profiles/'):
+            return False
+        if PROFILE_HEADER in request.META and _authorised(request):
+            return True
+        return bool(settings.PROFILE_SAMPLE_RATE) and random.random() < settings.PROFILE_SAMPLE_RATE
+
+    def __call__(self, request):
+        if not self._selected(request):
+            return self.get_response(request)
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:  # another request of this process is being profiled
+            return self.get_response(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+        response['X-Profile-Id'] = save(profiler, request)
+        metrics.incr('profiles.saved')
+        return response
+
+
+def save(profiler, request):
+    """Write the stats of a profiled request to PROFILE_DIR and return their id."""
+    name = request.resolver_match.url_name if request.resolver_match else None
+    profile_id = '{}-{}-{}'.format(int(time.time() * 1000), name or 'unresolved', uuid.uuid4().hex[:8])
+    os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+    profiler.dump_stats(os.path.join(settings.PROFILE_DIR, profile_id + '.prof'))
+    # Keep the newest PROFILE_KEEP.
+    for old in list_profiles()[settings.PROFILE_KEEP:]:
+        os.remove(os.path.join(settings.PROFILE_DIR, old + '.prof'))
+    return profile_id
+
+
+def list_profiles():
+    """Return the ids of the saved profiles, newest first."""
+    if not os.path.isdir(settings.PROFILE_DIR):
+        return []
+    names = [name[:-len('.prof')] for name in os.listdir(settings.PROFILE_DIR) if name.endswith('.prof')]
+    return sorted(names, key=lambda name: int(name.split('-')[0]), reverse=True)
+
+
+def profiles_view(request):
+    """Return the ids of the saved profiles, to callers with the profile token."""
+    if not _authorised(request):
+        return JsonResponse({}, status=404)
+    return JsonResponse({'profiles': list_profiles()})
+
+
+def profile_view(request, profile_id):
+    """Return a saved profile as a pstats file, or as text with ?format=text."""
+    path = os.path.join(settings.PROFILE_DIR, profile_id + '.prof')
+    if not _authorised(request) or not _PROFILE_ID.match(profile_id) or not os.path.exists(path):
+        return JsonResponse({}, status=404)
+    if request.GET.get('format') == 'text':
+        out = io.StringIO()
+        sort = request.GET.get('sort')
+        limit = request.GET.get('limit', '')
+        pstats.Stats(path, stream=out).sort_stats(sort if sort in SORT_KEYS else 'cumulative').print_stats(
+            int(limit) if limit.isdigit() else 50)
+        return HttpResponse(out.getvalue(), content_type='text/plain')
+    response = FileResponse(open(path, 'rb'), content_type='application/octet-stream')
+    response['Content-Disposition'] = 'attachment; filename="{}.prof"'.format(profile_id)
+    return response
@@ -30,9 +30,6 @@ DEBUG = False
 
 ALLOWED_HOSTS = ['localhost']
 
-STATICFILES_DIR = [
-    os.path.join(BASE_DIR, 'static'),
-]
 LOG_NAME = 'members'
 
 LOGGING = {
@@ -51,6 +48,62 @@ LOGGING = {
 
 CELERY_BROKER_URL = 'amqp://localhost'
 
+# Import chunks go to the bulk queue so they never hold up the short tasks of the interactive one.
+# Run a worker per queue with the concurrency and prefetch of WORKER_QUEUE_OPTIONS:
+#   python manage.py run_worker interactive
+#   python manage.py run_worker bulk
+# Tasks used to go to the "celery" queue, the interactive worker drains it until
+# INTERACTIVE_WORKER_LEGACY_QUEUES is emptied.
+CELERY_TASK_DEFAULT_QUEUE = 'interactive'
+CELERY_TASK_QUEUES = {
+    'interactive': {'exchange': 'interactive', 'routing_key': 'interactive'},
+    'bulk': {'exchange': 'bulk', 'routing_key': 'bulk'},
+    'celery': {'exchange': 'celery', 'routing_key': 'celery'},
+}
+CELERY_TASK_ROUTES = {
+    'subscribers.tasks.run_import_job': {'queue': 'bulk'},
+}
+# An import task over IMPORT_MEMORY_BUDGET_MB of RSS after a chunk halves the job's chunk size (down
+# to IMPORT_MIN_CHUNK_SIZE) and queues the rest of the job again, and a bulk worker process over
+# the budget is replaced once its task is done (0 for no budget). IMPORT_TRACEMALLOC also traces
+# the Python allocations of each chunk, at a noticeable cost in speed.
+IMPORT_MEMORY_BUDGET_MB = env.int('IMPORT_MEMORY_BUDGET_MB', 0)
+IMPORT_MIN_CHUNK_SIZE = env.int('IMPORT_MIN_CHUNK_SIZE', 100)
+IMPORT_TRACEMALLOC = env.bool('IMPORT_TRACEMALLOC', False)
+WORKER_QUEUE_OPTIONS = {
+    'interactive': {
+        'concurrency': env.int('INTERACTIVE_WORKER_CONCURRENCY', 8),
+        'prefetch_multiplier': env.int('INTERACTIVE_WORKER_PREFETCH', 4),
+        'legacy_queues': env.list('INTERACTIVE_WORKER_LEGACY_QUEUES', ['celery']),
+    },
+    # Long tasks acknowledged late: prefetch one at a time so a busy process doesn't sit on more.
+    'bulk': {
+        'concurrency': env.int('BULK_WORKER_CONCURRENCY', 2),
+        'prefetch_multiplier': env.int('BULK_WORKER_PREFETCH', 1),
+        'max_memory_per_child': IMPORT_MEMORY_BUDGET_MB * 1024,
+    },
+}
+
+# Number of member rows an import processes at a time.
+IMPORT_CHUNK_SIZE = env.int('IMPORT_CHUNK_SIZE', 10000)
+
+# Where the rows of uploaded member files wait until their import job is done.
+IMPORT_ROOT = env.str('IMPORT_ROOT', os.path.join(BASE_DIR, "imports"))
+
+# An import job hands its worker back after this many seconds and queues itself again behind the
+# other uploads, and applies at most IMPORT_ROWS_PER_SECOND rows a second (0 for no limit).
+IMPORT_TASK_SECONDS = env.int('IMPORT_TASK_SECONDS', 60)
+IMPORT_ROWS_PER_SECOND = env.int('IMPORT_ROWS_PER_SECOND', 0)
+
+# Member snapshot the lookup views answer from (empty to always use the database), written by
+# build_member_snapshot. A snapshot older than MEMBER_SNAPSHOT_MAX_AGE seconds is ignored.
+MEMBER_SNAPSHOT_PATH = env.str('MEMBER_SNAPSHOT_PATH', '')
+MEMBER_SNAPSHOT_MAX_AGE = env.int('MEMBER_SNAPSHOT_MAX_AGE', 60 * 60)
+
+# Cache alias shared by the web processes through which identical member lookups running at the
+# same time in different processes share one fetch (empty to coalesce within a process only).
+LOOKUP_COALESCE_CACHE = env.str('LOOKUP_COALESCE_CACHE', '')
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -65,17 +118,95 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'members.tracing.TracingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'subscribers.middleware.LoadProtectionMiddleware',
+    'subscribers.middleware.PrimaryPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'members.tracing.ViewSpanMiddleware',
+    'members.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'members.urls'
 
+# Middleware and URLs of the JSON API, which is served without sessions, CSRF cookies, users or
+# messages (see members.handlers).
+API_MIDDLEWARE = [
+    'members.tracing.TracingMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'subscribers.middleware.LoadProtectionMiddleware',
+    'subscribers.middleware.PrimaryPinningMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'members.tracing.ViewSpanMiddleware',
+    'members.profiling.ProfilingMiddleware',
+]
+
+API_URLCONF = 'members.api_urls'
+# Requests under API_PATH_PREFIX go to the API, except those for the site views under it.
+API_PATH_PREFIX = '/api/'
+API_SITE_PATHS = ['/api/generate_sub_batch/']
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+# API rate limits, as token buckets of requests per second and burst size. Each client has one
+# bucket for the whole API (a rate of 0 turns it off) and one per endpoint listed in
+# THROTTLE_ENDPOINT_RATES, none by default, e.g.
+#   THROTTLE_ENDPOINT_RATES=get_members_by_acc_id=5:20,search_members=20:50,export_members=0.1:2
+# Clients are told apart by THROTTLE_CLIENT_HEADER (e.g. HTTP_X_FORWARDED_FOR behind a proxy) or
+# their address. Buckets are kept in THROTTLE_CACHE, which should be shared by the web processes.
+THROTTLE_CACHE = env.str('THROTTLE_CACHE', 'default')
+THROTTLE_CLIENT_HEADER = env.str('THROTTLE_CLIENT_HEADER', '')
+THROTTLE_CLIENT_RATE = env.float('THROTTLE_CLIENT_RATE', 100)
+THROTTLE_CLIENT_BURST = env.int('THROTTLE_CLIENT_BURST', 200)
+THROTTLE_ENDPOINT_RATES = {}
+for endpoint, limit in env.dict('THROTTLE_ENDPOINT_RATES', {}).items():
+    rate, burst = limit.split(':')
+    THROTTLE_ENDPOINT_RATES[endpoint] = (float(rate), int(burst))
+THROTTLE_EXEMPT = ('metrics',)
+
+# A web process answers API requests with a 503 while more than SHED_MAX_IN_FLIGHT are in flight,
+# or while its queries of the last SHED_LATENCY_WINDOW seconds took more than SHED_MAX_QUERY_MS on
+# average (0 turns either check off). The average counts once there were SHED_MIN_QUERIES queries.
+SHED_MAX_IN_FLIGHT = env.int('SHED_MAX_IN_FLIGHT', 64)
+SHED_MAX_QUERY_MS = env.int('SHED_MAX_QUERY_MS', 500)
+SHED_LATENCY_WINDOW = env.int('SHED_LATENCY_WINDOW', 5)
+SHED_MIN_QUERIES = env.int('SHED_MIN_QUERIES', 20)
+
+# Statement statistics of every process (subscribers.querylog), with the plan of statements slower
+# than SLOW_QUERY_MS. Each process writes them to QUERY_LOG_DIR every QUERY_LOG_FLUSH_SECONDS for
+# the slow_queries command (empty to keep them in memory only).
+QUERY_LOG = env.bool('QUERY_LOG', True)
+SLOW_QUERY_MS = env.int('SLOW_QUERY_MS', 100)
+QUERY_LOG_DIR = env.str('QUERY_LOG_DIR', os.path.join(BASE_DIR, "querylog"))
+QUERY_LOG_FLUSH_SECONDS = env.int('QUERY_LOG_FLUSH_SECONDS', 30)
+
+# Requests sent with an "X-Profile: <PROFILE_TOKEN>" header, and a PROFILE_SAMPLE_RATE share of
+# all requests, are profiled into PROFILE_DIR, which keeps the newest PROFILE_KEEP. The token is
+# also needed to download them from /api/profiles/ (no token, no profiling on demand).
+PROFILE_TOKEN = env.str('PROFILE_TOKEN', '')
+PROFILE_SAMPLE_RATE = env.float('PROFILE_SAMPLE_RATE', 0)
+PROFILE_DIR = env.str('PROFILE_DIR', os.path.join(BASE_DIR, "profiles"))
+PROFILE_KEEP = env.int('PROFILE_KEEP', 200)
+
+# Share of requests and Celery tasks traced (members.tracing), on top of requests sent with a sampled
+# traceparent header and an "X-Trace-Token: <TRACE_TOKEN>" header (no token, traceparent headers of
+# requests are ignored). Each process appends its spans to a Chrome trace file in TRACE_DIR, rotated
+# past TRACE_FILE_MAX_MB (0 for no limit) keeping TRACE_FILE_BACKUPS older files.
+TRACE_SAMPLE_RATE = env.float('TRACE_SAMPLE_RATE', 0)
+TRACE_TOKEN = env.str('TRACE_TOKEN', '')
+TRACE_DIR = env.str('TRACE_DIR', os.path.join(BASE_DIR, "traces"))
+TRACE_FILE_MAX_MB = env.int('TRACE_FILE_MAX_MB', 50)
+TRACE_FILE_BACKUPS = env.int('TRACE_FILE_BACKUPS', 2)
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -102,9 +233,48 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # Keep connections open between requests and tasks, 0 closes them every time.
+        'CONN_MAX_AGE': env.int('DB_CONN_MAX_AGE', 300),
     }
 }
 
+# Read replicas of the default database, e.g. DATABASE_REPLICAS=replica1.sqlite3,replica2.sqlite3
+# Lookups are spread over them round-robin, writes and imports always use the primary.
+DATABASE_REPLICAS = []
+for index, name in enumerate(env.list('DATABASE_REPLICAS', []), start=1):
+    alias = 'replica{}'.format(index)
+    DATABASES[alias] = dict(DATABASES['default'], NAME=name, TEST={'MIRROR': 'default'})
+    DATABASE_REPLICAS.append(alias)
+
+# Shards for subscribers and providers, e.g. SUBSCRIBER_SHARDS=shard0.sqlite3,shard1.sqlite3
+# Members are placed by a hash of their phone number, see subscribers/sharding.py.
+SUBSCRIBER_SHARDS = []
+for index, name in enumerate(env.list('SUBSCRIBER_SHARDS', [])):
+    alias = 'shard{}'.format(index)
+    DATABASES[alias] = dict(DATABASES['default'], NAME=name)
+    SUBSCRIBER_SHARDS.append(alias)
+
+# A persistent connection idle for this many seconds is checked before it is reused.
+DB_CONN_HEALTH_CHECK_AFTER = env.int('DB_CONN_HEALTH_CHECK_AFTER', 30)
+
+# Connections a Celery worker process opens when it starts instead of on its first task.
+DB_WORKER_CONNECTIONS = env.list('DB_WORKER_CONNECTIONS', ['default'] + SUBSCRIBER_SHARDS)
+
+DATABASE_ROUTERS = ['subscribers.routers.ShardRouter', 'subscribers.routers.PrimaryReplicaRouter']
+
+# The change feed holds pages back at a missing seq younger than this, long enough for the
+# slowest write transaction (an import chunk) to commit, see subscribers/changes.py.
+CHANGES_COMMIT_SECONDS = env.int('CHANGES_COMMIT_SECONDS', 300)
+
+# How long a client keeps reading from the primary after it wrote something.
+REPLICATION_LAG_SECONDS = env.int('REPLICATION_LAG_SECONDS', 5)
+
+
+# Phone numbers are matched on their E.164 digits, national numbers of this length get the
+# default country code prepended (see subscribers/phone.py).
+PHONE_DEFAULT_COUNTRY_CODE = env.str('PHONE_DEFAULT_COUNTRY_CODE', '1')
+PHONE_NATIONAL_NUMBER_LENGTH = env.int('PHONE_NATIONAL_NUMBER_LENGTH', 10)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
@@ -143,4 +313,11 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/1.11/howto/static-files/
 
 STATIC_URL = '/static/'
-STATIC_ROOT = os.path.join(BASE_DIR, "static")
\ No newline at end of file
+# Build output, not part of the source tree.
+STATIC_ROOT = env.str('STATIC_ROOT', os.path.join(BASE_DIR, "staticfiles"))
+
+# collectstatic writes content hashed names plus .gz (and .br with Brotli installed) copies.
+STATICFILES_STORAGE = 'members.storage.CompressedManifestStaticFilesStorage'
+
+# Cache lifetime of static files without a content hash, hashed ones are cached for a year.
+STATIC_MAX_AGE = env.int('STATIC_MAX_AGE', 60 * 60)
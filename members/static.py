@@ -0,0 +1,126 @@
+"""Static file serving for deployments without a front end web server.
+
+Replaces ``django.views.static.serve``: files are streamed with FileResponse (the server's
+wsgi.file_wrapper, i.e. sendfile, where available), precompressed .br/.gz copies written by
+``members.storage`` are picked by Accept-Encoding, single byte ranges are honoured, and content
+hashed names are cached for a year. Files not collected into the document root yet are served
+from the staticfiles finders.
+"""
+
+import mimetypes
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+# Names written by ManifestStaticFilesStorage, e.g. base.5af66c1b1797.css
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+class FileRange(object):
+    """File-like reading ``length`` bytes of a file from ``start``."""
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.remaining = length
+        file.seek(start)
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def _parse_range(header, size):
+    """Return the (start, end) of a single byte range, None if it can't be honoured."""
+    match = RANGE.match(header.replace(' ', ''))
+    if not match or not (match.group(1) or match.group(2)):
+        return None
+    first, last = match.groups()
+    if not first:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if start > end:
+        return None
+    return start, end
+
+
+def _cache_control(path):
+    if HASHED_NAME.search(path):
+        return 'public, max-age={}, immutable'.format(IMMUTABLE_MAX_AGE)
+    return 'public, max-age={}'.format(settings.STATIC_MAX_AGE)
+
+
+def serve(request, path, document_root=None):
+    """Serve a static file from document_root."""
+    path = posixpath.normpath(path).lstrip('/')
+    try:
+        fullpath = safe_join(document_root, path)
+    except SuspiciousFileOperation:
+        raise Http404('"{}" does not exist'.format(path))
+    if not os.path.isfile(fullpath):
+        fullpath = finders.find(path)
+        if not fullpath:
+            raise Http404('"{}" does not exist'.format(path))
+
+    content_type, encoding = mimetypes.guess_type(fullpath)
+    content_type = content_type or 'application/octet-stream'
+    range_header = request.META.get('HTTP_RANGE')
+
+    served_path, content_encoding = fullpath, None
+    if not range_header and not encoding:
+        accepted = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        for name, suffix in ENCODINGS:
+            if name in accepted and os.path.isfile(fullpath + suffix):
+                served_path, content_encoding = fullpath + suffix, name
+                break
+
+    stat = os.stat(served_path)
+    etag = quote_etag('{:x}-{:x}'.format(int(stat.st_mtime), stat.st_size))
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE') or '')
+    if (if_none_match == etag or
+            (if_none_match is None and if_modified_since and int(stat.st_mtime) <= if_modified_since)):
+        response = HttpResponseNotModified()
+    elif range_header:
+        byte_range = _parse_range(range_header, stat.st_size)
+        if byte_range is None:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = 'bytes */{}'.format(stat.st_size)
+            return response
+        start, end = byte_range
+        response = FileResponse(FileRange(open(served_path, 'rb'), start, end - start + 1), status=206)
+        response['Content-Range'] = 'bytes {}-{}/{}'.format(start, end, stat.st_size)
+        response['Content-Length'] = end - start + 1
+    else:
+        response = FileResponse(open(served_path, 'rb'))
+        response['Content-Length'] = stat.st_size
+        if content_encoding:
+            response['Content-Encoding'] = content_encoding
+
+    if response.status_code != 304:
+        response['Content-Type'] = content_type
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Cache-Control'] = _cache_control(path)
+    response['Accept-Ranges'] = 'bytes'
+    response['Vary'] = 'Accept-Encoding'
+    return response
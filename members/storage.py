@@ -0,0 +1,63 @@
+"""Static files storage writing hashed names plus precompressed copies."""
+
+import gzip
+import io
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional, only .gz copies are written without it
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.map', '.svg', '.txt', '.html', '.json', '.xml', '.eot', '.ttf')
+
+# Files smaller than this are not worth a second round trip through the decoder.
+MIN_COMPRESS_SIZE = 256
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Collect static files under content hashed names and write .gz and .br copies next to them.
+
+    Names missing from the manifest, every name before the first collectstatic, fall back to the
+    unhashed name instead of failing the page, ``members.static`` serves those from the finders.
+    """
+
+    def stored_name(self, name):
+        try:
+            return super(CompressedManifestStaticFilesStorage, self).stored_name(name)
+        except ValueError:
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        collected = set()
+        for name, hashed_name, processed in super(CompressedManifestStaticFilesStorage, self).post_process(
+                paths, dry_run, **options):
+            yield name, hashed_name, processed
+            if not isinstance(processed, Exception):
+                collected.add(name)
+        if not dry_run:
+            for name in collected:
+                if name.endswith(COMPRESSIBLE_EXTENSIONS):
+                    self.compress(name)
+                    self.compress(self.stored_name(name))
+
+    def compress(self, name):
+        """Write the compressed copies of a collected file when they are smaller."""
+        path = self.path(name)
+        with open(path, 'rb') as source:
+            content = source.read()
+        if len(content) < MIN_COMPRESS_SIZE:
+            return
+        buffer = io.BytesIO()
+        with gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=9, mtime=0) as gzipped:
+            gzipped.write(content)
+        variants = [('.gz', buffer.getvalue())]
+        if brotli is not None:
+            variants.append(('.br', brotli.compress(content)))
+        for suffix, compressed in variants:
+            if len(compressed) < len(content):
+                with open(path + suffix, 'wb') as target:
+                    target.write(compressed)
+                os.utime(path + suffix, (os.path.getatime(path), os.path.getmtime(path)))
@@ -0,0 +1,10 @@
+"""Settings for the tests, with two shard databases for the tests that turn sharding on and a
+separate replica database for the routing tests.
+
+Run the tests with ``python manage.py test --settings=members.test_settings``.
+"""
+from members.settings import *  # noqa
+
+for alias in ('shard0', 'shard1'):
+    DATABASES[alias] = dict(DATABASES['default'], NAME=os.path.join(BASE_DIR, '{}.sqlite3'.format(alias)))  # noqa
+DATABASES['replica'] = dict(DATABASES['default'], NAME=os.path.join(BASE_DIR, 'replica.sqlite3'))  # noqa
@@ -0,0 +1,262 @@
+"""Lightweight tracing of requests, SQL statements and Celery tasks.
+
+A sampled request (``TRACE_SAMPLE_RATE``, or an incoming W3C ``traceparent`` header with the
+sampled flag from a caller sending ``X-Trace-Token: <TRACE_TOKEN>``) opens a trace. The header of
+any other caller is ignored, so clients can't make the site trace every request they send. Spans are kept per thread and nest: the request, its view, the SQL it
+runs and the Celery tasks it queues. Queued tasks carry the trace in a ``traceparent`` message
+header, so their runs on a worker join the same trace.
+
+Finished spans are appended as Chrome trace events to ``TRACE_DIR/trace-<pid>.json``, one file per
+process. Past ``TRACE_FILE_MAX_MB`` the file is rotated to ``trace-<pid>.1.json`` and so on, keeping
+``TRACE_FILE_BACKUPS`` of them. ``python manage.py export_trace`` gathers the spans of a trace from every file into one
+file for chrome://tracing, Perfetto or speedscope. Requests that aren't sampled cost a header
+lookup, and their SQL a thread local lookup per statement.
+"""
+import hmac
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+
+TRACEPARENT = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+TRACE_TOKEN_HEADER = 'HTTP_X_TRACE_TOKEN'
+
+_local = threading.local()
+_file_lock = threading.Lock()
+
+
+class Span(object):
+    """One timed operation of a trace."""
+
+    def __init__(self, name, trace_id, parent_id=None, category='app', **attributes):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.category = category
+        self.attributes = attributes
+        self.start = time.time()
+
+    def event(self):
+        """Return the span as a Chrome trace complete event."""
+        return {
+            'name': self.name, 'cat': self.category, 'ph': 'X',
+            'ts': int(self.start * 1000000), 'dur': int((time.time() - self.start) * 1000000),
+            'pid': os.getpid(), 'tid': threading.get_ident(),
+            'args': dict(self.attributes, trace_id=self.trace_id, span_id=self.span_id, parent_id=self.parent_id),
+        }
+
+
+def _stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+def current():
+    """Return the innermost open span of this thread, None outside a trace."""
+    stack = getattr(_local, 'stack', None)
+    return stack[-1] if stack else None
+
+
+def start(name, trace_id=None, parent_id=None, category='app', **attributes):
+    """Open a span, in the current trace or in the given one, and return it."""
+    parent = current()
+    if trace_id is None:
+        trace_id, parent_id = parent.trace_id, parent.span_id
+    opened = Span(name, trace_id, parent_id, category, **attributes)
+    _stack().append(opened)
+    return opened
+
+
+def finish(finished):
+    """Close a span and the ones left open inside it, writing them out."""
+    stack = _stack()
+    events = []
+    while stack:
+        opened = stack.pop()
+        events.append(opened.event())
+        if opened is finished:
+            break
+    _write(events)
+
+
+@contextmanager
+def span(name, category='app', **attributes):
+    """Time the block as a span of the current trace, or do nothing outside a trace."""
+    if current() is None:
+        yield None
+        return
+    opened = start(name, category=category, **attributes)
+    try:
+        yield opened
+    finally:
+        finish(opened)
+
+
+def _trace_path(backup=0):
+    name = 'trace-{}.{}.json'.format(os.getpid(), backup) if backup else 'trace-{}.json'.format(os.getpid())
+    return os.path.join(settings.TRACE_DIR, name)
+
+
+def _rotate():
+    """Move the full trace file of this process to the first backup, dropping the oldest."""
+    if settings.TRACE_FILE_BACKUPS < 1:
+        os.remove(_trace_path())
+        return
+    for backup in range(settings.TRACE_FILE_BACKUPS - 1, -1, -1):
+        if os.path.exists(_trace_path(backup)):
+            os.replace(_trace_path(backup), _trace_path(backup + 1))
+
+
+def _write(events):
+    path = _trace_path()
+    lines = ''.join(json.dumps(event) + ',\n' for event in events)
+    with _file_lock:
+        os.makedirs(settings.TRACE_DIR, exist_ok=True)
+        if settings.TRACE_FILE_MAX_MB and os.path.exists(path) and \
+                os.path.getsize(path) >= settings.TRACE_FILE_MAX_MB * 1024 * 1024:
+            _rotate()
+        new = not os.path.exists(path)
+        with open(path, 'a') as out:
+            # The JSON array format of Chrome traces may leave the array open.
+            out.write(('[\n' if new else '') + lines)
+
+
+def traceparent(opened):
+    """Return the W3C traceparent header value continuing a span's trace."""
+    return '00-{}-{}-01'.format(opened.trace_id, opened.span_id)
+
+
+def parse_traceparent(value):
+    """Return (trace id, parent span id) of a sampled traceparent header value, or None."""
+    match = TRACEPARENT.match(value or '')
+    if match is None or not int(match.group(3), 16) & 1:
+        return None
+    return match.group(1), match.group(2)
+
+
+def sampled():
+    """Return a new (trace id, no parent) if this root operation should be traced, or None."""
+    if settings.TRACE_SAMPLE_RATE and random.random() < settings.TRACE_SAMPLE_RATE:
+        return uuid.uuid4().hex, None
+    return None
+
+
+def read_events(directory):
+    """Return the events of every process's trace file in directory."""
+    events = []
+    for name in sorted(os.listdir(directory)):
+        if name.startswith('trace-') and name.endswith('.json'):
+            with open(os.path.join(directory, name)) as trace:
+                content = trace.read().strip().rstrip(',')
+            if content:
+                events.extend(json.loads(content + ']'))
+    return events
+
+
+def _trusted(request):
+    token = request.META.get(TRACE_TOKEN_HEADER)
+    return bool(settings.TRACE_TOKEN and token and hmac.compare_digest(token, settings.TRACE_TOKEN))
+
+
+class TracingMiddleware(object):
+    """Open a span around a sampled request, first in the middleware chain."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        context = parse_traceparent(request.META.get('HTTP_TRACEPARENT')) if _trusted(request) else None
+        context = context or sampled()
+        if context is None:
+            return self.get_response(request)
+        opened = start('{} {}'.format(request.method, request.path_info), *context, category='http')
+        try:
+            response = self.get_response(request)
+            opened.attributes['status'] = response.status_code
+        finally:
+            finish(opened)
+        response['X-Trace-Id'] = opened.trace_id
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        opened = current()
+        if opened is not None and request.resolver_match is not None:
+            opened.attributes['view'] = request.resolver_match.url_name
+
+
+class ViewSpanMiddleware(object):
+    """Open a span around the view of a traced request, last in the middleware chain."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with span('view', category='view'):
+            return self.get_response(request)
+
+
+def trace_query(execute, sql, params, many, context):
+    """Database execute wrapper timing the statements of traced operations."""
+    if current() is None:
+        return execute(sql, params, many, context)
+    with span('executemany' if many else 'sql', category='sql', sql=sql[:200], database=context['connection'].alias):
+        return execute(sql, params, many, context)
+
+
+def install(sender, connection, **kwargs):  # noqa sender
+    """Add the wrapper to a new connection, once per connection object."""
+    if trace_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(trace_query)
+
+
+def task_published(sender=None, headers=None, **kwargs):  # noqa kwargs
+    """Record queueing a task in the current trace, and send the trace along with it."""
+    if current() is None or headers is None:
+        return
+    with span('enqueue {}'.format(sender), category='celery') as opened:
+        headers['traceparent'] = traceparent(opened)
+
+
+def task_started(task=None, **kwargs):  # noqa kwargs
+    """Open a span for a task run, in the trace it was queued from if there is one."""
+    request = task.request
+    value = getattr(request, 'traceparent', None) or (getattr(request, 'headers', None) or {}).get('traceparent')
+    context = parse_traceparent(value)
+    if context is None and current() is None:
+        context = sampled()
+    if context is not None:
+        start('task {}'.format(task.name), *context, category='celery')
+    elif current() is not None:  # an eager task, run inside the trace that queued it
+        start('task {}'.format(task.name), category='celery')
+
+
+def task_finished(task=None, state=None, **kwargs):  # noqa kwargs
+    """Close the span of a task run."""
+    opened = current()
+    if opened is not None and opened.name == 'task {}'.format(task.name):
+        opened.attributes['state'] = state
+        finish(opened)
+
+
+def connect_signals():
+    """Connect the Django receivers, called once from the app config."""
+    from django.db.backends.signals import connection_created
+
+    connection_created.connect(install, dispatch_uid='members.tracing_install')
+
+
+def connect_worker_signals():
+    """Connect the Celery receivers, called from the Celery app so web workers never import Celery."""
+    from celery.signals import before_task_publish, task_prerun, task_postrun
+
+    before_task_publish.connect(task_published, dispatch_uid='members.tracing_task_published')
+    task_prerun.connect(task_started, dispatch_uid='members.tracing_task_started')
+    task_postrun.connect(task_finished, dispatch_uid='members.tracing_task_finished')
@@ -13,26 +13,15 @@ Including another URLconf
     1. Import the include() function: from django.conf.urls import url, include
     2. Add a URL to urlpatterns:  url(r'^blog/', include('blog.urls'))
 """
-from django.views.static import serve
 from django.conf.urls import url
 from django.contrib import admin
-from members import settings
-from subscribers.views import (GetSubsByAccountId, GetSubById, GetSubByPhoneNumber, GetSubByClientMemberId,
-    CreateMember, SubscriberBatchProcess)
+from members import settings, api_urls
+from members.static import serve
+from subscribers.views import SubscriberBatchProcess
 
 urlpatterns = [
     url(r'^admin/', admin.site.urls),
-    url(r'^api/get_members_by_acc_id/(?P<account_id>\w+)/$', GetSubsByAccountId.as_view(),
-        name='get_members_by_acc_id'),
-    url(r'^api/get_member_by_id/(?P<id>\w+)/$', GetSubById.as_view(),
-        name='get_member_by_id'),
-    url(r'^api/get_member_by_phone/(?P<phone_number>\w+)/$', GetSubByPhoneNumber.as_view(),
-        name='get_member_by_phone'),
-    url(r'^api/get_member_by_client_id/(?P<client_member_id>\w+)/$', GetSubByClientMemberId.as_view(),
-        name='get_member_by_client_id'),
-    url(r'^api/create_member/', CreateMember.as_view(),
-        name='create_member'),
     url(r'^api/generate_sub_batch/', SubscriberBatchProcess.as_view(),
         name='generate'),
     url(r'^static/(?P<path>.*)$', serve, {'document_root': settings.STATIC_ROOT}),
-]
+] + api_urls.urlpatterns
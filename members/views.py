@@ -0,0 +1,13 @@
+"""Project level views."""
+
+from django.http import JsonResponse
+
+from members import metrics
+from subscribers import querylog
+
+
+def metrics_view(request):  # noqa request
+    """Return the counters and timers of this process, with its most expensive statements."""
+    data = metrics.snapshot()
+    data['queries'] = querylog.top(20)
+    return JsonResponse(data)
@@ -11,6 +11,9 @@ import os
 
 from django.core.wsgi import get_wsgi_application
 
+from members.handlers import APIDispatcher
+
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "members.settings")
 
-application = get_wsgi_application()
+# The JSON API skips the session, CSRF, auth and messages middleware of the site.
+application = APIDispatcher(get_wsgi_application())
@@ -4,7 +4,9 @@
 """The setup script."""
 
 from setuptools import setup, find_packages
+from setuptools.command.develop import develop as _develop
 import versioneer
+import json
 import os
 
 with open('README.md') as readme_file:
@@ -22,6 +24,35 @@ test_requirements = [
 ]
 
 
+def write_static_version(base_dir):
+    """Freeze the version into members/_static_version.py so importing members never runs git."""
+    contents = json.dumps(versioneer.get_versions(), sort_keys=True, indent=1, separators=(",", ": "))
+    with open(os.path.join(base_dir, 'members', '_static_version.py'), 'w') as version_file:
+        version_file.write(versioneer.SHORT_VERSION_PY % contents)
+
+
+cmdclass = versioneer.get_cmdclass()
+
+
+class build_py(cmdclass['build_py']):
+    """Build the package with a static version module."""
+
+    def run(self):
+        super(build_py, self).run()
+        write_static_version(self.build_lib)
+
+
+class develop(_develop):
+    """Install in development mode with a static version module in the source tree."""
+
+    def run(self):
+        write_static_version(HERE)
+        _develop.run(self)
+
+
+cmdclass.update(build_py=build_py, develop=develop)
+
+
 def extract_requires():
     """Get pinned requirements from requirements.txt."""
     with open(os.path.join(HERE, 'requirements/main.txt'), 'r') as reqs:
@@ -31,7 +62,7 @@ def extract_requires():
 setup(
     name='members',
     version=versioneer.get_version(),
-    cmdclass=versioneer.get_cmdclass(),
+    cmdclass=cmdclass,
     description="Member and provider api/data handler",
     long_description=readme,
     author="Nathan Benson",
@@ -1,2 +1,3 @@
 # coding=utf-8
 """subscribers init file."""
+default_app_config = 'subscribers.apps.SubscribersConfig'
@@ -1,6 +1,104 @@
+from django import forms
 from django.contrib import admin
+from django.db import transaction
+from django.db.models import Q
 
-from .models import Subscriber, Provider
+from members.paginator import EstimatedCountPaginator
+from subscribers.phone import normalize_phone
+from subscribers.search import prefix_range
 
-admin.site.register(Subscriber)
-admin.site.register(Provider)
+from .models import Subscriber, Provider, Account
+
+
+class ProviderForm(forms.ModelForm):
+    """Edits the account of a provider by its account id rather than its integer key."""
+    account_id = forms.CharField(max_length=Account._meta.get_field('account_id').max_length)
+
+    class Meta:
+        model = Provider
+        fields = ('subscriber',)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.account_key is not None:
+            self.initial['account_id'] = self.instance.account_id
+
+    def save(self, commit=True):
+        """Link the account, created here for a new account id so a form that fails validation leaves none."""
+        with transaction.atomic():
+            self.instance.account_id = self.cleaned_data['account_id']
+            return super().save(commit)
+
+
+class ProviderInline(admin.TabularInline):
+    """The providers of a subscriber, loaded with one query and without a subscriber select."""
+    model = Provider
+    form = ProviderForm
+    fields = ('account_id', 'created_at', 'updated_at')
+    readonly_fields = ('created_at', 'updated_at')
+    extra = 0
+
+
+@admin.register(Subscriber)
+class SubscriberAdmin(admin.ModelAdmin):
+    list_display = ('id', 'first_name', 'last_name', 'phone_number', 'client_member_id', 'updated_at')
+    readonly_fields = ('phone_key', 'created_at', 'updated_at')
+    # What autocomplete requires, get_search_results does the searching.
+    search_fields = ('=client_member_id', '=phone_number')
+    inlines = (ProviderInline,)
+    ordering = ('id',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        """Match client member ids, phone numbers and phone suffixes or last name prefixes, all indexed."""
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        condition = Q(client_member_id=search_term)
+        phone_key = normalize_phone(search_term)
+        if phone_key is not None:
+            condition |= Q(phone_key=phone_key)
+        if search_term.isdigit():
+            condition |= prefix_range('phone_reversed', search_term[::-1])
+        else:
+            condition |= prefix_range('last_name_key', search_term.lower())
+        return queryset.filter(condition), False
+
+
+@admin.register(Provider)
+class ProviderAdmin(admin.ModelAdmin):
+    list_display = ('id', 'account_id', 'subscriber', 'updated_at')
+    list_select_related = ('subscriber',)
+    form = ProviderForm
+    fields = ('subscriber', 'account_id')
+    autocomplete_fields = ('subscriber',)
+    search_fields = ('=account_key',)
+    ordering = ('id',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        """Find the providers of an account id through its key."""
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        return queryset.filter(account_key=Account.objects.key_for(search_term, create=False)), False
+
+
+@admin.register(Account)
+class AccountAdmin(admin.ModelAdmin):
+    """Read only, providers on every shard refer to an account by its key and workers cache the mapping."""
+    list_display = ('id', 'account_id')
+    readonly_fields = ('account_id',)
+    search_fields = ('=account_id',)
+    ordering = ('id',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        """Accounts are created when a member is first linked to them."""
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
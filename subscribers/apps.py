@@ -3,3 +3,11 @@ from django.apps import AppConfig
 
 class SubscribersConfig(AppConfig):
     name = 'subscribers'
+
+    def ready(self):
+        from members import tracing
+        from subscribers import connections, querylog, signals
+        connections.connect_signals()
+        querylog.connect_signals()
+        tracing.connect_signals()
+        signals.connect_signals()
@@ -0,0 +1,101 @@
+# coding=utf-8
+"""Incremental change feed over subscribers and providers.
+
+Every save and delete appends a ``Change`` (see ``subscribers.signals``). Consumers keep the ``seq``
+of the last change they applied and ask for the changes after it, one keyset page at a time.
+
+A change gets its ``seq`` when it is written but is only visible once its transaction commits, and
+an import chunk commits thousands of them at once. A page therefore ends before the first missing
+``seq``, which may still be in flight, unless the changes after it are older than
+CHANGES_COMMIT_SECONDS, by when the missing one must have been rolled back (or pruned).
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from subscribers.models import Subscriber, Provider, Change
+
+MAX_LIMIT = 1000
+
+
+def _subscriber_data(sub):
+    return {
+        "id": sub.id,
+        "first_name": sub.first_name,
+        "last_name": sub.last_name,
+        "phone_number": sub.phone_number,
+        "client_member_id": sub.client_member_id,
+        "providers": [provider.account_id for provider in sub.providers.all()],
+        "updated_at": sub.updated_at.isoformat(),
+    }
+
+
+def _provider_data(provider):
+    return {
+        "id": provider.id,
+        "subscriber_id": provider.subscriber_id,
+        "account_id": provider.account_id,
+        "updated_at": provider.updated_at.isoformat(),
+    }
+
+
+def _current_state(changes):
+    """Load the current rows behind a page of changes, one query per entity and shard."""
+    wanted = defaultdict(set)
+    for change in changes:
+        if change.action != Change.DELETED:
+            wanted[(change.entity, change.shard)].add(change.entity_id)
+    state = {}
+    for (entity, shard), ids in wanted.items():
+        db = shard or None
+        if entity == Change.SUBSCRIBER:
+            rows = Subscriber.objects.db_manager(db).filter(id__in=ids).prefetch_related('providers')
+            state.update(((entity, shard, sub.id), _subscriber_data(sub)) for sub in rows)
+        else:
+            rows = Provider.objects.db_manager(db).filter(id__in=ids)
+            state.update(((entity, shard, provider.id), _provider_data(provider)) for provider in rows)
+    return state
+
+
+def _committed(changes, since):
+    """Return the changes up to the first gap that a transaction still in flight may fill."""
+    horizon = timezone.now() - timedelta(seconds=settings.CHANGES_COMMIT_SECONDS)
+    expected = since + 1
+    for index, change in enumerate(changes):
+        if change.seq != expected and change.changed_at > horizon:
+            return changes[:index]
+        expected = change.seq + 1
+    return changes
+
+
+def changes_since(since=0, limit=500):
+    """Return the changes after the ``since`` cursor with the current data of each changed row.
+
+    A row changed several times in the page is reported once, at its last change. ``data`` is None
+    for deleted rows and for rows deleted since the change was recorded.
+    """
+    since, limit = int(since), max(1, min(int(limit), MAX_LIMIT))
+    page = list(Change.objects.filter(seq__gt=since).order_by('seq')[:limit])
+    changes = _committed(page, since)
+    state = _current_state(changes)
+
+    latest = {}
+    for change in changes:
+        latest[(change.entity, change.shard, change.entity_id)] = change
+    results = [
+        {
+            "seq": change.seq,
+            "entity": change.entity,
+            "id": change.entity_id,
+            "shard": change.shard,
+            "action": change.action,
+            "data": state.get(key) if change.action != Change.DELETED else None,
+        }
+        for key, change in sorted(latest.items(), key=lambda item: item[1].seq)]
+    return {
+        "changes": results,
+        "next_cursor": changes[-1].seq if changes else since,
+        "has_more": len(page) == limit and len(changes) == len(page),
+    }
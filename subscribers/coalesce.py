@@ -0,0 +1,97 @@
+# coding=utf-8
+"""Single-flight coalescing of identical lookups that run at the same time.
+
+The first request for a key fetches and renders the response, requests for the same key arriving
+while it runs wait for it and get the same bytes. Nothing is kept once the fetch is done, so this
+never serves anything older than a request already in flight.
+
+Within a process the waiters share the leader's result directly. With ``LOOKUP_COALESCE_CACHE`` set
+to a cache shared by the web processes, the leader also takes a short lock in that cache and
+leaves its result there for the other processes waiting on the lock.
+"""
+import hashlib
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+from members import metrics
+from subscribers import routers
+
+# How long a cache lock is held at most, and how long its result stays for the waiters.
+LOCK_SECONDS = 5
+RESULT_SECONDS = 5
+POLL_SECONDS = 0.01
+
+
+class _Call(object):
+    """A fetch in flight in this process."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_lock = threading.Lock()
+_calls = {}
+
+
+def _fetch_shared(key, fetch):
+    """Run fetch once across the processes sharing the coalescing cache, if there is one."""
+    if not settings.LOOKUP_COALESCE_CACHE:
+        return fetch()
+    cache = caches[settings.LOOKUP_COALESCE_CACHE]
+    cache_key = 'coalesce:' + hashlib.sha1(key.encode('utf-8')).hexdigest()
+    lock_key = cache_key + ':lock'
+    token = uuid.uuid4().hex
+    if cache.add(lock_key, token, LOCK_SECONDS):
+        try:
+            result = fetch()
+            cache.set(cache_key, (token, result), RESULT_SECONDS)
+            return result
+        finally:
+            cache.delete(lock_key)
+    # Only take the result of the fetch holding the lock now, not one left by an earlier fetch.
+    token = cache.get(lock_key)
+    deadline = time.time() + LOCK_SECONDS
+    while token is not None and time.time() < deadline:
+        shared = cache.get(cache_key)
+        if shared is not None and shared[0] == token:
+            metrics.incr('coalesce.shared_across_processes')
+            return shared[1]
+        time.sleep(POLL_SECONDS)
+    return fetch()
+
+
+def coalesce(key, fetch):
+    """Return fetch(), called once for all the threads asking for the same key at the same time.
+
+    fetch must return a picklable result rather than raise for expected outcomes like a 404.
+    """
+    if routers.is_pinned():  # requests reading their own writes don't share a replica's answer
+        key += ':primary'
+    with _lock:
+        call = _calls.get(key)
+        leader = call is None
+        if leader:
+            call = _calls[key] = _Call()
+    if not leader:
+        metrics.incr('coalesce.shared')
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+    metrics.incr('coalesce.fetched')
+    try:
+        call.result = _fetch_shared(key, fetch)
+    except Exception as error:
+        call.error = error
+        raise
+    finally:
+        with _lock:
+            del _calls[key]
+        call.done.set()
+    return call.result
@@ -0,0 +1,98 @@
+# coding=utf-8
+"""Lifecycle of the persistent database connections of web and Celery workers.
+
+Django keeps one connection per thread and database for CONN_MAX_AGE seconds, which makes each
+worker process (or thread) its own small pool of one. No thread ever waits for another's
+connection, so there is no pool wait to measure: getting a connection costs a health check when it
+is reused after sitting idle, or opening a new one. These receivers health check connections that
+sat idle, open the connections of a Celery worker process before its first task, and count
+connection churn and time the health checks in ``members.metrics``.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import request_started, request_finished
+from django.db import connections, DatabaseError
+from django.db.backends.signals import connection_created
+
+from members import metrics
+
+log = logging.getLogger('.'.join((settings.LOG_NAME.split('.')[0], __name__,)))
+
+_local = threading.local()
+
+
+def _last_used():
+    if not hasattr(_local, 'last_used'):
+        _local.last_used = {}
+    return _local.last_used
+
+
+def count_connection(sender, connection, **kwargs):  # noqa sender
+    """Count every new database connection."""
+    metrics.incr('db.connections.opened')
+    metrics.incr('db.connections.opened.{}'.format(connection.alias))
+
+
+def check_connections(**kwargs):  # noqa kwargs
+    """Close the persistent connections that went stale while idle, before they are reused."""
+    now = time.time()
+    last_used = _last_used()
+    for conn in connections.all():
+        if conn.connection is None:
+            continue
+        metrics.incr('db.connections.reused')
+        if now - last_used.get(conn.alias, now) < settings.DB_CONN_HEALTH_CHECK_AFTER:
+            continue
+        metrics.incr('db.connections.health_checks')
+        start = time.time()
+        usable = conn.is_usable()
+        metrics.observe('db.connections.health_check', time.time() - start)
+        if not usable:
+            metrics.incr('db.connections.stale')
+            conn.close()
+
+
+def mark_connections_used(**kwargs):  # noqa kwargs
+    """Remember when each open connection was last used."""
+    now = time.time()
+    last_used = _last_used()
+    for conn in connections.all():
+        if conn.connection is not None:
+            last_used[conn.alias] = now
+
+
+def open_worker_connections(**kwargs):  # noqa kwargs
+    """Open the connections of a freshly forked Celery worker process.
+
+    Celery's Django fixup already dropped the connections inherited from the parent.
+    """
+    metrics.reset()
+    _last_used().clear()
+    for alias in settings.DB_WORKER_CONNECTIONS:
+        start = time.time()
+        try:
+            connections[alias].ensure_connection()
+        except DatabaseError as e:
+            log.info("Could not open the {} connection: {}".format(alias, str(e)))
+            continue
+        metrics.observe('db.connections.setup', time.time() - start)
+    mark_connections_used()
+
+
+def connect_signals():
+    """Connect the Django receivers, called once from the app config."""
+    connection_created.connect(count_connection, dispatch_uid='subscribers.count_connection')
+    request_started.connect(check_connections, dispatch_uid='subscribers.check_connections')
+    request_finished.connect(mark_connections_used, dispatch_uid='subscribers.mark_connections_used')
+
+
+def connect_worker_signals():
+    """Connect the Celery receivers, called from the Celery app so web workers never import Celery."""
+    from celery.signals import worker_process_init, task_prerun, task_postrun
+
+    task_prerun.connect(check_connections, dispatch_uid='subscribers.task_check_connections')
+    task_postrun.connect(mark_connections_used, dispatch_uid='subscribers.task_mark_connections_used')
+    worker_process_init.connect(open_worker_connections, dispatch_uid='subscribers.open_worker_connections')
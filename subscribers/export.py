@@ -0,0 +1,91 @@
+# coding=utf-8
+"""Streaming export of members with their providers.
+
+Members are read in keyset chunks of plain tuples (no model instances, no server side cursor
+needed) and written out chunk by chunk, so memory stays flat however many rows are exported.
+CSV output is the 5-column format ``SubscriberBatchProcess`` imports, one row per provider.
+"""
+import csv
+import io
+import json
+from collections import defaultdict
+
+from subscribers import sharding
+from subscribers.models import Subscriber, Provider, Account
+
+CSV_FORMAT = 'csv'
+NDJSON_FORMAT = 'ndjson'
+FORMATS = (CSV_FORMAT, NDJSON_FORMAT)
+
+CONTENT_TYPES = {CSV_FORMAT: 'text/csv', NDJSON_FORMAT: 'application/x-ndjson'}
+
+# The dialect the importer reads uploads with.
+CSV_DIALECT = {'delimiter': ',', 'quotechar': '|'}
+
+DEFAULT_CHUNK_SIZE = 2000
+
+
+def iter_member_chunks(account_id=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield lists of (first_name, last_name, phone_number, client_member_id, [account ids]).
+
+    With an account_id only the members of that account are exported, with that account only.
+    """
+    account_key = Account.objects.key_for(account_id, create=False) if account_id is not None else None
+    if account_id is not None and account_key is None:
+        return
+    for db in sharding.subscriber_dbs():
+        subscribers = Subscriber.objects.db_manager(db).all()
+        if account_id is not None:
+            subscribers = subscribers.filter(providers__account_key=account_key)
+        last_id = 0
+        while True:
+            chunk = list(subscribers.filter(id__gt=last_id).order_by('id').values_list(
+                'id', 'first_name', 'last_name', 'phone_number', 'client_member_id')[:chunk_size])
+            if not chunk:
+                break
+            last_id = chunk[-1][0]
+            accounts = defaultdict(list)
+            if account_id is None:
+                providers = Provider.objects.db_manager(db).filter(
+                    subscriber_id__in=[row[0] for row in chunk]).order_by('id')
+                links = list(providers.values_list('subscriber_id', 'account_key'))
+                account_ids = Account.objects.account_ids_for({account_key for _, account_key in links})
+                for subscriber_id, provider_account_key in links:
+                    accounts[subscriber_id].append(account_ids[provider_account_key])
+            else:
+                for row in chunk:
+                    accounts[row[0]].append(account_id)
+            yield [row[1:] + (accounts[row[0]],) for row in chunk]
+
+
+def csv_chunks(chunks):
+    """Render member chunks as CSV text, one row per provider and an empty account without one."""
+    for chunk in chunks:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, **CSV_DIALECT)
+        for first_name, last_name, phone_number, client_member_id, account_ids in chunk:
+            for account_id in account_ids or ['']:
+                writer.writerow([first_name, last_name, phone_number, client_member_id, account_id])
+        yield buffer.getvalue()
+
+
+def ndjson_chunks(chunks):
+    """Render member chunks as newline delimited JSON, one member per line."""
+    for chunk in chunks:
+        yield ''.join(
+            json.dumps({
+                "first_name": first_name,
+                "last_name": last_name,
+                "phone_number": phone_number,
+                "client_member_id": client_member_id,
+                "providers": account_ids,
+            }) + '\n'
+            for first_name, last_name, phone_number, client_member_id, account_ids in chunk)
+
+
+def export_members(export_format=CSV_FORMAT, account_id=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Return an iterator of text chunks exporting the members in the given format."""
+    chunks = iter_member_chunks(account_id, chunk_size)
+    if export_format == NDJSON_FORMAT:
+        return ndjson_chunks(chunks)
+    return csv_chunks(chunks)
@@ -0,0 +1,96 @@
+# coding=utf-8
+"""Resumable imports of member files.
+
+The valid rows of an upload are written to a file under ``IMPORT_ROOT`` and an ``ImportJob`` keeps
+the index of the next chunk to apply. ``subscribers.tasks.run_import_job`` applies chunk after chunk,
+each in a transaction on the default database that also moves the checkpoint. Applying a chunk again
+is harmless (members and providers are looked up before they are created), so a job whose worker
+died is resumed from its checkpoint, by the broker redelivering the task or by ``resume_import``,
+and ends with every row applied once.
+"""
+import csv
+import itertools
+import json
+import tempfile
+
+from django.conf import settings
+from django.core.files.base import ContentFile, File
+from django.core.files.storage import FileSystemStorage
+
+from subscribers.export import CSV_DIALECT
+from subscribers.models import ImportJob
+
+
+def import_storage():
+    return FileSystemStorage(location=settings.IMPORT_ROOT)
+
+
+def create_job(rows, mode=ImportJob.CREATE, account_id='', chunk_size=None):
+    """Save the rows of a member file and return a pending job importing them.
+
+    rows may be any iterable, they go through a temporary file rather than memory.
+    """
+    with tempfile.TemporaryFile('w+', newline='', encoding='utf-8') as buffer:
+        writer = csv.writer(buffer, **CSV_DIALECT)
+        total_rows = 0
+        for row in rows:
+            writer.writerow(row)
+            total_rows += 1
+        job = ImportJob.objects.create(mode=mode, account_id=account_id or '', total_rows=total_rows,
+                                       chunk_size=chunk_size or settings.IMPORT_CHUNK_SIZE)
+        job.rows_file = import_storage().save('import_{}.csv'.format(job.id), File(buffer))
+    job.save(update_fields=['rows_file'])
+    return job
+
+
+def iter_chunks(job):
+    """Yield (index, rows) for every chunk of the job's file."""
+    with open(import_storage().path(job.rows_file), newline='', encoding='utf-8') as handle:
+        reader = csv.reader(handle, **CSV_DIALECT)
+        for index in itertools.count():
+            rows = list(itertools.islice(reader, job.chunk_size))
+            if not rows:
+                return
+            yield index, rows
+
+
+def job_data(job):
+    return {
+        "id": job.id,
+        "mode": job.mode,
+        "account_id": job.account_id,
+        "status": job.status,
+        "total_rows": job.total_rows,
+        "chunks_done": job.next_chunk,
+        "total_chunks": job.total_chunks,
+        "report": json.loads(job.report),
+        "error": job.error,
+        "memory": json.loads(job.memory),
+        "updated_at": job.updated_at.isoformat(),
+    }
+
+
+def _plan_name(job):
+    return '{}.plan.json'.format(job.rows_file)
+
+
+def save_plan(job, content):
+    """Keep the sync plan of a job next to its rows, so runs after the first don't read them twice."""
+    storage = import_storage()
+    storage.delete(_plan_name(job))
+    storage.save(_plan_name(job), ContentFile(content.encode('utf-8')))
+
+
+def read_plan(job):
+    """Return the saved sync plan of a job, None before its first run."""
+    storage = import_storage()
+    if not storage.exists(_plan_name(job)):
+        return None
+    with storage.open(_plan_name(job)) as handle:
+        return handle.read().decode('utf-8')
+
+
+def delete_rows_file(job):
+    if job.rows_file:
+        import_storage().delete(job.rows_file)
+        import_storage().delete(_plan_name(job))
@@ -0,0 +1,90 @@
+# coding=utf-8
+"""Management command comparing providers keyed by account id strings with integer account keys."""
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from django.core.management import BaseCommand
+
+LAYOUTS = (
+    ('account_id', 'VARCHAR(20)'),
+    ('account_key', 'INTEGER'),
+)
+
+
+class Command(BaseCommand):
+    """Build a scratch SQLite provider table per layout and measure its size and account scans."""
+
+    help = 'Measure table size and account scan time of varchar account ids against integer keys'
+
+    def add_arguments(self, parser):
+        """Add args"""
+        parser.add_argument(
+            '-n', '--rows', type=int, default=500000,
+            help='The number of providers in each scratch table'
+        )
+        parser.add_argument(
+            '-a', '--accounts', type=int, default=2000,
+            help='The number of distinct accounts'
+        )
+        parser.add_argument(
+            '-s', '--scans', type=int, default=500,
+            help='The number of account scans to time per layout'
+        )
+
+    def _pages(self, db):
+        return db.execute('PRAGMA page_count').fetchone()[0]
+
+    def _measure(self, column, column_type, rows, sample):
+        handle, path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+        try:
+            db = sqlite3.connect(path)
+            page_size = db.execute('PRAGMA page_size').fetchone()[0]
+            db.execute('CREATE TABLE provider (id INTEGER PRIMARY KEY, subscriber_id INTEGER NOT NULL, '
+                       '{} {} NOT NULL, created_at DATETIME, updated_at DATETIME)'.format(column, column_type))
+            db.executemany('INSERT INTO provider (subscriber_id, {}, created_at, updated_at) '
+                           'VALUES (?, ?, ?, ?)'.format(column), rows)
+            db.commit()
+            table_bytes = self._pages(db) * page_size
+            db.execute('CREATE UNIQUE INDEX by_subscriber ON provider (subscriber_id, {})'.format(column))
+            db.execute('CREATE INDEX by_account ON provider ({})'.format(column))
+            db.commit()
+            index_bytes = self._pages(db) * page_size - table_bytes
+
+            query = 'SELECT subscriber_id FROM provider WHERE {} = ?'.format(column)
+            start = time.time()
+            for account in sample:
+                db.execute(query, (account,)).fetchall()
+            scan = (time.time() - start) / len(sample)
+            start = time.time()
+            db.execute('SELECT {0}, COUNT(*) FROM provider GROUP BY {0}'.format(column)).fetchall()
+            group = time.time() - start
+            db.close()
+            return table_bytes, index_bytes, scan, group
+        finally:
+            os.remove(path)
+
+    def handle(self, *args, **options):
+        """Handle the command"""
+        account_ids = ['{}'.format(random.randrange(10 ** 9, 10 ** 10)) for _ in range(options['accounts'])]
+        keys = {account_id: key for key, account_id in enumerate(account_ids, 1)}
+        links = set()
+        while len(links) < options['rows']:
+            links.add((random.randrange(options['rows']), random.choice(account_ids)))
+        links = sorted(links)
+        sample = random.sample(account_ids, min(options['scans'], len(account_ids)))
+        stamp = '2022-05-17 21:48:00.000000'
+        for column, column_type in LAYOUTS:
+            if column == 'account_id':
+                rows = [(subscriber_id, account_id, stamp, stamp) for subscriber_id, account_id in links]
+                accounts = sample
+            else:
+                rows = [(subscriber_id, keys[account_id], stamp, stamp) for subscriber_id, account_id in links]
+                accounts = [keys[account_id] for account_id in sample]
+            table_bytes, index_bytes, scan, group = self._measure(column, column_type, rows, accounts)
+            self.stdout.write('{:<12} table {:>8.1f} KiB  indexes {:>8.1f} KiB  {:>7.1f}us/account scan  '
+                              '{:>6.1f}ms count by account'.format(
+                                  column, table_bytes / 1024.0, index_bytes / 1024.0, scan * 1000000, group * 1000))
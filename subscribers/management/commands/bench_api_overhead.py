@@ -0,0 +1,63 @@
+# coding=utf-8
+"""Management command comparing the per-request cost of the API fast path with the full site."""
+import logging
+import time
+from wsgiref.util import setup_testing_defaults
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.core.wsgi import get_wsgi_application
+
+from members.handlers import APIHandler
+
+
+class Command(BaseCommand):
+    """Time the same API requests through the full middleware stack and through APIHandler."""
+
+    help = 'Measure the per-request overhead of the full middleware stack on API views'
+
+    def add_arguments(self, parser):
+        """Add args"""
+        parser.add_argument(
+            '-n', '--iterations', type=int, default=2000,
+            help='The number of requests to send for each case'
+        )
+        parser.add_argument(
+            '--path', action='append',
+            help='API paths to request, the metrics endpoint and a member lookup by default'
+        )
+
+    def _run(self, handler, path, cookie, iterations):
+        """Send the requests and return the time per request in microseconds."""
+        environ = {'PATH_INFO': path, 'HTTP_HOST': settings.ALLOWED_HOSTS[0]}
+        if cookie:
+            # A browser or client library sending back the site's session cookie.
+            environ['HTTP_COOKIE'] = '{}=bench0000000000000000000000000000'.format(settings.SESSION_COOKIE_NAME)
+        setup_testing_defaults(environ)
+        statuses = set()
+
+        def start_response(status, headers):
+            statuses.add(status)
+
+        start = time.time()
+        for _ in range(iterations):
+            response = handler(dict(environ), start_response)
+            b''.join(response)
+            response.close()
+        elapsed = time.time() - start
+        return elapsed / iterations * 1000000, ', '.join(sorted(statuses))
+
+    def handle(self, *args, **options):
+        """Handle the command"""
+        handlers = (('full stack', get_wsgi_application()), ('api fast path', APIHandler()))
+        # Request logging costs the same either way and would drown the output.
+        logging.disable(logging.CRITICAL)
+        # Every request comes from the same client, keep it clear of the rate limits.
+        settings.THROTTLE_CLIENT_RATE = 0
+        settings.THROTTLE_ENDPOINT_RATES = {}
+        for path in options['path'] or ['/api/metrics/', '/api/get_member_by_id/0/']:
+            for cookie in (False, True):
+                for label, handler in handlers:
+                    per_request, statuses = self._run(handler, path, cookie, options['iterations'])
+                    self.stdout.write('{:<34} {:<14} {:>8.1f}us/request  {}'.format(
+                        path + (' +cookie' if cookie else ''), label, per_request, statuses))
@@ -0,0 +1,48 @@
+# coding=utf-8
+"""Management command comparing per-query connections with a persistent connection."""
+import time
+
+from django.core.management import BaseCommand
+from django.db import connections
+
+from members import metrics
+
+
+class Command(BaseCommand):
+    """Time a trivial query with and without reconnecting before each one."""
+
+    help = 'Measure the connection setup cost removed by persistent connections'
+
+    def add_arguments(self, parser):
+        """Add args"""
+        parser.add_argument(
+            '-n', '--iterations', type=int, default=1000,
+            help='The number of queries to run in each mode'
+        )
+        parser.add_argument(
+            '--database', default='default',
+            help='The database to benchmark'
+        )
+
+    def _run(self, conn, iterations, reconnect):
+        """Run the queries and return the elapsed time and the connections opened."""
+        conn.close()
+        opened = metrics.snapshot()['counters'].get('db.connections.opened', 0)
+        start = time.time()
+        for _ in range(iterations):
+            if reconnect:
+                conn.close()
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+                cursor.fetchone()
+        elapsed = time.time() - start
+        return elapsed, metrics.snapshot()['counters'].get('db.connections.opened', 0) - opened
+
+    def handle(self, *args, **options):
+        """Handle the command"""
+        conn = connections[options['database']]
+        iterations = options['iterations']
+        for label, reconnect in (('connection per query', True), ('persistent connection', False)):
+            elapsed, opened = self._run(conn, iterations, reconnect)
+            self.stdout.write('{:<22} {:>8.1f}us/query {:>6} connections opened'.format(
+                label, elapsed / iterations * 1000000, opened))
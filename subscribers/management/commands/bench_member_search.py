@@ -0,0 +1,55 @@
+# coding=utf-8
+"""Management command timing member searches against a latency target."""
+import random
+import time
+
+from django.core.management import BaseCommand, CommandError
+
+from subscribers.models import Subscriber
+from subscribers.search import search_members
+
+
+class Command(BaseCommand):
+    """Time searches for prefixes and suffixes sampled from the members in the database."""
+
+    help = 'Time name prefix and phone suffix searches and check their p99 latency'
+
+    def add_arguments(self, parser):
+        """Add args"""
+        parser.add_argument(
+            '-n', '--searches', type=int, default=500,
+            help='The number of searches per kind'
+        )
+        parser.add_argument(
+            '--target-ms', type=float, default=50,
+            help='The p99 latency every kind of search must stay under'
+        )
+
+    def handle(self, *args, **options):
+        """Handle the command"""
+        sample = list(Subscriber.objects.order_by('?').values_list('first_name', 'last_name', 'phone_number')[:1000])
+        if not sample:
+            raise CommandError('There are no members to search for.')
+        kinds = (
+            ('last_name prefix', lambda member: {'last_name': member[1][:3]}),
+            ('first_name prefix', lambda member: {'first_name': member[0][:3]}),
+            ('phone suffix', lambda member: {'phone_suffix': member[2][-4:]}),
+            ('last name + phone', lambda member: {'last_name': member[1][:2], 'phone_suffix': member[2][-2:]}),
+        )
+        failures = []
+        for label, terms in kinds:
+            timings = []
+            for _ in range(options['searches']):
+                member = random.choice(sample)
+                start = time.time()
+                _, cursor = search_members(**terms(member))
+                if cursor:
+                    search_members(cursor=cursor, **terms(member))
+                timings.append((time.time() - start) * 1000 / (2 if cursor else 1))
+            timings.sort()
+            p50, p99 = timings[len(timings) // 2], timings[int(len(timings) * 0.99) - 1]
+            self.stdout.write('{:<18} p50 {:>7.2f}ms  p99 {:>7.2f}ms'.format(label, p50, p99))
+            if p99 > options['target_ms']:
+                failures.append('{} p99 is {:.1f}ms'.format(label, p99))
+        if failures:
+            raise CommandError('; '.join(failures))
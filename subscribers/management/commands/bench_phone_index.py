@@ -0,0 +1,64 @@
+# coding=utf-8
+"""Management command comparing the varchar phone number index with the integer phone key."""
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from django.core.management import BaseCommand
+
+from subscribers.phone import normalize_phone
+
+
+class Command(BaseCommand):
+    """Build a scratch SQLite table and measure both unique indexes."""
+
+    help = 'Measure index size and lookup latency of phone_number against phone_key'
+
+    def add_arguments(self, parser):
+        """Add args"""
+        parser.add_argument(
+            '-n', '--rows', type=int, default=200000,
+            help='The number of members in the scratch table'
+        )
+        parser.add_argument(
+            '-l', '--lookups', type=int, default=20000,
+            help='The number of lookups to time per index'
+        )
+
+    def _pages(self, db):
+        return db.execute('PRAGMA page_count').fetchone()[0]
+
+    def handle(self, *args, **options):
+        """Handle the command"""
+        rows = options['rows']
+        phones = ['{:010d}'.format(n) for n in random.sample(range(2000000000, 9999999999), rows)]
+        handle, path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+        try:
+            db = sqlite3.connect(path)
+            page_size = db.execute('PRAGMA page_size').fetchone()[0]
+            db.execute('CREATE TABLE subscriber (id INTEGER PRIMARY KEY, phone_number VARCHAR(15), phone_key BIGINT)')
+            db.executemany('INSERT INTO subscriber (phone_number, phone_key) VALUES (?, ?)',
+                           ((phone, normalize_phone(phone)) for phone in phones))
+            db.commit()
+            sample = random.sample(phones, min(options['lookups'], rows))
+            for column, index_sql, keys in (
+                    ('phone_number', 'CREATE UNIQUE INDEX by_number ON subscriber (phone_number)', sample),
+                    ('phone_key', 'CREATE UNIQUE INDEX by_key ON subscriber (phone_key)',
+                     [normalize_phone(phone) for phone in sample])):
+                before = self._pages(db)
+                db.execute(index_sql)
+                db.commit()
+                index_bytes = (self._pages(db) - before) * page_size
+                query = 'SELECT id FROM subscriber WHERE {} = ?'.format(column)
+                start = time.time()
+                for key in keys:
+                    db.execute(query, (key,)).fetchone()
+                elapsed = time.time() - start
+                self.stdout.write('{:<13} index {:>8.1f} KiB  {:>6.2f}us/lookup'.format(
+                    column, index_bytes / 1024.0, elapsed / len(keys) * 1000000))
+            db.close()
+        finally:
+            os.remove(path)
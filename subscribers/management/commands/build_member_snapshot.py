@@ -0,0 +1,28 @@
+# coding=utf-8
+"""Management command writing the member snapshot of the lookup views."""
+import time
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+from subscribers import snapshot
+
+
+class Command(BaseCommand):
+    """Snapshot every member with its providers, replacing the previous snapshot in one rename."""
+
+    help = 'Write the memory-mapped member snapshot the lookup views answer from'
+
+    def add_arguments(self, parser):
+        """Add args"""
+        parser.add_argument('--path', default=settings.MEMBER_SNAPSHOT_PATH,
+                            help='Snapshot file, MEMBER_SNAPSHOT_PATH by default')
+
+    def handle(self, *args, **options):
+        """Handle the command"""
+        if not options['path']:
+            raise CommandError('Set MEMBER_SNAPSHOT_PATH or pass --path.')
+        start = time.time()
+        count = snapshot.build(options['path'])
+        self.stdout.write('Wrote {} members to {}. Total time was {:.1f}s'.format(
+            count, options['path'], time.time() - start))
@@ -0,0 +1,78 @@
+# coding=utf-8
+"""Management command enforcing an import time budget for the web and Celery worker boot."""
+import re
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+STARTUP_TARGETS = {
+    'wsgi': 'import members.wsgi',
+    'celery': 'from members.celery import app; app.loader.import_default_modules()',
+}
+
+# Modules that must never be imported while booting, e.g. the git based version lookup.
+FORBIDDEN_MODULES = ('members._version',)
+
+IMPORT_TIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)')
+
+
+def measure_imports(code):
+    """Run code in a fresh interpreter under -X importtime.
+
+    Returns the total import time in ms and (cumulative ms, module) for the imports of the first two levels.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=settings.BASE_DIR,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if result.returncode:
+        raise CommandError('Startup failed:\n{}'.format(result.stderr[-2000:]))
+    total_us, modules, slowest = 0, set(), []
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, module = match.groups()
+        total_us += int(self_us)
+        modules.add(module)
+        if len(indent) <= 3:
+            slowest.append((int(cumulative_us) / 1000.0, module))
+    return total_us / 1000.0, modules, slowest
+
+
+class Command(BaseCommand):
+    """Fail when booting a web or Celery worker imports too much."""
+
+    help = 'Check the import time of the web and Celery worker startup against a budget'
+
+    def add_arguments(self, parser):
+        """Add args"""
+        parser.add_argument(
+            '--wsgi-budget-ms', type=float, default=1500,
+            help='The import time budget for members.wsgi'
+        )
+        parser.add_argument(
+            '--celery-budget-ms', type=float, default=2500,
+            help='The import time budget for the Celery worker boot'
+        )
+        parser.add_argument(
+            '--top', type=int, default=10,
+            help='The number of slowest imports to show'
+        )
+
+    def handle(self, *args, **options):
+        """Handle the command"""
+        failures = []
+        for target, code in sorted(STARTUP_TARGETS.items()):
+            budget = options['{}_budget_ms'.format(target)]
+            total, modules, slowest = measure_imports(code)
+            self.stdout.write('{}: {:.0f}ms of {:.0f}ms budget'.format(target, total, budget))
+            for cumulative, module in sorted(slowest, reverse=True)[:options['top']]:
+                self.stdout.write('  {:>8.1f}ms {}'.format(cumulative, module))
+            if total > budget:
+                failures.append('{} took {:.0f}ms, the budget is {:.0f}ms'.format(target, total, budget))
+            for module in FORBIDDEN_MODULES:
+                if module in modules:
+                    failures.append('{} imports {}'.format(target, module))
+        if failures:
+            raise CommandError('; '.join(failures))
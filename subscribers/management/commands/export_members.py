@@ -0,0 +1,45 @@
+# coding=utf-8
+"""Management command for exporting members with their providers."""
+import sys
+import time
+
+from django.core.management import BaseCommand
+
+from subscribers.export import export_members, FORMATS, CSV_FORMAT, DEFAULT_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    """Management command streaming members to a file in the import CSV format or as NDJSON."""
+
+    help = 'Export members and their providers as CSV (the import format) or NDJSON'
+
+    def add_arguments(self, parser):
+        """Add args"""
+        parser.add_argument(
+            '-f', '--format', choices=FORMATS, default=CSV_FORMAT,
+            help='The output format'
+        )
+        parser.add_argument(
+            '-a', '--account', dest='account_id',
+            help='Only export the members of this account'
+        )
+        parser.add_argument(
+            '-o', '--output',
+            help='The file to write to, standard output by default'
+        )
+        parser.add_argument(
+            '-c', '--chunk_size', type=int, default=DEFAULT_CHUNK_SIZE,
+            help='The number of members to read from the database at a time'
+        )
+
+    def handle(self, *args, **options):
+        """Handle the command"""
+        start = time.time()
+        output = open(options['output'], 'w', newline='') if options['output'] else sys.stdout
+        try:
+            for text in export_members(options['format'], options['account_id'], options['chunk_size']):
+                output.write(text)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+                self.stderr.write('Exported to {} in {:.1f}s'.format(options['output'], time.time() - start))
@@ -0,0 +1,56 @@
+# coding=utf-8
+"""Management command gathering the spans of a trace from the web and Celery processes."""
+import json
+import os
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+from members import tracing
+
+
+class Command(BaseCommand):
+    """Write one trace, from every process's trace file, as a Chrome trace file."""
+
+    help = 'Export a trace for chrome://tracing, Perfetto or speedscope, or list the traces recorded'
+
+    def add_arguments(self, parser):
+        """Add args"""
+        parser.add_argument('trace_id', nargs='?', help='The trace to export, the latest by default')
+        parser.add_argument(
+            '-o', '--output',
+            help='The file to write, trace-<trace id>.json by default'
+        )
+        parser.add_argument(
+            '--list', action='store_true',
+            help='List the traces recorded instead'
+        )
+        parser.add_argument(
+            '--dir', default=settings.TRACE_DIR,
+            help='Where the processes write their spans, TRACE_DIR by default'
+        )
+
+    def handle(self, *args, **options):
+        """Handle the command"""
+        if not os.path.isdir(options['dir']):
+            raise CommandError('No traces found in {}, set TRACE_SAMPLE_RATE to record some.'.format(options['dir']))
+        traces = defaultdict(list)
+        for event in tracing.read_events(options['dir']):
+            traces[event['args']['trace_id']].append(event)
+        if not traces:
+            raise CommandError('No traces found in {}.'.format(options['dir']))
+        if options['list']:
+            for trace_id, events in sorted(traces.items(), key=lambda item: min(e['ts'] for e in item[1])):
+                root = min(events, key=lambda event: event['ts'])
+                end = max(event['ts'] + event['dur'] for event in events)
+                self.stdout.write('{} {:>10.1f}ms {:>6} spans {:>3} processes  {}'.format(
+                    trace_id, (end - root['ts']) / 1000, len(events), len({e['pid'] for e in events}), root['name']))
+            return
+        trace_id = options['trace_id'] or max(traces, key=lambda key: max(e['ts'] for e in traces[key]))
+        if trace_id not in traces:
+            raise CommandError('No trace {}.'.format(trace_id))
+        output = options['output'] or 'trace-{}.json'.format(trace_id)
+        with open(output, 'w') as out:
+            json.dump({'traceEvents': sorted(traces[trace_id], key=lambda event: event['ts'])}, out)
+        self.stdout.write('Wrote {} spans of trace {} to {}'.format(len(traces[trace_id]), trace_id, output))
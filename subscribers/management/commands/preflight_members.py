@@ -0,0 +1,35 @@
+# coding=utf-8
+"""Management command for validating a member CSV without importing it."""
+import csv
+import json
+
+from django.core.management import BaseCommand
+
+from subscribers.preflight import Preflight
+
+
+class Command(BaseCommand):
+    """Management command running the pre-flight checks of the importer over a file."""
+
+    help = 'Validate a member CSV and report rejected rows without touching the database'
+
+    def add_arguments(self, parser):
+        """Add args"""
+        parser.add_argument('path', help='The member CSV to check')
+        parser.add_argument(
+            '-r', '--rejects',
+            help='Write the rejected rows, with their reason as a sixth column, to this file'
+        )
+
+    def handle(self, *args, **options):
+        """Handle the command"""
+        rejects = open(options['rejects'], 'w', newline='') if options['rejects'] else None
+        try:
+            with open(options['path'], newline='', encoding='utf-8') as members:
+                preflight = Preflight(rejects)
+                for _ in preflight.check(csv.reader(members, delimiter=',', quotechar='|')):
+                    pass
+        finally:
+            if rejects is not None:
+                rejects.close()
+        self.stdout.write(json.dumps(preflight.report, indent=2))
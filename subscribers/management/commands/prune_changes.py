@@ -0,0 +1,40 @@
+# coding=utf-8
+"""Management command for deleting old change feed entries."""
+import time
+
+from datetime import timedelta
+
+from django.core.management import BaseCommand
+from django.utils import timezone
+
+from subscribers.models import Change
+
+
+class Command(BaseCommand):
+    """Delete change feed entries older than every consumer needs."""
+
+    help = 'Delete change feed entries older than the given number of days'
+
+    def add_arguments(self, parser):
+        """Add args"""
+        parser.add_argument(
+            '-d', '--days', type=int, default=30,
+            help='Keep the changes of this many days'
+        )
+        parser.add_argument(
+            '-c', '--chunk_size', type=int, default=10000,
+            help='The number of changes to delete per statement'
+        )
+
+    def handle(self, *args, **options):
+        """Handle the command"""
+        start = time.time()
+        threshold = timezone.now() - timedelta(days=options['days'])
+        deleted = 0
+        while True:
+            seqs = list(Change.objects.filter(changed_at__lt=threshold).order_by('seq')
+                        .values_list('seq', flat=True)[:options['chunk_size']])
+            if not seqs:
+                break
+            deleted += Change.objects.filter(seq__in=seqs).delete()[0]
+        self.stdout.write('Deleted {} changes. Total time was {:.1f}s'.format(deleted, time.time() - start))
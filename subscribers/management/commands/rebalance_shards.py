@@ -0,0 +1,116 @@
+# coding=utf-8
+"""Management command for moving members to the shard their phone number hashes to."""
+import logging
+import time
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+
+from subscribers import sharding
+from subscribers.models import Subscriber, Provider, MemberLocation
+
+log = logging.getLogger('.'.join((settings.LOG_NAME.split('.')[0], __name__,)))
+
+
+class ShardRebalancer(object):
+    """Moves subscribers, with their providers, that live on the wrong shard."""
+
+    def __init__(self, chunk_size=None, dry_run=False):
+        """Initialize the ShardRebalancer"""
+        self.chunk_size = chunk_size or 1000
+        self.dry_run = dry_run
+        self.moved = 0
+        self.checked = 0
+        self.skipped = 0
+
+    def _move(self, sub, source, target, location):
+        """Copy a subscriber and its providers to the target shard and delete the original.
+
+        The copy gets the id of the member's location, which is unique over every shard.
+        """
+        account_keys = list(Provider.objects.using(source).filter(subscriber=sub)
+                            .values_list('account_key', flat=True))
+        with transaction.atomic(using=target):
+            if source == target:
+                sub.delete()
+            copy = Subscriber.objects.using(target).create(
+                id=location.id, first_name=sub.first_name, last_name=sub.last_name,
+                phone_number=sub.phone_number, client_member_id=sub.client_member_id)
+            for account_key in account_keys:
+                Provider.objects.using(target).create(subscriber=copy, account_key=account_key)
+        if location.shard != target:
+            location.shard = target
+            location.save(update_fields=['shard'])
+        if source != target:
+            with transaction.atomic(using=source):
+                sub.delete()
+
+    def rebalance(self, source):
+        """Check every subscriber on the source database, one chunk at a time.
+
+        Members without a location, or with an id other than their location's (stored before ids
+        came from the directory), are copied with the id of their location even when they stay on
+        the same shard. A copy whose id is still held by another such member is skipped, the next
+        run moves it once that member got its own id.
+        """
+        last_id = 0
+        while True:
+            chunk = list(Subscriber.objects.using(source).filter(id__gt=last_id).order_by('id')[:self.chunk_size])
+            if not chunk:
+                break
+            last_id = chunk[-1].id
+            for sub in chunk:
+                self.checked += 1
+                target = sharding.shard_for_phone(sub.phone_number)
+                location = MemberLocation.objects.filter(client_member_id=sub.client_member_id).first()
+                if target == source and location is not None and location.id == sub.id:
+                    if location.shard != target and not self.dry_run:
+                        location.shard = target
+                        location.save(update_fields=['shard'])
+                    continue
+                self.moved += 1
+                if self.dry_run:
+                    continue
+                if location is None:
+                    location = MemberLocation.objects.create(client_member_id=sub.client_member_id, shard=source)
+                try:
+                    self._move(sub, source, target, location)
+                except IntegrityError:
+                    self.moved -= 1
+                    self.skipped += 1
+                    log.warning("Id {} is taken on {}, run rebalance_shards again to move {}".format(
+                        location.id, target, sub.client_member_id))
+
+
+class Command(BaseCommand):
+    """Management command for rebalancing subscribers over SUBSCRIBER_SHARDS."""
+
+    help = 'Move subscribers and their providers to the shard their phone number hashes to'
+
+    def add_arguments(self, parser):
+        """Add args"""
+        parser.add_argument(
+            '-c', '--chunk_size', type=int,
+            help='The number of subscribers to read from a database at a time'
+        )
+        parser.add_argument(
+            '-s', '--source', action='append', default=[],
+            help='An extra database to drain into the shards, e.g. default when first enabling sharding'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only count the subscribers that would move'
+        )
+
+    def handle(self, *args, **options):
+        """Handle the command"""
+        if not sharding.is_enabled():
+            raise CommandError('SUBSCRIBER_SHARDS is not configured.')
+        rebalancer = ShardRebalancer(options['chunk_size'], options['dry_run'])
+        start = time.time()
+        for source in options['source'] + list(settings.SUBSCRIBER_SHARDS):
+            rebalancer.rebalance(source)
+        self.stdout.write('Checked {} subscribers, {} {}, {} skipped. Total time was {:.1f}s'.format(
+            rebalancer.checked, rebalancer.moved, 'to move' if rebalancer.dry_run else 'moved',
+            rebalancer.skipped, time.time() - start))
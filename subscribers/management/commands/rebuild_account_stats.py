@@ -0,0 +1,33 @@
+# coding=utf-8
+"""Management command recounting the members of every account."""
+import time
+from collections import Counter
+
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from subscribers import sharding
+from subscribers.models import AccountStats
+from subscribers.stats import provider_counts
+
+
+class Command(BaseCommand):
+    """Replace the account stats with counts of the providers on every shard."""
+
+    help = 'Recount the members of every account from the providers, run it while imports are stopped'
+
+    def handle(self, *args, **options):
+        """Handle the command"""
+        start = time.time()
+        counts = Counter()
+        for db in sharding.subscriber_dbs():
+            counts.update(provider_counts(db))
+        now = timezone.now()
+        with transaction.atomic():
+            AccountStats.objects.all().delete()
+            AccountStats.objects.bulk_create(
+                (AccountStats(account_id=account_id, member_count=count, last_changed_at=now)
+                 for account_id, count in counts.items()), batch_size=1000)
+        self.stdout.write('Counted {} accounts with {} members. Total time was {:.1f}s'.format(
+            len(counts), sum(counts.values()), time.time() - start))
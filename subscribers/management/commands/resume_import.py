@@ -0,0 +1,42 @@
+# coding=utf-8
+"""Management command resuming import jobs from their last committed chunk."""
+from datetime import timedelta
+
+from django.core.management import BaseCommand
+from django.utils import timezone
+
+from subscribers.models import ImportJob
+from subscribers.tasks import run_import_job
+
+
+class Command(BaseCommand):
+    """Queue or run unfinished import jobs again, each carries on from its checkpoint."""
+
+    help = 'Resume the given import jobs, or every unfinished job that stopped making progress'
+
+    def add_arguments(self, parser):
+        """Add args"""
+        parser.add_argument('job_ids', nargs='*', type=int, help='The import jobs to resume')
+        parser.add_argument(
+            '--stale', type=int, default=600,
+            help='Without job ids, resume the unfinished jobs not updated for this many seconds'
+        )
+        parser.add_argument(
+            '--inline', action='store_true',
+            help='Run the jobs in this process instead of queueing them'
+        )
+
+    def handle(self, *args, **options):
+        """Handle the command"""
+        jobs = ImportJob.objects.exclude(status=ImportJob.DONE)
+        if options['job_ids']:
+            jobs = jobs.filter(id__in=options['job_ids'])
+        else:
+            jobs = jobs.filter(updated_at__lt=timezone.now() - timedelta(seconds=options['stale']))
+        for job in jobs.order_by('id'):
+            self.stdout.write('Resuming import job {} at chunk {} of {}'.format(
+                job.id, job.next_chunk + 1, job.total_chunks))
+            if options['inline']:
+                run_import_job(job.id)
+            else:
+                run_import_job.delay(job.id)
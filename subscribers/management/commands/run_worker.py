@@ -0,0 +1,42 @@
+# coding=utf-8
+"""Management command starting a Celery worker for one queue."""
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from members.celery import app
+
+
+class Command(BaseCommand):
+    """Start a worker consuming one queue with that queue's concurrency and prefetch."""
+
+    help = 'Start a Celery worker for the interactive or the bulk queue, see WORKER_QUEUE_OPTIONS'
+
+    def add_arguments(self, parser):
+        """Add args"""
+        parser.add_argument('queue', choices=sorted(settings.WORKER_QUEUE_OPTIONS), help='The queue to consume')
+        parser.add_argument(
+            '-c', '--concurrency', type=int,
+            help='The number of worker processes, instead of the queue\'s setting'
+        )
+        parser.add_argument(
+            '-l', '--loglevel', default='INFO',
+            help='The worker log level'
+        )
+
+    def handle(self, *args, **options):
+        """Handle the command"""
+        queue_options = settings.WORKER_QUEUE_OPTIONS[options['queue']]
+        # Also drain the queues tasks went to before, until their messages are gone.
+        queues = [options['queue']] + list(queue_options.get('legacy_queues', []))
+        argv = [
+            'worker',
+            '--queues', ','.join(queues),
+            '--hostname', '{}@%h'.format(options['queue']),
+            '--concurrency', str(options['concurrency'] or queue_options['concurrency']),
+            '--prefetch-multiplier', str(queue_options['prefetch_multiplier']),
+            '--loglevel', options['loglevel'],
+        ]
+        if queue_options.get('max_memory_per_child'):
+            # Replace a process over its memory budget (in KB) after its current task.
+            argv += ['--max-memory-per-child', str(queue_options['max_memory_per_child'])]
+        app.worker_main(argv)
@@ -0,0 +1,64 @@
+# coding=utf-8
+"""Management command reporting the most expensive statements of the web and Celery processes."""
+import json
+import os
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+from subscribers import querylog
+
+
+class Command(BaseCommand):
+    """Merge the statement statistics the processes wrote to QUERY_LOG_DIR and print the top ones."""
+
+    help = 'Report the statements with the most total time, with the plans of the slow ones'
+
+    def add_arguments(self, parser):
+        """Add args"""
+        parser.add_argument(
+            '-n', '--limit', type=int, default=20,
+            help='The number of statements to report'
+        )
+        parser.add_argument(
+            '--order', choices=('total_ms', 'count', 'max_ms', 'slow_count'), default='total_ms',
+            help='What to rank the statements by'
+        )
+        parser.add_argument(
+            '--dir', default=settings.QUERY_LOG_DIR,
+            help='Where the processes write their statistics, QUERY_LOG_DIR by default'
+        )
+        parser.add_argument(
+            '--json', action='store_true',
+            help='Print the report as JSON'
+        )
+        parser.add_argument(
+            '--clear', action='store_true',
+            help='Delete the statistics after reporting them'
+        )
+
+    def handle(self, *args, **options):
+        """Handle the command"""
+        if not options['dir'] or not os.path.isdir(options['dir']):
+            raise CommandError('No statistics found, set QUERY_LOG_DIR or pass --dir.')
+        reports = querylog.read_reports(options['dir'])
+        stats = querylog.top(options['limit'], options['order'], querylog.merge(reports))
+        if options['json']:
+            self.stdout.write(json.dumps(stats, indent=2))
+        else:
+            self.stdout.write('{} statements from {} processes, slow above {}ms'.format(
+                len(stats), len(reports), settings.SLOW_QUERY_MS))
+            for entry in stats:
+                self.stdout.write('\n{count:>8} calls {total_ms:>10.1f}ms total {mean_ms:>8.2f}ms mean '
+                                  '{max_ms:>8.1f}ms max {slow_count:>6} slow  [{database}]'.format(**entry))
+                self.stdout.write('  ' + entry['fingerprint'])
+                self.stdout.write('  from ' + ', '.join(
+                    '{} ({})'.format(origin, count) for origin, count in entry['origins'].most_common()))
+                for line in entry['plan'] or []:
+                    self.stdout.write('  plan: ' + line)
+                for line in entry['full_scans'] or []:
+                    self.stdout.write('  FULL SCAN: ' + line)
+        if options['clear']:
+            for name in os.listdir(options['dir']):
+                if name.endswith('.json'):
+                    os.remove(os.path.join(options['dir'], name))
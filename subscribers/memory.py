@@ -0,0 +1,75 @@
+# coding=utf-8
+"""Memory use of import workers, per chunk.
+
+The resident set size comes from /proc where there is one, the peak from getrusage. With
+``IMPORT_TRACEMALLOC`` the Python allocations of each chunk are traced as well: their peak and the
+lines that allocated the most. Tracing slows an import down noticeably, so it is off by default.
+"""
+import os
+import resource
+import sys
+import tracemalloc
+
+from django.conf import settings
+
+TOP_ALLOCATIONS = 5
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def rss_mb():
+    """Return the resident set size of this process in MB."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * _PAGE_SIZE / 1048576
+    except (OSError, ValueError, IndexError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    """Return the largest resident set size this process reached, in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1048576 if sys.platform == 'darwin' else peak / 1024
+
+
+class ChunkMemory(object):
+    """Measures the memory of an import task chunk by chunk."""
+
+    def __init__(self):
+        self.tracing = settings.IMPORT_TRACEMALLOC and not tracemalloc.is_tracing()
+        if self.tracing:
+            tracemalloc.start()
+
+    def start_chunk(self):
+        # Before Python 3.9 the traced peak can't be reset, it covers the task up to this chunk.
+        if self.tracing and hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+
+    def measure(self, index, rows):
+        """Return what the chunk just applied used."""
+        entry = {'chunk': index, 'rows': rows, 'rss_mb': round(rss_mb(), 1), 'peak_rss_mb': round(peak_rss_mb(), 1)}
+        if self.tracing:
+            entry['traced_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 1048576, 1)
+            entry['top_allocations'] = [
+                '{} {:.1f}KB in {} blocks'.format(stat.traceback[0], stat.size / 1024, stat.count)
+                for stat in tracemalloc.take_snapshot().statistics('lineno')[:TOP_ALLOCATIONS]]
+        return entry
+
+    def over_budget(self):
+        """Return True when the process is above IMPORT_MEMORY_BUDGET_MB."""
+        return bool(settings.IMPORT_MEMORY_BUDGET_MB) and rss_mb() > settings.IMPORT_MEMORY_BUDGET_MB
+
+    def stop(self):
+        if self.tracing:
+            tracemalloc.stop()
+            self.tracing = False
+
+
+def smaller_chunk_size(chunk_size):
+    """Return the largest divisor of chunk_size at most half of it, None below IMPORT_MIN_CHUNK_SIZE.
+
+    A divisor keeps the rows already applied a whole number of chunks, so the checkpoint carries over.
+    """
+    for size in range(chunk_size // 2, settings.IMPORT_MIN_CHUNK_SIZE - 1, -1):
+        if chunk_size % size == 0:
+            return size
+    return None
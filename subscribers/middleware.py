@@ -0,0 +1,81 @@
+# coding=utf-8
+"""Middleware for the subscribers app."""
+import math
+
+from django.conf import settings
+from django.db import connections
+from django.http import JsonResponse
+
+from members import metrics
+from subscribers import routers, throttle
+
+PIN_COOKIE = 'pin_primary'
+
+
+class PrimaryPinningMiddleware(object):
+    """Scope the primary pin of ``PrimaryReplicaRouter`` to a request.
+
+    A request that writes leaves a short-lived cookie behind so the client's next requests
+    keep reading from the primary until the replicas have caught up.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.COOKIES.get(PIN_COOKIE):
+            routers.pin_to_primary()
+        else:
+            routers.unpin()
+        try:
+            response = self.get_response(request)
+            if routers.is_pinned() and request.method not in ('GET', 'HEAD', 'OPTIONS'):
+                response.set_cookie(PIN_COOKIE, '1', max_age=settings.REPLICATION_LAG_SECONDS, httponly=True)
+            return response
+        finally:
+            routers.unpin()
+
+
+class LoadProtectionMiddleware(object):
+    """Rate limit API clients and shed API load before it reaches the database.
+
+    Throttled requests get a 429 and shed ones a 503, both with Retry-After. Endpoints named in
+    ``THROTTLE_EXEMPT`` (the metrics endpoint) are always served.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not request.path_info.startswith('/api/'):
+            return self.get_response(request)
+        throttle.load.enter()
+        # Not connection.execute_wrapper(), which pops the last wrapper: connections opened during
+        # the request append wrappers of their own after this one.
+        wrapped = [connections[alias] for alias in settings.DATABASES]
+        for connection in wrapped:
+            connection.execute_wrappers.append(throttle.time_query)
+        try:
+            return self.get_response(request)
+        finally:
+            for connection in wrapped:
+                connection.execute_wrappers.remove(throttle.time_query)
+            throttle.load.leave()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        endpoint = request.resolver_match.url_name
+        if not request.path_info.startswith('/api/') or endpoint in settings.THROTTLE_EXEMPT:
+            return None
+        reason = throttle.load.shed_reason()
+        if reason is not None:
+            metrics.incr('throttle.shed')
+            metrics.incr('throttle.shed.{}'.format(reason))
+            response = JsonResponse({}, status=503)
+            response['Retry-After'] = '1'
+            return response
+        wait = throttle.throttle(request, endpoint)
+        if wait:
+            response = JsonResponse({}, status=429)
+            response['Retry-After'] = str(int(math.ceil(wait)))
+            return response
+        return None
@@ -0,0 +1,21 @@
+# Generated by Django 2.1.15 on 2026-10-19 08:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscribers', '0006_auto_20220517_2359'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MemberLocation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('client_member_id', models.CharField(max_length=20, unique=True)),
+                ('shard', models.CharField(max_length=32)),
+            ],
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 2.1.15 on 2026-10-19 08:23
+
+from django.db import migrations, models, transaction
+
+from subscribers.phone import normalize_phone
+
+BACKFILL_CHUNK_SIZE = 10000
+CLASHES_SHOWN = 100
+
+
+def _phone_numbers(Subscriber, db_alias):
+    """Yield (id, phone number) of every subscriber, one chunk at a time."""
+    last_id = 0
+    while True:
+        chunk = list(Subscriber.objects.using(db_alias).filter(id__gt=last_id)
+                     .order_by('id').values_list('id', 'phone_number')[:BACKFILL_CHUNK_SIZE])
+        if not chunk:
+            break
+        last_id = chunk[-1][0]
+        yield chunk
+
+
+def check_phone_clashes(apps, schema_editor):
+    """Stop before any change if two members share a phone number once normalized.
+
+    phone_key is unique and recomputed on every save, so a clashing member left without one could
+    never be saved again. Those members have to be merged or corrected first.
+    """
+    Subscriber = apps.get_model('subscribers', 'Subscriber')
+    seen, clashes = {}, []
+    for chunk in _phone_numbers(Subscriber, schema_editor.connection.alias):
+        for sub_id, phone_number in chunk:
+            phone_key = normalize_phone(phone_number)
+            if phone_key is None:
+                continue
+            if phone_key in seen:
+                clashes.append((sub_id, phone_number, seen[phone_key]))
+            else:
+                seen[phone_key] = sub_id
+    if clashes:
+        raise RuntimeError(
+            "{} subscribers have the phone number of another subscriber once normalized, correct or "
+            "merge them and migrate again:\n{}".format(len(clashes), "\n".join(
+                "subscriber {} ({}) clashes with subscriber {}".format(*clash)
+                for clash in clashes[:CLASHES_SHOWN])))
+
+
+def backfill_phone_keys(apps, schema_editor):
+    """Fill phone_key one committed chunk at a time."""
+    Subscriber = apps.get_model('subscribers', 'Subscriber')
+    db_alias = schema_editor.connection.alias
+    for chunk in _phone_numbers(Subscriber, db_alias):
+        with transaction.atomic(using=db_alias):
+            for sub_id, phone_number in chunk:
+                phone_key = normalize_phone(phone_number)
+                if phone_key is not None:
+                    Subscriber.objects.using(db_alias).filter(id=sub_id).update(phone_key=phone_key)
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('subscribers', '0007_member_location'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_phone_clashes, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='subscriber',
+            name='phone_key',
+            field=models.BigIntegerField(editable=False, null=True, unique=True),
+        ),
+        migrations.RunPython(backfill_phone_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 2.1.15 on 2026-10-19 08:31
+
+from django.db import migrations, models, transaction
+
+from subscribers.phone import reversed_digits
+
+BACKFILL_CHUNK_SIZE = 10000
+
+
+def backfill_search_keys(apps, schema_editor):
+    """Fill the search keys one committed chunk at a time."""
+    Subscriber = apps.get_model('subscribers', 'Subscriber')
+    db_alias = schema_editor.connection.alias
+    last_id = 0
+    while True:
+        chunk = list(Subscriber.objects.using(db_alias).filter(id__gt=last_id).order_by('id')
+                     .values_list('id', 'first_name', 'last_name', 'phone_number')[:BACKFILL_CHUNK_SIZE])
+        if not chunk:
+            break
+        last_id = chunk[-1][0]
+        with transaction.atomic(using=db_alias):
+            for sub_id, first_name, last_name, phone_number in chunk:
+                Subscriber.objects.using(db_alias).filter(id=sub_id).update(
+                    first_name_key=first_name.lower(), last_name_key=last_name.lower(),
+                    phone_reversed=reversed_digits(phone_number))
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('subscribers', '0008_subscriber_phone_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscriber',
+            name='first_name_key',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='subscriber',
+            name='last_name_key',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='subscriber',
+            name='phone_reversed',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=15),
+        ),
+        migrations.RunPython(backfill_search_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.1.15 on 2026-10-19 08:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscribers', '0010_change_feed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscriber',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=40),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 2.1.15 on 2026-10-19 08:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscribers', '0011_subscriber_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mode', models.CharField(choices=[('create', 'Create'), ('sync', 'Sync')], default='create', max_length=6)),
+                ('account_id', models.CharField(blank=True, default='', max_length=20)),
+                ('rows_file', models.CharField(blank=True, default='', max_length=255)),
+                ('total_rows', models.IntegerField(default=0)),
+                ('chunk_size', models.IntegerField()),
+                ('next_chunk', models.IntegerField(default=0)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], db_index=True, default='pending', max_length=7)),
+                ('report', models.TextField(blank=True, default='{}')),
+                ('error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.1.15 on 2026-10-19 08:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscribers', '0012_import_job'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='provider',
+            name='account_id',
+            field=models.CharField(db_index=True, max_length=20),
+        ),
+    ]
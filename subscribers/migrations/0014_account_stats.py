@@ -0,0 +1,40 @@
+# Generated by Django 2.1.15 on 2026-10-19 08:42
+
+from django.db import migrations, models, DEFAULT_DB_ALIAS
+from django.db.models import Count, F
+from django.utils import timezone
+
+
+def count_members(apps, schema_editor):
+    """Add the providers of the database being migrated to the account stats on the default database."""
+    Provider = apps.get_model('subscribers', 'Provider')
+    AccountStats = apps.get_model('subscribers', 'AccountStats')
+    db_alias = schema_editor.connection.alias
+    now = timezone.now()
+    counts = (Provider.objects.using(db_alias).values_list('account_id')
+              .annotate(count=Count('id')).order_by().values_list('account_id', 'count'))
+    for account_id, count in counts.iterator():
+        updated = AccountStats.objects.using(DEFAULT_DB_ALIAS).filter(account_id=account_id).update(
+            member_count=F('member_count') + count, last_changed_at=now)
+        if not updated:
+            AccountStats.objects.using(DEFAULT_DB_ALIAS).create(
+                account_id=account_id, member_count=count, last_changed_at=now)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscribers', '0013_provider_account_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountStats',
+            fields=[
+                ('account_id', models.CharField(max_length=20, primary_key=True, serialize=False)),
+                ('member_count', models.BigIntegerField(default=0)),
+                ('last_changed_at', models.DateTimeField(null=True)),
+            ],
+        ),
+        migrations.RunPython(count_members, migrations.RunPython.noop),
+    ]
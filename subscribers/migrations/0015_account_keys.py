@@ -0,0 +1,68 @@
+# Generated by Django 2.1.15 on 2026-10-19 08:50
+
+from django.db import migrations, models, transaction, DEFAULT_DB_ALIAS
+
+BACKFILL_CHUNK_SIZE = 10000
+
+
+def fill_account_keys(apps, schema_editor):
+    """Point the providers of the database being migrated at their Account, one committed chunk at a time."""
+    Provider = apps.get_model('subscribers', 'Provider')
+    Account = apps.get_model('subscribers', 'Account')
+    db_alias = schema_editor.connection.alias
+    keys = {}
+    last_id = 0
+    while True:
+        chunk = list(Provider.objects.using(db_alias).filter(id__gt=last_id)
+                     .order_by('id').values_list('id', 'account_id')[:BACKFILL_CHUNK_SIZE])
+        if not chunk:
+            break
+        first_id, last_id = last_id, chunk[-1][0]
+        for account_id in {account_id for _, account_id in chunk} - set(keys):
+            keys[account_id] = Account.objects.using(DEFAULT_DB_ALIAS).get_or_create(account_id=account_id)[0].id
+        with transaction.atomic(using=db_alias):
+            for account_id in {account_id for _, account_id in chunk}:
+                Provider.objects.using(db_alias).filter(
+                    id__gt=first_id, id__lte=last_id, account_id=account_id).update(account_key=keys[account_id])
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('subscribers', '0014_account_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Account',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('account_id', models.CharField(max_length=20, unique=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='provider',
+            name='account_key',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.RunPython(fill_account_keys, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='provider',
+            unique_together=set(),
+        ),
+        migrations.RemoveField(
+            model_name='provider',
+            name='account_id',
+        ),
+        migrations.AlterField(
+            model_name='provider',
+            name='account_key',
+            field=models.IntegerField(db_index=True),
+        ),
+        migrations.AlterUniqueTogether(
+            name='provider',
+            unique_together={('subscriber', 'account_key')},
+        ),
+    ]
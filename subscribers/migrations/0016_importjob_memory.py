@@ -0,0 +1,18 @@
+# Generated by Django 2.1.15 on 2026-10-19 09:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscribers', '0015_account_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='memory',
+            field=models.TextField(blank=True, default='[]'),
+        ),
+    ]
@@ -1,13 +1,74 @@
-from django.db import models
+from functools import partial
+
+from django.db import models, router, IntegrityError, transaction, DEFAULT_DB_ALIAS
+
+from subscribers import sharding
+from subscribers.phone import normalize_phone, reversed_digits
 
 
 class SubscriberManager(models.Manager):
     def create_subscriber(self, first_name, last_name, phone_number, client_member_id):
-        sub = self.create(first_name=first_name, last_name=last_name,
-                          phone_number=phone_number, client_member_id=client_member_id)
+        if not sharding.is_enabled():
+            return self.create(first_name=first_name, last_name=last_name,
+                               phone_number=phone_number, client_member_id=client_member_id)
+
+        # client_member_id is only unique within a shard, the directory keeps it unique overall.
+        # Its sequence on the default database also gives the member an id unique over the shards.
+        shard = sharding.shard_for_phone(phone_number)
+        location = MemberLocation.objects.create(client_member_id=client_member_id, shard=shard)
+        try:
+            with transaction.atomic(using=shard):
+                sub = self.db_manager(shard).create(id=location.id, first_name=first_name,
+                                                    last_name=last_name, phone_number=phone_number,
+                                                    client_member_id=client_member_id)
+        except IntegrityError:
+            location.delete()
+            raise
 
         return sub
 
+    def on_shard(self, phone_number):
+        """Return a queryset on the database holding the member with this phone number."""
+        return self.db_manager(sharding.shard_for_phone(phone_number)).get_queryset()
+
+    def get_by_phone_number(self, phone_number):
+        """Get a subscriber by phone number in any formatting, through the integer phone key."""
+        phone_key = normalize_phone(phone_number)
+        queryset = self.on_shard(phone_number)
+        if phone_key is None:
+            return queryset.get(phone_number=phone_number)
+        return queryset.get(phone_key=phone_key)
+
+    def find_member(self, phone_number, client_member_id):
+        """Return the subscriber with both this phone number and client member id, or None."""
+        phone_key = normalize_phone(phone_number)
+        queryset = self.on_shard(phone_number).filter(client_member_id=client_member_id)
+        if phone_key is None:
+            queryset = queryset.filter(phone_number=phone_number)
+        else:
+            queryset = queryset.filter(phone_key=phone_key)
+        return queryset.first()
+
+    def get_by_client_member_id(self, client_member_id):
+        """Get a subscriber by client member id, looking its shard up in the directory."""
+        if not sharding.is_enabled():
+            return self.get(client_member_id=client_member_id)
+        try:
+            shard = MemberLocation.objects.get(client_member_id=client_member_id).shard
+        except MemberLocation.DoesNotExist:
+            raise self.model.DoesNotExist()
+        return self.db_manager(shard).get(client_member_id=client_member_id)
+
+    def get_by_id(self, id):
+        """Get a subscriber by id, looking its shard up in the directory."""
+        if not sharding.is_enabled():
+            return self.get(id=id)
+        try:
+            shard = MemberLocation.objects.get(id=id).shard
+        except MemberLocation.DoesNotExist:
+            raise self.model.DoesNotExist()
+        return self.db_manager(shard).get(id=id)
+
 
 # Create your models here.
 class Subscriber(models.Model):
@@ -15,29 +76,226 @@ class Subscriber(models.Model):
     last_name = models.CharField(max_length=50)
     phone_number = models.CharField(max_length=15, unique=True)
     client_member_id = models.CharField(max_length=20, unique=True)
+    # E.164 digits of phone_number, what lookups match on (see subscribers/phone.py).
+    phone_key = models.BigIntegerField(unique=True, null=True, editable=False)
+    # Indexed search keys: lower cased names for prefix search, reversed digits for suffix search.
+    first_name_key = models.CharField(max_length=50, db_index=True, editable=False, default='')
+    last_name_key = models.CharField(max_length=50, db_index=True, editable=False, default='')
+    phone_reversed = models.CharField(max_length=15, db_index=True, editable=False, default='')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # Hash of the names and account ids as of the last sync import, empty once either changes.
+    content_hash = models.CharField(max_length=40, blank=True, default='', editable=False)
 
     objects = SubscriberManager()
 
+    def save(self, *args, **kwargs):
+        self.content_hash = ''
+        self.phone_key = normalize_phone(self.phone_number)
+        self.first_name_key = self.first_name.lower()
+        self.last_name_key = self.last_name.lower()
+        self.phone_reversed = reversed_digits(self.phone_number)
+        super(Subscriber, self).save(*args, **kwargs)
+
     def __str__(self):
         return "{},{},{},{},{}".format(self.id, self.first_name, self.last_name,
                                        self.phone_number, self.client_member_id)
 
 
+class AccountManager(models.Manager):
+    """Maps account ids to their integer keys through a process wide cache.
+
+    Accounts are never renamed or deleted (the admin shows them read only), so cached entries never
+    go stale. Keys are only cached once the transaction that read or created them commits. Accounts
+    live on the default database.
+    """
+    _keys = {}
+    _account_ids = {}
+
+    def _remember(self, keys):
+        self._keys.update(keys)
+        self._account_ids.update((key, account_id) for account_id, key in keys.items())
+
+    def keys_for(self, account_ids, create=True):
+        """Return {account id: key}, querying only the account ids not cached yet."""
+        account_ids = {str(account_id) for account_id in account_ids}
+        keys = {account_id: self._keys[account_id] for account_id in account_ids if account_id in self._keys}
+        missing = sorted(account_ids - set(keys))
+        accounts = self.db_manager(DEFAULT_DB_ALIAS)
+        for start in range(0, len(missing), 500):
+            found = dict(accounts.filter(account_id__in=missing[start:start + 500]).values_list('account_id', 'id'))
+            transaction.on_commit(partial(self._remember, found), using=DEFAULT_DB_ALIAS)
+            keys.update(found)
+        if create:
+            for account_id in missing:
+                if account_id not in keys:
+                    account, _ = accounts.get_or_create(account_id=account_id)
+                    transaction.on_commit(partial(self._remember, {account_id: account.id}), using=DEFAULT_DB_ALIAS)
+                    keys[account_id] = account.id
+        return keys
+
+    def key_for(self, account_id, create=True):
+        """Return the key of an account id, None if the account doesn't exist and create is False."""
+        account_id = str(account_id)
+        if account_id in self._keys:
+            return self._keys[account_id]
+        return self.keys_for([account_id], create).get(account_id)
+
+    def account_ids_for(self, keys):
+        """Return {key: account id}, querying only the keys not cached yet."""
+        account_ids = {key: self._account_ids[key] for key in keys if key in self._account_ids}
+        missing = sorted(set(keys) - set(account_ids))
+        for start in range(0, len(missing), 500):
+            found = dict(self.db_manager(DEFAULT_DB_ALIAS).filter(id__in=missing[start:start + 500])
+                         .values_list('account_id', 'id'))
+            transaction.on_commit(partial(self._remember, found), using=DEFAULT_DB_ALIAS)
+            account_ids.update((key, account_id) for account_id, key in found.items())
+        return account_ids
+
+    def account_id_for(self, key):
+        if key in self._account_ids:
+            return self._account_ids[key]
+        return self.account_ids_for([key]).get(key)
+
+
+class Account(models.Model):
+    """An account members are linked to, providers refer to it by its integer key."""
+    account_id = models.CharField(max_length=20, unique=True)
+
+    objects = AccountManager()
+
+    def __str__(self):
+        return self.account_id
+
+
 class ProviderManager(models.Manager):
     def create_provider(self, subscriber, account_id):
-        provider = self.create(subscriber=subscriber, account_id=account_id)
+        # Manager writes ignore the instance, place the provider next to its subscriber.
+        db = router.db_for_write(self.model, instance=subscriber)
+        provider = self.db_manager(db).create(subscriber=subscriber,
+                                              account_key=Account.objects.key_for(account_id))
 
         return provider
 
+    def for_account(self, account_id):
+        """Return the providers of an account from every shard."""
+        account_key = Account.objects.key_for(account_id, create=False)
+        if account_key is None:
+            return []
+        providers = []
+        for db in sharding.subscriber_dbs():
+            providers.extend(self.db_manager(db).filter(account_key=account_key))
+        return providers
+
 
 class Provider(models.Model):
     subscriber = models.ForeignKey('Subscriber', on_delete=models.CASCADE, related_name='providers')
-    account_id = models.CharField(max_length=20)
+    # Account.id, a plain integer rather than a foreign key so providers on shards can refer to it.
+    account_key = models.IntegerField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     objects = ProviderManager()
 
+    @property
+    def account_id(self):
+        return Account.objects.account_id_for(self.account_key)
+
+    @account_id.setter
+    def account_id(self, account_id):
+        self.account_key = Account.objects.key_for(account_id)
+
     def __str__(self):
-        return self.account_id
+        # An account deleted outside the admin leaves no account id behind.
+        return self.account_id or ''
 
     class Meta:
-        unique_together = ('subscriber', 'account_id')
+        unique_together = ('subscriber', 'account_key')
+
+
+class MemberLocation(models.Model):
+    """Directory of the shard holding each member, used when SUBSCRIBER_SHARDS is set.
+
+    A sharded member has the id of its location, so ids are unique over every shard.
+    """
+    client_member_id = models.CharField(max_length=20, unique=True)
+    shard = models.CharField(max_length=32)
+
+    def __str__(self):
+        return "{},{}".format(self.client_member_id, self.shard)
+
+
+class Change(models.Model):
+    """One entry of the change feed, ``seq`` is the cursor consumers sync from.
+
+    Lives on the default database, so the sequence covers every shard.
+    """
+    CREATED = 'created'
+    UPDATED = 'updated'
+    DELETED = 'deleted'
+    ACTIONS = ((CREATED, 'Created'), (UPDATED, 'Updated'), (DELETED, 'Deleted'))
+
+    SUBSCRIBER = 'subscriber'
+    PROVIDER = 'provider'
+    ENTITIES = ((SUBSCRIBER, 'Subscriber'), (PROVIDER, 'Provider'))
+
+    seq = models.BigAutoField(primary_key=True)
+    entity = models.CharField(max_length=10, choices=ENTITIES)
+    entity_id = models.IntegerField()
+    shard = models.CharField(max_length=32, blank=True, default='')
+    action = models.CharField(max_length=7, choices=ACTIONS)
+    changed_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return "{},{},{},{}".format(self.seq, self.entity, self.entity_id, self.action)
+
+
+class AccountStats(models.Model):
+    """Member count of an account, kept up to date by ``subscribers.stats`` as providers come and go.
+
+    Lives on the default database, so one row covers the account on every shard.
+    """
+    account_id = models.CharField(max_length=20, primary_key=True)
+    member_count = models.BigIntegerField(default=0)
+    last_changed_at = models.DateTimeField(null=True)
+
+    def __str__(self):
+        return "{},{}".format(self.account_id, self.member_count)
+
+
+class ImportJob(models.Model):
+    """An uploaded member file being imported, with the checkpoint it resumes from.
+
+    ``next_chunk`` only moves in the transaction that commits a chunk, so a job picks up after the
+    last chunk that really landed. Lives on the default database like the change feed.
+    """
+    CREATE = 'create'
+    SYNC = 'sync'
+    MODES = ((CREATE, 'Create'), (SYNC, 'Sync'))
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = ((PENDING, 'Pending'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed'))
+
+    mode = models.CharField(max_length=6, choices=MODES, default=CREATE)
+    account_id = models.CharField(max_length=20, blank=True, default='')
+    rows_file = models.CharField(max_length=255, blank=True, default='')
+    total_rows = models.IntegerField(default=0)
+    chunk_size = models.IntegerField()
+    next_chunk = models.IntegerField(default=0)
+    status = models.CharField(max_length=7, choices=STATUSES, default=PENDING, db_index=True)
+    report = models.TextField(blank=True, default='{}')
+    error = models.TextField(blank=True, default='')
+    # Memory use of the last chunks applied (subscribers.memory), as JSON.
+    memory = models.TextField(blank=True, default='[]')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def total_chunks(self):
+        return -(-self.total_rows // self.chunk_size)
+
+    def __str__(self):
+        return "{},{},{},{}/{}".format(self.id, self.mode, self.status, self.next_chunk, self.total_chunks)
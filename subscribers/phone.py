@@ -0,0 +1,36 @@
+# coding=utf-8
+"""Normalisation of phone numbers into compact integer keys."""
+import re
+
+from django.conf import settings
+
+NON_DIGITS = re.compile(r'\D')
+
+MAX_E164_DIGITS = 15
+
+
+def normalize_phone(phone_number):
+    """Return the E.164 digits of a phone number as an int, or None if it isn't one.
+
+    Formatting is dropped, a ``00`` international prefix is treated like ``+`` and national
+    numbers of PHONE_NATIONAL_NUMBER_LENGTH digits get PHONE_DEFAULT_COUNTRY_CODE prepended,
+    so "+1 (667) 016-1365", "001 667 016 1365" and "6670161365" share the key 16670161365.
+    """
+    if phone_number is None:
+        return None
+    text = str(phone_number).strip()
+    digits = NON_DIGITS.sub('', text)
+    if not text.startswith('+'):
+        if digits.startswith('00'):
+            digits = digits[2:]
+        elif len(digits) == settings.PHONE_NATIONAL_NUMBER_LENGTH:
+            digits = settings.PHONE_DEFAULT_COUNTRY_CODE + digits
+    digits = digits.lstrip('0')
+    if not digits or len(digits) > MAX_E164_DIGITS:
+        return None
+    return int(digits)
+
+
+def reversed_digits(phone_number):
+    """Return the digits of a phone number last to first, so suffix searches become prefix searches."""
+    return NON_DIGITS.sub('', str(phone_number or ''))[::-1]
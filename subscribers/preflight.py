@@ -0,0 +1,87 @@
+# coding=utf-8
+"""Pre-flight validation of member CSV rows, without touching the database.
+
+Rows are checked against the Subscriber/Provider column limits and against each other: a phone
+number may only appear with one client member id and the other way around, and a member/account
+pair only once. The first occurrence wins, like it would in an import job.
+"""
+import csv
+import time
+from collections import Counter
+
+from subscribers.models import Subscriber, Account
+from subscribers.phone import normalize_phone
+
+COLUMNS = ('first_name', 'last_name', 'phone_number', 'client_member_id', 'account_id')
+
+FIELD_LIMITS = (
+    ('first_name', Subscriber._meta.get_field('first_name').max_length),
+    ('last_name', Subscriber._meta.get_field('last_name').max_length),
+    ('phone_number', Subscriber._meta.get_field('phone_number').max_length),
+    ('client_member_id', Subscriber._meta.get_field('client_member_id').max_length),
+    ('account_id', Account._meta.get_field('account_id').max_length),
+)
+
+
+class Preflight(object):
+    """Checks rows and keeps a report, writing rejected rows with their reason to ``rejects``."""
+
+    def __init__(self, rejects=None):
+        self.rejects = csv.writer(rejects, delimiter=',', quotechar='|') if rejects is not None else None
+        self.rows = 0
+        self.valid = 0
+        self.reasons = Counter()
+        # Client member ids by phone key and the reverse, plus the member/account pairs seen.
+        self._client_by_phone = {}
+        self._phone_by_client = {}
+        self._pairs = set()
+        self._start = time.time()
+
+    def _reason(self, row):
+        """Return why the row can't be imported, None if it can."""
+        if len(row) != len(COLUMNS):
+            return 'wrong_column_count'
+        for (field, limit), value in zip(FIELD_LIMITS, row):
+            if field != 'account_id' and not value.strip():
+                return 'missing_{}'.format(field)
+            if len(value) > limit:
+                return '{}_too_long'.format(field)
+        phone_key = normalize_phone(row[2])
+        if phone_key is None:
+            return 'invalid_phone_number'
+        client_member_id = row[3]
+        if self._client_by_phone.get(phone_key, client_member_id) != client_member_id:
+            return 'phone_number_conflict'
+        if self._phone_by_client.get(client_member_id, phone_key) != phone_key:
+            return 'client_member_id_conflict'
+        pair = (phone_key, row[4])
+        if pair in self._pairs:
+            return 'duplicate_row'
+        self._client_by_phone[phone_key] = client_member_id
+        self._phone_by_client[client_member_id] = phone_key
+        self._pairs.add(pair)
+        return None
+
+    def check(self, rows):
+        """Yield the rows that pass, counting and writing out the others."""
+        for row in rows:
+            self.rows += 1
+            reason = self._reason(row)
+            if reason is None:
+                self.valid += 1
+                yield row
+                continue
+            self.reasons[reason] += 1
+            if self.rejects is not None:
+                self.rejects.writerow(list(row) + [reason])
+
+    @property
+    def report(self):
+        return {
+            "rows": self.rows,
+            "valid": self.valid,
+            "rejected": self.rows - self.valid,
+            "members": len(self._client_by_phone),
+            "reasons": dict(self.reasons),
+            "seconds": round(time.time() - self._start, 3),
+        }
@@ -0,0 +1,243 @@
+# coding=utf-8
+"""Per-statement query statistics with EXPLAIN plans of the slow ones.
+
+An execute wrapper on every database connection groups statements by fingerprint (the SQL with
+literals and IN lists collapsed) and counts their executions and time, along with where they came
+from: the URL name of a request or the name of a Celery task. The first time a SELECT takes longer
+than ``SLOW_QUERY_MS`` its plan is captured and full table scans in it are flagged.
+
+Every process keeps its own numbers. The metrics endpoint shows those of the process answering it,
+and each process writes its numbers to ``QUERY_LOG_DIR`` every ``QUERY_LOG_FLUSH_SECONDS`` for
+``python manage.py slow_queries`` to merge.
+"""
+import functools
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.urls import Resolver404, get_resolver
+
+log = logging.getLogger('.'.join((settings.LOG_NAME.split('.')[0], __name__,)))
+
+# Fingerprints kept per process, later statements are counted under OTHER.
+MAX_FINGERPRINTS = 500
+OTHER = '(other statements)'
+# Origins kept per fingerprint.
+MAX_ORIGINS = 10
+
+_IN_LIST = re.compile(r'\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)')
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_SPACE = re.compile(r'\s+')
+
+_lock = threading.Lock()
+_local = threading.local()
+_stats = {}
+_flushed_at = 0.0
+_changed = False
+
+
+@functools.lru_cache(maxsize=2048)
+def fingerprint(sql):
+    """Return the statement with its literals and parameter lists collapsed."""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('(...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def set_origin(origin):
+    """Attribute the following statements of this thread to origin."""
+    _local.origin = origin
+
+
+def _explain(connection, sql, params):
+    """Return the plan of a statement as a list of lines, and the lines that scan a whole table."""
+    vendor = connection.vendor
+    prefix = 'EXPLAIN QUERY PLAN ' if vendor == 'sqlite' else 'EXPLAIN '
+    _local.explaining = True
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            columns = [column[0] for column in cursor.description]
+            rows = cursor.fetchall()
+    finally:
+        _local.explaining = False
+    if vendor == 'sqlite':
+        plan = [row[-1] for row in rows]
+        scans = [line for line in plan if re.match(r'SCAN (TABLE )?\w+$', line)]
+    elif vendor == 'mysql':
+        plan = [', '.join('{}={}'.format(name, value) for name, value in zip(columns, row)) for row in rows]
+        scans = [line for line, row in zip(plan, rows) if dict(zip(columns, row)).get('type') == 'ALL']
+    else:
+        plan = [row[0] for row in rows]
+        scans = [line.strip() for line in plan if 'Seq Scan' in line]
+    return plan, scans
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper timing every statement."""
+    if getattr(_local, 'explaining', False):
+        return execute(sql, params, many, context)
+    start = time.time()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        _record(context['connection'], sql, params, many, time.time() - start)
+
+
+def _record(connection, sql, params, many, seconds):
+    global _changed
+    key = fingerprint(sql)
+    origin = getattr(_local, 'origin', None) or 'other'
+    with _lock:
+        entry = _stats.get(key)
+        if entry is None:
+            if len(_stats) >= MAX_FINGERPRINTS:
+                key = OTHER
+                entry = _stats.get(key)
+            if entry is None:
+                entry = _stats[key] = {
+                    'fingerprint': key, 'database': connection.alias, 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                    'slow_count': 0, 'origins': Counter(), 'plan': None, 'full_scans': None, 'sample': None}
+        entry['count'] += 1
+        entry['total_ms'] += seconds * 1000
+        entry['max_ms'] = max(entry['max_ms'], seconds * 1000)
+        if origin in entry['origins'] or len(entry['origins']) < MAX_ORIGINS:
+            entry['origins'][origin] += 1
+        slow = seconds * 1000 >= settings.SLOW_QUERY_MS
+        if slow:
+            entry['slow_count'] += 1
+        explain = slow and entry['plan'] is None and key != OTHER
+        if explain:
+            entry['plan'] = []  # explained once, by this thread
+        _changed = True
+    if explain and not many and sql.lstrip()[:6].upper() == 'SELECT':
+        try:
+            plan, scans = _explain(connection, sql, params)
+        except Exception as e:  # the plan is a nice to have, never fail the query over it
+            log.info("Could not explain a slow query: {}".format(str(e)))
+            return
+        with _lock:
+            entry.update(plan=plan, full_scans=scans, sample=sql)
+
+
+def top(limit=20, order='total_ms', stats=None):
+    """Return the statements with the highest total time (or count, max_ms...), largest first."""
+    if stats is None:
+        with _lock:
+            stats = [dict(entry, origins=dict(entry['origins'])) for entry in _stats.values()]
+    stats = sorted(stats, key=lambda entry: entry[order], reverse=True)[:limit]
+    for entry in stats:
+        entry['mean_ms'] = entry['total_ms'] / entry['count']
+    return stats
+
+
+def merge(reports):
+    """Add up the statements of several processes' reports."""
+    merged = {}
+    for report in reports:
+        for entry in report:
+            total = merged.get(entry['fingerprint'])
+            if total is None:
+                merged[entry['fingerprint']] = dict(entry, origins=Counter(entry['origins']))
+                continue
+            for field in ('count', 'total_ms', 'slow_count'):
+                total[field] += entry[field]
+            total['max_ms'] = max(total['max_ms'], entry['max_ms'])
+            total['origins'].update(entry['origins'])
+            if not total['plan'] and entry['plan']:
+                total.update(plan=entry['plan'], full_scans=entry['full_scans'], sample=entry['sample'])
+    return list(merged.values())
+
+
+def flush(force=False):
+    """Write this process's statements to QUERY_LOG_DIR, at most every QUERY_LOG_FLUSH_SECONDS."""
+    global _flushed_at, _changed
+    now = time.time()
+    if not settings.QUERY_LOG_DIR or not _changed or (not force and now - _flushed_at < settings.QUERY_LOG_FLUSH_SECONDS):
+        return
+    _flushed_at, _changed = now, False
+    report = top(MAX_FINGERPRINTS + 1)
+    os.makedirs(settings.QUERY_LOG_DIR, exist_ok=True)
+    path = os.path.join(settings.QUERY_LOG_DIR, '{}.json'.format(os.getpid()))
+    with open(path + '.tmp', 'w') as out:
+        json.dump(report, out)
+    os.replace(path + '.tmp', path)
+
+
+def read_reports(directory):
+    """Return the reports the processes wrote to directory."""
+    reports = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.json'):
+            with open(os.path.join(directory, name)) as report:
+                reports.append(json.load(report))
+    return reports
+
+
+def reset(**kwargs):  # noqa kwargs
+    """Forget every statement, e.g. in a freshly forked worker."""
+    global _changed
+    with _lock:
+        _stats.clear()
+        _changed = False
+
+
+def install(sender, connection, **kwargs):  # noqa sender
+    """Add the wrapper to a new connection, once per connection object."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def request_origin(sender, environ, **kwargs):  # noqa sender
+    """Attribute the statements of a request to its URL name."""
+    try:
+        set_origin('view:' + (get_resolver().resolve(environ.get('PATH_INFO', '')).url_name or 'unnamed'))
+    except Resolver404:
+        set_origin('view:unresolved')
+
+
+def request_done(**kwargs):  # noqa kwargs
+    """Stop attributing statements to the request and write the numbers out if it's time."""
+    set_origin(None)
+    flush()
+
+
+def task_origin(sender=None, **kwargs):  # noqa kwargs
+    """Attribute the statements of a task to its name."""
+    set_origin('task:' + (sender.name if sender is not None else 'unknown'))
+
+
+def task_done(**kwargs):  # noqa kwargs
+    """Stop attributing statements to the task and write the numbers out if it's time."""
+    set_origin(None)
+    flush()
+
+
+def connect_signals():
+    """Connect the Django receivers, called once from the app config."""
+    from django.core.signals import request_started, request_finished
+    from django.db.backends.signals import connection_created
+
+    if not settings.QUERY_LOG:
+        return
+    connection_created.connect(install, dispatch_uid='subscribers.querylog_install')
+    request_started.connect(request_origin, dispatch_uid='subscribers.querylog_request_origin')
+    request_finished.connect(request_done, dispatch_uid='subscribers.querylog_request_done')
+
+
+def connect_worker_signals():
+    """Connect the Celery receivers, called from the Celery app so web workers never import Celery."""
+    from celery.signals import worker_process_init, task_prerun, task_postrun
+
+    if not settings.QUERY_LOG:
+        return
+    task_prerun.connect(task_origin, dispatch_uid='subscribers.querylog_task_origin')
+    task_postrun.connect(task_done, dispatch_uid='subscribers.querylog_task_done')
+    worker_process_init.connect(reset, dispatch_uid='subscribers.querylog_reset')
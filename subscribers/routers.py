@@ -0,0 +1,117 @@
+# coding=utf-8
+"""Database routers for the subscribers app."""
+import itertools
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from subscribers import sharding
+
+PRIMARY_DB = 'default'
+
+_state = threading.local()
+
+
+def is_pinned():
+    """Return True if the current thread must read from the primary."""
+    return getattr(_state, 'pinned', False)
+
+
+def pin_to_primary():
+    """Send every following read of the current thread to the primary."""
+    _state.pinned = True
+
+
+def unpin():
+    """Allow the current thread to read from the replicas again."""
+    _state.pinned = False
+
+
+@contextmanager
+def use_primary():
+    """Pin reads and writes to the primary for the duration of the block."""
+    previous = is_pinned()
+    pin_to_primary()
+    try:
+        yield
+    finally:
+        _state.pinned = previous
+
+
+class PrimaryReplicaRouter(object):
+    """Route writes to the primary and spread reads round-robin over the replicas.
+
+    Once a thread has written, it stays pinned to the primary so it reads its own writes.
+    The pin is cleared per request by ``subscribers.middleware.PrimaryPinningMiddleware``.
+    """
+
+    def __init__(self):
+        replicas = list(getattr(settings, 'DATABASE_REPLICAS', []))
+        self._databases = {PRIMARY_DB} | set(replicas)
+        self._replicas = itertools.cycle(replicas) if replicas else None
+
+    def db_for_read(self, model, **hints):
+        """Pick a replica unless the thread is pinned or the instance already lives somewhere."""
+        if is_pinned() or self._replicas is None:
+            return PRIMARY_DB
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        return next(self._replicas)
+
+    def db_for_write(self, model, **hints):
+        """Writes go to the primary and pin the thread to it.
+
+        Objects related to an instance on another database (a shard) are written next to it.
+        """
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db and instance._state.db not in self._databases:
+            return instance._state.db
+        pin_to_primary()
+        return PRIMARY_DB
+
+    def allow_relation(self, obj1, obj2, **hints):
+        """Objects from the primary and its replicas hold the same data."""
+        if obj1._state.db in self._databases and obj2._state.db in self._databases:
+            return True
+        return None
+
+
+class ShardRouter(object):
+    """Route subscribers and providers to their shard when SUBSCRIBER_SHARDS is set.
+
+    Reads without an instance hint cannot be placed, callers pick the shard with ``using()``
+    (see ``subscribers.sharding``). Unsharded models fall through to the next router.
+    """
+
+    def db_for_read(self, model, **hints):
+        """Read related objects from the shard of the instance they hang off."""
+        if not sharding.is_sharded(model):
+            return None
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        return None
+
+    def db_for_write(self, model, **hints):
+        """Write a subscriber to the shard of its phone number and a provider next to its subscriber."""
+        if not sharding.is_sharded(model):
+            return None
+        instance = hints.get('instance')
+        if instance is None:
+            return None
+        if instance._state.db:
+            return instance._state.db
+        if hasattr(instance, 'phone_number'):
+            return sharding.shard_for_phone(instance.phone_number)
+        subscriber = getattr(instance, 'subscriber', None)
+        if subscriber is not None:
+            return subscriber._state.db
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        """Sharded rows only relate to rows on the same shard."""
+        if sharding.is_sharded(type(obj1)) or sharding.is_sharded(type(obj2)):
+            return obj1._state.db == obj2._state.db
+        return None
@@ -0,0 +1,77 @@
+# coding=utf-8
+"""Indexed member search on name prefixes and phone number suffixes.
+
+Every search is a range scan of one indexed key column (``phone_reversed`` for phone suffixes,
+``last_name_key`` or ``first_name_key`` for names) in (key, id) order, paginated with a keyset
+cursor, so a page costs the same however deep it is.
+"""
+import base64
+import json
+
+from django.db.models import Q
+
+from subscribers import sharding
+from subscribers.models import Subscriber
+from subscribers.phone import reversed_digits
+
+MAX_LIMIT = 200
+
+
+class SearchError(ValueError):
+    """The search terms or the cursor can't be used."""
+
+
+def prefix_range(column, prefix):
+    """Filter column on a prefix with a plain range, which every database answers from the index."""
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return Q(**{column + '__gte': prefix, column + '__lt': upper})
+
+
+def encode_cursor(key, id):
+    return base64.urlsafe_b64encode(json.dumps([key, id]).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        key, id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        return str(key), int(id)
+    except (ValueError, TypeError, UnicodeError):
+        raise SearchError('Invalid cursor.')
+
+
+def search_members(first_name=None, last_name=None, phone_suffix=None, limit=50, cursor=None):
+    """Return a page of subscribers matching every given term, and the cursor of the next page."""
+    terms = []
+    if phone_suffix:
+        digits = reversed_digits(phone_suffix)
+        if not digits:
+            raise SearchError('phone_suffix must contain digits.')
+        terms.append(('phone_reversed', digits))
+    if last_name:
+        terms.append(('last_name_key', last_name.lower()))
+    if first_name:
+        terms.append(('first_name_key', first_name.lower()))
+    if not terms:
+        raise SearchError('Give at least one of first_name, last_name or phone_suffix.')
+    limit = max(1, min(int(limit), MAX_LIMIT))
+
+    # The most selective term drives the index scan, the others filter its rows.
+    column = terms[0][0]
+    condition = Q()
+    for term_column, prefix in terms:
+        condition &= prefix_range(term_column, prefix)
+    if cursor:
+        key, last_id = decode_cursor(cursor)
+        condition &= Q(**{column + '__gt': key}) | Q(**{column: key, 'id__gt': last_id})
+
+    subs = []
+    for db in sharding.subscriber_dbs():
+        subs.extend(Subscriber.objects.db_manager(db).filter(condition)
+                    .order_by(column, 'id').prefetch_related('providers')[:limit + 1])
+    subs.sort(key=lambda sub: (getattr(sub, column), sub.id))
+
+    next_cursor = None
+    if len(subs) > limit:
+        subs = subs[:limit]
+        next_cursor = encode_cursor(getattr(subs[-1], column), subs[-1].id)
+    return subs, next_cursor
@@ -0,0 +1,51 @@
+# coding=utf-8
+"""Placement of subscribers and providers over the databases listed in SUBSCRIBER_SHARDS.
+
+A member lives on the shard picked by a jump consistent hash of its normalized phone number
+(``subscribers.phone``), so adding a shard only moves about 1/N of the members (see the
+``rebalance_shards`` command). Providers live on the shard of their subscriber. When SUBSCRIBER_SHARDS is empty nothing is sharded and every
+helper returns ``None``, which leaves the choice of database to the routers.
+"""
+import hashlib
+
+from django.conf import settings
+
+from subscribers.phone import normalize_phone
+
+SHARDED_MODELS = ('subscribers.subscriber', 'subscribers.provider')
+
+
+def is_enabled():
+    """Return True if subscribers are sharded."""
+    return bool(settings.SUBSCRIBER_SHARDS)
+
+
+def is_sharded(model):
+    """Return True if rows of the given model are spread over the shards."""
+    return is_enabled() and model._meta.label_lower in SHARDED_MODELS
+
+
+def jump_hash(key, buckets):
+    """Map a 64 bit key to one of ``buckets`` buckets (Lamping & Veach jump consistent hash)."""
+    b, j = -1, 0
+    while j < buckets:
+        b = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((b + 1) * (float(1 << 31) / float((key >> 33) + 1)))
+    return b
+
+
+def shard_for_phone(phone_number, shards=None):
+    """Return the alias of the database holding the member with this phone number."""
+    shards = settings.SUBSCRIBER_SHARDS if shards is None else shards
+    if not shards:
+        return None
+    phone_key = normalize_phone(phone_number)
+    source = str(phone_number if phone_key is None else phone_key)
+    key = int(hashlib.md5(source.encode('utf-8')).hexdigest()[:16], 16)
+    return shards[jump_hash(key, len(shards))]
+
+
+def subscriber_dbs():
+    """Return every database alias a subscriber lookup has to fan out to."""
+    return list(settings.SUBSCRIBER_SHARDS) or [None]
@@ -0,0 +1,52 @@
+# coding=utf-8
+"""Signal receivers recording subscriber and provider changes in the change feed and account counts."""
+from django.db.models.signals import post_save, post_delete
+
+from subscribers import sharding, stats
+from subscribers.models import Subscriber, Provider, Change
+
+ENTITIES = {Subscriber: Change.SUBSCRIBER, Provider: Change.PROVIDER}
+
+
+def _shard(using):
+    return using if sharding.is_enabled() else ''
+
+
+def record_save(sender, instance, created, using, **kwargs):
+    """Append a created or updated entry to the change feed."""
+    Change.objects.create(entity=ENTITIES[sender], entity_id=instance.pk, shard=_shard(using),
+                          action=Change.CREATED if created else Change.UPDATED)
+
+
+def record_delete(sender, instance, using, **kwargs):
+    """Append a deleted entry to the change feed."""
+    Change.objects.create(entity=ENTITIES[sender], entity_id=instance.pk, shard=_shard(using),
+                          action=Change.DELETED)
+
+
+def reset_content_hash(sender, instance, using, **kwargs):  # noqa sender
+    """A provider link changed, the member no longer matches the hash of its last sync import."""
+    if kwargs.get('created', True):
+        Subscriber.objects.db_manager(using).filter(pk=instance.subscriber_id).update(content_hash='')
+
+
+def count_added_provider(sender, instance, created, **kwargs):  # noqa sender
+    """A new provider adds a member to its account."""
+    if created:
+        stats.record(instance.account_id, 1)
+
+
+def count_deleted_provider(sender, instance, **kwargs):  # noqa sender
+    """A deleted provider takes a member away from its account."""
+    stats.record(instance.account_id, -1)
+
+
+def connect_signals():
+    """Connect the receivers, called once from the app config."""
+    for model in ENTITIES:
+        post_save.connect(record_save, sender=model, dispatch_uid='subscribers.record_save')
+        post_delete.connect(record_delete, sender=model, dispatch_uid='subscribers.record_delete')
+    post_save.connect(reset_content_hash, sender=Provider, dispatch_uid='subscribers.reset_content_hash')
+    post_delete.connect(reset_content_hash, sender=Provider, dispatch_uid='subscribers.reset_content_hash')
+    post_save.connect(count_added_provider, sender=Provider, dispatch_uid='subscribers.count_added_provider')
+    post_delete.connect(count_deleted_provider, sender=Provider, dispatch_uid='subscribers.count_deleted_provider')
@@ -0,0 +1,223 @@
+# coding=utf-8
+"""Read-only member snapshot served from a memory-mapped file.
+
+``build_member_snapshot`` writes every subscriber with its providers to one file: a heap of the
+lookup responses, plus sorted arrays of phone keys, ids and client member ids pointing into it.
+Lookup nodes map the file read-only, so all their worker processes share one copy through the page
+cache, and answer the single member lookups with a binary search instead of a query. A new file
+replaces the old one with a rename, each process picks it up within ``CHECK_INTERVAL`` seconds.
+
+Members created after the snapshot was built miss it and are read from the database. Changes to
+members already in it show up with the next snapshot, which ``MEMBER_SNAPSHOT_MAX_AGE`` bounds:
+an older snapshot is ignored altogether. Requests pinned to the primary after a write skip the
+snapshot, so a client reads its own writes.
+"""
+import mmap
+import os
+import struct
+import tempfile
+import time
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+
+from members import metrics
+from subscribers import routers, sharding
+from subscribers.models import Subscriber, Provider, Account
+from subscribers.phone import normalize_phone
+
+MAGIC = b'MEMBSNAP'
+VERSION = 1
+# Magic, version, build time, member count, then offset and length of each section.
+SECTIONS = ('heap', 'record_offsets', 'phone_keys', 'phone_records', 'ids', 'id_records',
+            'cmid_heap', 'cmid_offsets', 'cmid_records')
+HEADER = struct.Struct('<8sIdQ' + 'QQ' * len(SECTIONS))
+TYPECODES = {'record_offsets': 'Q', 'phone_keys': 'q', 'phone_records': 'I', 'ids': 'q', 'id_records': 'I',
+             'cmid_offsets': 'Q', 'cmid_records': 'I'}
+SEPARATOR = '\x00'
+
+CHECK_INTERVAL = 1.0
+CHUNK_SIZE = 5000
+
+
+def _members(chunk_size=CHUNK_SIZE):
+    """Yield (id, phone_key, client_member_id, member, [account ids]) for every subscriber."""
+    for db in sharding.subscriber_dbs():
+        last_id = 0
+        while True:
+            chunk = list(Subscriber.objects.db_manager(db).filter(id__gt=last_id).order_by('id').values_list(
+                'id', 'first_name', 'last_name', 'phone_number', 'client_member_id', 'phone_key')[:chunk_size])
+            if not chunk:
+                break
+            last_id = chunk[-1][0]
+            links = list(Provider.objects.db_manager(db).filter(subscriber_id__in=[row[0] for row in chunk])
+                         .order_by('id').values_list('subscriber_id', 'account_key'))
+            account_ids = Account.objects.account_ids_for({account_key for _, account_key in links})
+            accounts = {}
+            for subscriber_id, account_key in links:
+                accounts.setdefault(subscriber_id, []).append(account_ids[account_key])
+            for id, first_name, last_name, phone_number, client_member_id, phone_key in chunk:
+                # The same text as str(subscriber) in the lookup responses.
+                member = "{},{},{},{},{}".format(id, first_name, last_name, phone_number, client_member_id)
+                yield id, phone_key, client_member_id, member, accounts.get(id, [])
+
+
+def _write_section(handle, values):
+    """Write bytes or an array at the next 8 byte boundary and return its offset and length."""
+    handle.write(b'\x00' * (-handle.tell() % 8))
+    offset = handle.tell()
+    data = values.tobytes() if isinstance(values, array) else values
+    handle.write(data)
+    return offset, len(data)
+
+
+def build(path):
+    """Write a snapshot of every member next to path, then move it over path. Return the member count."""
+    directory = os.path.dirname(os.path.abspath(path))
+    handle, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    built_at = time.time()
+    record_offsets = array('Q', [0])
+    phones, ids, cmids = [], [], []
+    try:
+        with os.fdopen(handle, 'wb') as out:
+            out.write(b'\x00' * HEADER.size)
+            heap_offset = out.tell()
+            for id, phone_key, client_member_id, member, account_ids in _members():
+                index = len(record_offsets) - 1
+                out.write(SEPARATOR.join([member] + account_ids).encode('utf-8'))
+                record_offsets.append(out.tell() - heap_offset)
+                if phone_key is not None:
+                    phones.append((phone_key, index))
+                ids.append((id, index))
+                cmids.append((client_member_id.encode('utf-8'), index))
+            sections = {'heap': (heap_offset, out.tell() - heap_offset)}
+            sections['record_offsets'] = _write_section(out, record_offsets)
+            phones.sort()
+            sections['phone_keys'] = _write_section(out, array('q', (key for key, _ in phones)))
+            sections['phone_records'] = _write_section(out, array('I', (index for _, index in phones)))
+            ids.sort()
+            sections['ids'] = _write_section(out, array('q', (id for id, _ in ids)))
+            sections['id_records'] = _write_section(out, array('I', (index for _, index in ids)))
+            cmids.sort()
+            cmid_offsets = array('Q', [0])
+            for client_member_id, _ in cmids:
+                cmid_offsets.append(cmid_offsets[-1] + len(client_member_id))
+            sections['cmid_heap'] = _write_section(out, b''.join(client_member_id for client_member_id, _ in cmids))
+            sections['cmid_offsets'] = _write_section(out, cmid_offsets)
+            sections['cmid_records'] = _write_section(out, array('I', (index for _, index in cmids)))
+            out.seek(0)
+            out.write(HEADER.pack(MAGIC, VERSION, built_at, len(record_offsets) - 1,
+                                  *[value for name in SECTIONS for value in sections[name]]))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return len(record_offsets) - 1
+
+
+class MemberSnapshot(object):
+    """A snapshot file mapped read-only."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as handle:
+            self.stat = os.fstat(handle.fileno())
+            self._mmap = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        header = HEADER.unpack_from(self._mmap)
+        magic, version, self.built_at, self.count = header[:4]
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('{} is not a version {} member snapshot.'.format(path, VERSION))
+        view = memoryview(self._mmap)
+        for position, name in enumerate(SECTIONS):
+            offset, length = header[4 + 2 * position:6 + 2 * position]
+            section = view[offset:offset + length]
+            setattr(self, '_' + name, section.cast(TYPECODES[name]) if name in TYPECODES else section)
+
+    def _record(self, index):
+        start, end = self._record_offsets[index], self._record_offsets[index + 1]
+        member, *account_ids = bytes(self._heap[start:end]).decode('utf-8').split(SEPARATOR)
+        return {"member": member, "providers": account_ids}
+
+    def _find(self, keys, records, key):
+        position = bisect_left(keys, key)
+        if position < len(keys) and keys[position] == key:
+            return self._record(records[position])
+        return None
+
+    def by_phone_key(self, phone_key):
+        return self._find(self._phone_keys, self._phone_records, phone_key)
+
+    def by_id(self, id):
+        return self._find(self._ids, self._id_records, id)
+
+    def by_client_member_id(self, client_member_id):
+        key = client_member_id.encode('utf-8')
+        low, high = 0, len(self._cmid_records)
+        while low < high:
+            middle = (low + high) // 2
+            if bytes(self._cmid_heap[self._cmid_offsets[middle]:self._cmid_offsets[middle + 1]]) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self._cmid_records) and \
+                bytes(self._cmid_heap[self._cmid_offsets[low]:self._cmid_offsets[low + 1]]) == key:
+            return self._record(self._cmid_records[low])
+        return None
+
+
+_snapshot = None
+_checked_at = 0.0
+
+
+def current():
+    """Return the snapshot of this process, reopened when the file was replaced, or None."""
+    global _snapshot, _checked_at
+    path = settings.MEMBER_SNAPSHOT_PATH
+    if not path:
+        return None
+    now = time.time()
+    if now - _checked_at >= CHECK_INTERVAL:
+        _checked_at = now
+        try:
+            stat = os.stat(path)
+            if _snapshot is None or (stat.st_ino, stat.st_mtime) != (_snapshot.stat.st_ino, _snapshot.stat.st_mtime):
+                _snapshot = MemberSnapshot(path)
+        except (OSError, ValueError, struct.error):
+            _snapshot = None
+    if _snapshot is None or now - _snapshot.built_at > settings.MEMBER_SNAPSHOT_MAX_AGE:
+        return None
+    return _snapshot
+
+
+def _lookup(find):
+    # A client that just wrote reads its own writes from the primary, see subscribers.routers.
+    if routers.is_pinned():
+        return None
+    snapshot = current()
+    if snapshot is None:
+        return None
+    data = find(snapshot)
+    metrics.incr('snapshot.hits' if data is not None else 'snapshot.misses')
+    return data
+
+
+def find_by_phone_number(phone_number):
+    """Return the lookup response of the member with this phone number, None to ask the database."""
+    phone_key = normalize_phone(phone_number)
+    if phone_key is None:
+        return None
+    return _lookup(lambda snapshot: snapshot.by_phone_key(phone_key))
+
+
+def find_by_client_member_id(client_member_id):
+    """Return the lookup response of the member with this client member id, None to ask the database."""
+    return _lookup(lambda snapshot: snapshot.by_client_member_id(client_member_id))
+
+
+def find_by_id(id):
+    """Return the lookup response of the member with this id, None to ask the database."""
+    try:
+        id = int(id)
+    except ValueError:
+        return None
+    return _lookup(lambda snapshot: snapshot.by_id(id))
@@ -0,0 +1,83 @@
+# coding=utf-8
+"""Per account member counts, maintained as providers are created and deleted.
+
+Every provider saved or deleted moves the ``AccountStats`` of its account by one, from a signal,
+so the count is written in the transaction of the provider when members live on the default
+database. Inside ``batch()`` the moves are summed up and written once per account when the block
+ends, which imports do per chunk. ``rebuild_account_stats`` recounts everything from the providers.
+"""
+import threading
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from subscribers.models import AccountStats, Provider, Account
+
+MAX_ACCOUNTS = 1000
+
+_local = threading.local()
+
+
+def _apply(account_id, delta, now):
+    updated = AccountStats.objects.filter(account_id=account_id).update(
+        member_count=F('member_count') + delta, last_changed_at=now)
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            AccountStats.objects.create(account_id=account_id, member_count=delta, last_changed_at=now)
+    except IntegrityError:  # created by someone else in the meantime
+        AccountStats.objects.filter(account_id=account_id).update(
+            member_count=F('member_count') + delta, last_changed_at=now)
+
+
+def record(account_id, delta):
+    """Move the member count of an account, now or at the end of the current batch."""
+    deltas = getattr(_local, 'deltas', None)
+    if deltas is not None:
+        deltas[account_id] += delta
+        return
+    _apply(account_id, delta, timezone.now())
+
+
+@contextmanager
+def batch():
+    """Write the count changes made inside the block once per account, when it ends without error."""
+    if getattr(_local, 'deltas', None) is not None:
+        yield
+        return
+    _local.deltas = Counter()
+    try:
+        yield
+        deltas, _local.deltas = _local.deltas, None
+        now = timezone.now()
+        for account_id in sorted(deltas):
+            _apply(account_id, deltas[account_id], now)
+    finally:
+        _local.deltas = None
+
+
+def account_counts(account_ids):
+    """Return the member count and last change of each account, one primary key lookup each."""
+    account_ids = list(OrderedDict.fromkeys(account_ids))[:MAX_ACCOUNTS]
+    stats = AccountStats.objects.in_bulk(account_ids)
+    results = []
+    for account_id in account_ids:
+        account = stats.get(account_id)
+        results.append({
+            "account_id": account_id,
+            "members": account.member_count if account else 0,
+            "last_changed_at": account.last_changed_at.isoformat() if account and account.last_changed_at else None,
+        })
+    return results
+
+
+def provider_counts(db):
+    """Return the number of providers of each account on one database."""
+    counts = dict(Provider.objects.db_manager(db).values_list('account_key').annotate(count=Count('id'))
+                  .order_by().values_list('account_key', 'count'))
+    account_ids = Account.objects.account_ids_for(counts)
+    return {account_ids[key]: count for key, count in counts.items()}
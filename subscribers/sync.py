@@ -0,0 +1,217 @@
+# coding=utf-8
+"""Sync imports, which apply only the difference between a roster file and the database.
+
+Each member's names and account ids are hashed. A member whose hash matches the one stored by
+its last sync (``Subscriber.content_hash``, cleared whenever the member or its providers change
+elsewhere) costs nothing beyond its share of one batched lookup, so resending an unchanged roster
+is mostly reads. Members of the file are created or updated and their provider links made to match
+the file. Scoped to one account, the file is that account's full roster: only links to that account
+are touched, and members of the account missing from the file lose their link to it. Imports
+``plan`` the whole file first, so a member whose rows span chunks is applied once, as a whole.
+"""
+import hashlib
+import json
+from collections import Counter, defaultdict, OrderedDict
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from subscribers import sharding
+from subscribers.models import Subscriber, Provider, Account
+from subscribers.phone import normalize_phone
+
+# Parameters per IN (...) query, below the SQLite limit.
+LOOKUP_BATCH_SIZE = 500
+
+
+def content_hash(first_name, last_name, account_ids):
+    """Return the hash of what a sync import compares for a member."""
+    content = json.dumps([first_name, last_name, sorted(account_ids)])
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+def _batches(items, size=LOOKUP_BATCH_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class MemberSync(object):
+    """Applies roster rows chunk by chunk and counts what it did."""
+
+    def __init__(self, account_id=None, report=None):
+        self.account_id = account_id
+        self.report = Counter(report or {})
+        self.seen_phone_keys = set()
+        self.planned = None
+
+    def _member_rows(self, rows, count=True):
+        """Yield (phone_key, first_name, last_name, phone_number, client_member_id, account_id) of the valid rows."""
+        for row in rows:
+            if count:
+                self.report['rows'] += 1
+            try:
+                first_name, last_name, phone_number, client_member_id, account_id = row
+            except ValueError:
+                if count:
+                    self.report['invalid_rows'] += 1
+                continue
+            phone_key = normalize_phone(phone_number)
+            if phone_key is None or not client_member_id:
+                if count:
+                    self.report['invalid_rows'] += 1
+                continue
+            if self.account_id is not None and account_id != self.account_id:
+                if count:
+                    self.report['out_of_scope_rows'] += 1
+                continue
+            yield phone_key, first_name, last_name, phone_number, client_member_id, account_id
+
+    def _members(self, rows, count=True):
+        """Group rows by phone key, the first row of a member gives its names."""
+        members = OrderedDict()
+        for phone_key, first_name, last_name, phone_number, client_member_id, account_id in \
+                self._member_rows(rows, count):
+            member = members.setdefault(phone_key, {
+                'first_name': first_name, 'last_name': last_name, 'phone_number': phone_number,
+                'client_member_id': client_member_id, 'account_ids': set(), 'rows': 0})
+            member['rows'] += 1
+            if account_id:
+                member['account_ids'].add(str(account_id))
+        return members
+
+    def plan(self, rows):
+        """Read every row of the roster before the first chunk is applied.
+
+        The rows of a member may fall in different chunks, whatever the chunk size. The plan holds
+        the names and full account set of each member with more than one row: the first chunk
+        holding such a member applies all of it and later chunks skip it, instead of each chunk
+        unlinking the accounts of the others. Members with one row are applied from their chunk.
+        """
+        self.planned = OrderedDict((phone_key, member) for phone_key, member in
+                                   self._members(rows, count=False).items() if member['rows'] > 1)
+
+    def dump_plan(self):
+        """Return the plan as JSON, for runs of the job after this one."""
+        return json.dumps([[phone_key, dict(member, account_ids=sorted(member['account_ids']))]
+                           for phone_key, member in self.planned.items()])
+
+    def load_plan(self, content):
+        self.planned = OrderedDict((phone_key, dict(member, account_ids=set(member['account_ids'])))
+                                   for phone_key, member in json.loads(content))
+
+    def mark_seen(self, rows):
+        """Remember the members of rows applied before a resume, without touching the database."""
+        self.seen_phone_keys.update(phone_key for phone_key, *_ in self._member_rows(rows, count=False))
+
+    def _existing(self, db, phone_keys):
+        """Load the stored members with these phone keys."""
+        existing = {}
+        for batch in _batches(phone_keys):
+            for sub in Subscriber.objects.db_manager(db).filter(phone_key__in=batch):
+                existing[sub.phone_key] = sub
+        return existing
+
+    def _account_ids(self, db, subs):
+        """Load the account ids of these members, limited to the scoped account if any."""
+        account_keys = defaultdict(set)
+        for batch in _batches(sub.id for sub in subs):
+            providers = Provider.objects.db_manager(db).filter(subscriber_id__in=batch)
+            if self.account_id is not None:
+                providers = providers.filter(account_key=Account.objects.key_for(self.account_id))
+            for subscriber_id, account_key in providers.values_list('subscriber_id', 'account_key'):
+                account_keys[subscriber_id].add(account_key)
+        names = Account.objects.account_ids_for({key for keys in account_keys.values() for key in keys})
+        account_ids = defaultdict(set)
+        for subscriber_id, keys in account_keys.items():
+            account_ids[subscriber_id] = {names[key] for key in keys}
+        return account_ids
+
+    def _link(self, db, sub, add, remove):
+        for account_id in sorted(add):
+            Provider.objects.create_provider(subscriber=sub, account_id=account_id)
+        if remove:
+            keys = Account.objects.keys_for(remove).values()
+            Provider.objects.db_manager(db).filter(subscriber_id=sub.id, account_key__in=keys).delete()
+        self.report['providers_added'] += len(add)
+        self.report['providers_removed'] += len(remove)
+
+    def _create(self, member):
+        sub = Subscriber.objects.create_subscriber(
+            first_name=member['first_name'], last_name=member['last_name'],
+            phone_number=member['phone_number'], client_member_id=member['client_member_id'])
+        self._link(sub._state.db, sub, member['account_ids'], ())
+        self.report['created'] += 1
+        return sub
+
+    def sync_rows(self, rows):
+        """Apply one chunk of roster rows."""
+        members = self._members(rows)
+        if self.planned is not None:
+            members = OrderedDict((phone_key, self.planned.get(phone_key, member))
+                                  for phone_key, member in members.items()
+                                  if phone_key not in self.seen_phone_keys)
+        self.seen_phone_keys.update(members)
+        # One query for the keys of the chunk's accounts that aren't cached yet.
+        Account.objects.keys_for({account_id for member in members.values() for account_id in member['account_ids']})
+        by_shard = defaultdict(list)
+        for phone_key, member in members.items():
+            by_shard[sharding.shard_for_phone(member['phone_number'])].append(phone_key)
+
+        for db, phone_keys in by_shard.items():
+            existing = self._existing(db, phone_keys)
+            changed = []
+            for phone_key in phone_keys:
+                member, sub = members[phone_key], existing.get(phone_key)
+                new_hash = content_hash(member['first_name'], member['last_name'], member['account_ids'])
+                if sub is None:
+                    try:
+                        with transaction.atomic(using=db):
+                            sub = self._create(member)
+                    except IntegrityError:  # the client member id belongs to another phone number
+                        self.report['conflicts'] += 1
+                        continue
+                    if self.account_id is None:
+                        Subscriber.objects.db_manager(sub._state.db).filter(pk=sub.pk).update(content_hash=new_hash)
+                elif sub.client_member_id != member['client_member_id']:
+                    self.report['conflicts'] += 1
+                elif self.account_id is None and sub.content_hash == new_hash:
+                    self.report['unchanged'] += 1
+                else:
+                    changed.append((member, sub, new_hash))
+
+            stored_accounts = self._account_ids(db, [sub for _, sub, _ in changed])
+            for member, sub, new_hash in changed:
+                names_changed = (sub.first_name, sub.last_name) != (member['first_name'], member['last_name'])
+                stored = stored_accounts[sub.id]
+                if not names_changed and stored == member['account_ids']:
+                    self.report['unchanged'] += 1
+                else:
+                    if names_changed:
+                        sub.first_name, sub.last_name = member['first_name'], member['last_name']
+                        sub.save()
+                    self._link(db, sub, member['account_ids'] - stored, stored - member['account_ids'])
+                    self.report['updated'] += 1
+                if self.account_id is None:
+                    Subscriber.objects.db_manager(db).filter(pk=sub.pk).update(content_hash=new_hash)
+
+    def remove_missing(self, chunk_size=None):
+        """Unlink the members of the scoped account that were not in the roster."""
+        if self.account_id is None:
+            return
+        chunk_size = chunk_size or settings.IMPORT_CHUNK_SIZE
+        account_key = Account.objects.key_for(self.account_id, create=False)
+        if account_key is None:
+            return
+        for db in sharding.subscriber_dbs():
+            last_id = 0
+            while True:
+                chunk = list(Provider.objects.db_manager(db).filter(account_key=account_key, id__gt=last_id)
+                             .order_by('id').values_list('id', 'subscriber__phone_key')[:chunk_size])
+                if not chunk:
+                    break
+                last_id = chunk[-1][0]
+                missing = [provider_id for provider_id, phone_key in chunk if phone_key not in self.seen_phone_keys]
+                if missing:
+                    Provider.objects.db_manager(db).filter(id__in=missing).delete()
+                    self.report['providers_removed'] += len(missing)
@@ -1,27 +1,23 @@
 from celery import shared_task
 import time
 import logging
-from members import settings
-from subscribers.models import Subscriber, Provider
-from django.db import IntegrityError
+import simplejson
+from members import settings, tracing
+from members.celery import app  # noqa binds the shared tasks to the project app
+from subscribers import imports, memory, sharding, stats
+from subscribers.models import Subscriber, Provider, ImportJob
+from subscribers.routers import use_primary
+from subscribers.sync import MemberSync
+from django.db import IntegrityError, transaction
 
-log = logging.getLogger('.'.join((settings.LOG_NAME.split('.')[0], __name__,)))
+# Chunks whose memory use an import job keeps.
+MEMORY_CHUNKS_KEPT = 100
 
-@shared_task
-def create_subscriber_patch(sub_list):
-    """Queue up tasks to upload the batch in sets of 10000 or less"""
-    shortened_list = sub_list
-    while len(sub_list) > 10000:
-        shortened_list = sub_list[10000:]
-        sub_list = sub_list[10000:]
-        create_patch(shortened_list)
-    create_patch(shortened_list)
-    return True
+log = logging.getLogger('.'.join((settings.LOG_NAME.split('.')[0], __name__,)))
 
 
-@shared_task
-def create_patch(sub_list):
-    """Create the members with their new information."""
+def _create_patch(sub_list):
+    """Create the members of one chunk of an import job, reading from the primary."""
     for member in sub_list:
         try:
             firstName, lastName, phone_number, client_member_id, account_id = member
@@ -30,21 +26,21 @@ def create_patch(sub_list):
             if None in (firstName, lastName, phone_number, client_member_id):
                 log.info("Missing member info, skipping line")
             else:
+                # Savepoints keep a skipped row from breaking the transaction of an import chunk.
+                db = sharding.shard_for_phone(phone_number)
                 try:
-                    sub_result = list(Subscriber.objects.filter(
-                        phone_number=phone_number, client_member_id=client_member_id))
-                    if sub_result:
-                        sub = sub_result[0]
+                    sub = Subscriber.objects.find_member(phone_number, client_member_id)
                     if not sub:
-                        sub = Subscriber.objects.create_subscriber(
-                            first_name=firstName, last_name=lastName,
-                            phone_number=phone_number, client_member_id=client_member_id
-                        )
-                        sub.save()
+                        with transaction.atomic(using=db):
+                            sub = Subscriber.objects.create_subscriber(
+                                first_name=firstName, last_name=lastName,
+                                phone_number=phone_number, client_member_id=client_member_id
+                            )
+                    if not account_id:
+                        continue  # a member exported without providers
                     try:
-                        provider = Provider.objects.create_provider(subscriber=sub,
-                                                                    account_id=str(account_id))
-                        provider.save()
+                        with transaction.atomic(using=db):
+                            Provider.objects.create_provider(subscriber=sub, account_id=str(account_id))
                     except IntegrityError:
                         log.info("Provider and subscriber combo already exists, skipping.")
                         pass
@@ -55,6 +51,143 @@ def create_patch(sub_list):
             log.info("found exception {}".format(str(e)))
             pass
 
-    return True
 
+# Tasks that took their rows in the message, before uploads became import jobs. They hand rows
+# still waiting in the broker to an import job. Remove them in the release after the next one.
+@shared_task
+def create_subscriber_patch(sub_list):
+    """Deprecated, import the rows through an import job."""
+    return _import_rows(sub_list, ImportJob.CREATE)
+
+
+@shared_task
+def create_patch(sub_list):
+    """Deprecated, import the rows through an import job."""
+    return _import_rows(sub_list, ImportJob.CREATE)
+
+
+@shared_task
+def sync_subscriber_patch(sub_list, account_id=None):
+    """Deprecated, sync the rows through an import job."""
+    return _import_rows(sub_list, ImportJob.SYNC, account_id)
+
+
+def _import_rows(sub_list, mode, account_id=None):
+    job = imports.create_job(sub_list, mode=mode, account_id=account_id or '')
+    log.info("Queued import job {} for {} rows of a deprecated import task".format(job.id, len(sub_list)))
+    run_import_job.delay(job.id)
+    return job.id
+
+
+def _import_pause(start, rows_applied):
+    """Return how long a run of an import job should wait before its next chunk, None to go on."""
+    elapsed = time.time() - start
+    if settings.IMPORT_ROWS_PER_SECOND:
+        wait = rows_applied / settings.IMPORT_ROWS_PER_SECOND - elapsed
+        if wait > 0:
+            return wait
+    if rows_applied and elapsed >= settings.IMPORT_TASK_SECONDS:
+        return 0
+    return None
+
+
+def _shrink_chunks(job_id):
+    """Split the chunks a job has left into smaller ones, return the new chunk size or None."""
+    with transaction.atomic():
+        job = ImportJob.objects.select_for_update().get(pk=job_id)
+        chunk_size = memory.smaller_chunk_size(job.chunk_size)
+        if chunk_size is None:
+            return None
+        job.next_chunk *= job.chunk_size // chunk_size
+        job.chunk_size = chunk_size
+        job.save(update_fields=['chunk_size', 'next_chunk', 'updated_at'])
+    return chunk_size
+
+
+@shared_task(acks_late=True, reject_on_worker_lost=True)
+def run_import_job(job_id):
+    """Apply an import job from its checkpoint on, see subscribers/imports.py.
 
+    The task is acknowledged once it finishes, so the broker hands it to another worker if this one
+    dies and the job carries on from the last committed chunk. After IMPORT_TASK_SECONDS, or once
+    it is ahead of IMPORT_ROWS_PER_SECOND, the task queues itself again and frees the worker, so
+    the chunks of other uploads get their turn in between. It does the same with smaller chunks
+    once the process is over IMPORT_MEMORY_BUDGET_MB, which also gets the process replaced. At
+    IMPORT_MIN_CHUNK_SIZE it carries on instead. The sync plan is made by the first run only.
+    """
+    start = time.time()
+    rows_applied = 0
+    job = ImportJob.objects.get(pk=job_id)
+    if job.status == ImportJob.DONE:
+        return job.status
+    ImportJob.objects.filter(pk=job_id).update(status=ImportJob.RUNNING, error='')
+    report = simplejson.loads(job.report)
+    member_sync = MemberSync(job.account_id or None, report) if job.mode == ImportJob.SYNC else None
+    if member_sync:
+        plan = imports.read_plan(job)
+        if plan is None:
+            member_sync.plan(row for _, rows in imports.iter_chunks(job) for row in rows)
+            imports.save_plan(job, member_sync.dump_plan())
+        else:
+            member_sync.load_plan(plan)
+    chunk_memory = memory.ChunkMemory()
+    at_min_chunk_size = False
+    memory_log = simplejson.loads(job.memory)
+    try:
+        with use_primary():
+            for index, rows in imports.iter_chunks(job):
+                if index < job.next_chunk:
+                    if member_sync:
+                        member_sync.mark_seen(rows)
+                    continue
+                pause = _import_pause(start, rows_applied)
+                if pause is not None:
+                    run_import_job.apply_async((job_id,), countdown=pause)
+                    log.info("Import job {} paused at chunk {} of {} for {:.1f}s".format(
+                        job_id, index + 1, job.total_chunks, pause))
+                    return job.status
+                chunk_memory.start_chunk()
+                with tracing.span('import chunk', index=index, rows=len(rows)), \
+                        transaction.atomic(), stats.batch():
+                    # Another run of the job got past this chunk, leave the rest to it.
+                    job = ImportJob.objects.select_for_update().get(pk=job_id)
+                    if job.next_chunk != index:
+                        return job.status
+                    if member_sync:
+                        member_sync.sync_rows(rows)
+                        report = member_sync.report
+                    else:
+                        _create_patch(rows)
+                        report['rows'] = report.get('rows', 0) + len(rows)
+                    job.next_chunk = index + 1
+                    job.report = simplejson.dumps(report)
+                    memory_log = (memory_log + [chunk_memory.measure(index, len(rows))])[-MEMORY_CHUNKS_KEPT:]
+                    job.memory = simplejson.dumps(memory_log)
+                    job.save(update_fields=['next_chunk', 'report', 'memory', 'updated_at'])
+                rows_applied += len(rows)
+                log.info("Import job {} committed chunk {} of {}".format(job_id, index + 1, job.total_chunks))
+                if chunk_memory.over_budget() and job.next_chunk < job.total_chunks and not at_min_chunk_size:
+                    chunk_size = _shrink_chunks(job_id)
+                    if chunk_size is not None:
+                        run_import_job.apply_async((job_id,))
+                        log.info("Import job {} over its memory budget at {:.0f}MB, continuing with chunks of {}".format(
+                            job_id, memory.rss_mb(), chunk_size))
+                        return job.status
+                    # Smaller chunks won't help, carry on here rather than requeue after every chunk.
+                    at_min_chunk_size = True
+                    log.warning("Import job {} over its memory budget at {:.0f}MB with chunks of {}".format(
+                        job_id, memory.rss_mb(), job.chunk_size))
+            if member_sync:
+                with stats.batch():
+                    member_sync.remove_missing()
+                job.report = simplejson.dumps(member_sync.report)
+    except Exception as e:
+        ImportJob.objects.filter(pk=job_id).update(status=ImportJob.FAILED, error=str(e))
+        raise
+    finally:
+        chunk_memory.stop()
+    job.status = ImportJob.DONE
+    job.save(update_fields=['status', 'report', 'updated_at'])
+    imports.delete_rows_file(job)
+    log.info("Import job {} finished in {:.1f}s: {}".format(job_id, time.time() - start, job.report))
+    return job.status
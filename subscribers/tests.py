@@ -1,3 +1,776 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from types import SimpleNamespace
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import IntegrityError, close_old_connections, transaction
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management import call_command
+from django.core.signals import request_finished, request_started
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from members import metrics, static, tracing
+from members.handlers import APIDispatcher
+from subscribers import connections, imports, memory, routers, sharding, snapshot, stats, throttle
+from subscribers.changes import changes_since
+from subscribers.coalesce import coalesce
+from subscribers.export import CSV_DIALECT, export_members
+from subscribers.phone import normalize_phone
+from subscribers.preflight import Preflight
+from subscribers.management.commands.rebalance_shards import ShardRebalancer
+from subscribers.models import Subscriber, Provider, Account, AccountStats, Change, ImportJob, MemberLocation
+from subscribers import tasks
+from subscribers.tasks import run_import_job
+from subscribers.views import create_member
+
+
+class ImportTestCase(TestCase):
+    """Runs import jobs against a temporary IMPORT_ROOT."""
+
+    def setUp(self):
+        self.import_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.import_root)
+        settings_override = override_settings(IMPORT_ROOT=self.import_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def run_job(self, rows, mode=ImportJob.CREATE, account_id='', chunk_size=1):
+        job = imports.create_job(rows, mode=mode, account_id=account_id, chunk_size=chunk_size)
+        run_import_job(job.id)
+        job.refresh_from_db()
+        return job
+
+
+class PreflightTest(TestCase):
+
+    def test_reasons(self):
+        rows = [
+            ['Ann', 'Lee', '5555550102', 'al1', 'acc1'],
+            ['Ann', 'Lee', '(555) 555-0102', 'al1', 'acc2'],
+            ['Ann', 'Lee', '5555550102', 'al1', 'acc1'],
+            ['Bob', 'Lee', '5555550102', 'bl1', 'acc1'],
+            ['Ann', 'Lee', '5555550103', 'al1', 'acc1'],
+            ['Cy', 'Lee', 'not a number', 'cl1', 'acc1'],
+        ]
+        preflight = Preflight()
+        self.assertEqual(list(preflight.check(rows)), rows[:2])
+        self.assertEqual(preflight.report['reasons'], {
+            'duplicate_row': 1, 'phone_number_conflict': 1, 'client_member_id_conflict': 1,
+            'invalid_phone_number': 1})
+
+    def test_hash_collisions(self):
+        # Every value hashing alike, distinct members and pairs still pass.
+        rows = [['Ann', 'Lee', '5555550102', 'al1', 'acc1'], ['Ann', 'Lee', '5555550102', 'al1', 'acc2'],
+                ['Bob', 'Lee', '5555550103', 'bl1', 'acc1']]
+        preflight = Preflight()
+        with mock.patch('builtins.hash', return_value=0):
+            self.assertEqual(list(preflight.check(rows)), rows)
+
+
+class ImportResumeTest(ImportTestCase):
+    rows = [['Resume', 'Check{}'.format(i), '55501{:05d}'.format(i), 'rc{}'.format(i), account_id]
+            for i in range(10) for account_id in ('acc1', 'acc2')]
+
+    def test_resume_create(self):
+        job = imports.create_job(self.rows, chunk_size=4)
+        real_create_patch = tasks._create_patch
+        calls = []
+
+        def create_patch(rows):
+            calls.append(rows)
+            if len(calls) == 3:
+                raise RuntimeError('worker died')
+            real_create_patch(rows)
+
+        with mock.patch.object(tasks, '_create_patch', create_patch), self.assertRaises(RuntimeError):
+            run_import_job(job.id)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.next_chunk, job.error), (ImportJob.FAILED, 2, 'worker died'))
+        # The failed chunk rolled back with its checkpoint.
+        self.assertEqual(Provider.objects.count(), 8)
+
+        run_import_job(job.id)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.DONE)
+        self.assertEqual(json.loads(job.report)['rows'], 20)
+        self.assertEqual(Subscriber.objects.count(), 10)
+        self.assertEqual(Provider.objects.count(), 20)
+
+    def test_resume_sync(self):
+        job = imports.create_job(self.rows, mode=ImportJob.SYNC, account_id='acc1', chunk_size=3)
+        real_sync_rows = tasks.MemberSync.sync_rows
+        calls = []
+
+        def sync_rows(member_sync, rows):
+            calls.append(rows)
+            if len(calls) == 3:
+                raise RuntimeError('worker died')
+            real_sync_rows(member_sync, rows)
+
+        with mock.patch.object(tasks.MemberSync, 'sync_rows', sync_rows), self.assertRaises(RuntimeError):
+            run_import_job(job.id)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.next_chunk), (ImportJob.FAILED, 2))
+
+        run_import_job(job.id)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.DONE)
+        self.assertEqual(Subscriber.objects.count(), 10)
+        # Scoped to acc1, the members resumed past are not unlinked as missing from the roster.
+        self.assertEqual(sorted(provider.account_id for provider in Provider.objects.all()), ['acc1'] * 10)
+        self.assertEqual(json.loads(job.report).get('providers_removed', 0), 0)
+
+
+class DeprecatedTaskTest(ImportTestCase):
+
+    def test_rows_in_the_message(self):
+        rows = [['Ann', 'Lee', '5555550102', 'al1', 'acc1'], ['Bob', 'Lee', '5555550103', 'bl1', 'acc1']]
+        with mock.patch.object(tasks.run_import_job, 'delay', side_effect=run_import_job):
+            job_id = tasks.create_patch(rows)
+            tasks.sync_subscriber_patch(rows[:1], 'acc1')
+        self.assertEqual(ImportJob.objects.get(pk=job_id).status, ImportJob.DONE)
+        self.assertEqual(ImportJob.objects.filter(mode=ImportJob.SYNC, account_id='acc1').count(), 1)
+        self.assertEqual(sorted(Subscriber.objects.values_list('client_member_id', flat=True)), ['al1', 'bl1'])
+        # The sync scoped to acc1 unlinked bl1, missing from its roster.
+        self.assertEqual(list(Provider.objects.values_list('subscriber__client_member_id', flat=True)), ['al1'])
+
+
+class ChunkMemoryTest(ImportTestCase):
+
+    @override_settings(IMPORT_TRACEMALLOC=True)
+    def test_tracemalloc_without_reset_peak(self):
+        # Python before 3.9
+        old_tracemalloc = SimpleNamespace(**{name: getattr(tracemalloc, name) for name in dir(tracemalloc)
+                                             if name != 'reset_peak' and not name.startswith('_')})
+        with mock.patch.object(memory, 'tracemalloc', old_tracemalloc):
+            job = self.run_job([['Ann', 'Lee', '5555550102', 'al1', 'acc1']])
+        self.assertEqual(job.status, ImportJob.DONE)
+        self.assertIn('traced_peak_mb', json.loads(job.memory)[0])
+        self.assertFalse(tracemalloc.is_tracing())
+
+
+class MemoryBudgetTest(ImportTestCase):
+    rows = [['Ann', 'Lee{}'.format(i), '55501{:05d}'.format(i), 'al{}'.format(i), account_id]
+            for i in range(10) for account_id in ('acc1', 'acc2')]
+
+    @override_settings(IMPORT_MEMORY_BUDGET_MB=1, IMPORT_MIN_CHUNK_SIZE=2)
+    def test_over_budget(self):
+        job = imports.create_job(self.rows, mode=ImportJob.SYNC, chunk_size=8)
+        with mock.patch.object(tasks.run_import_job, 'apply_async',
+                               side_effect=lambda args, **kwargs: run_import_job(*args)) as requeue, \
+                mock.patch.object(tasks.MemberSync, 'plan', autospec=True, side_effect=tasks.MemberSync.plan) as plan:
+            run_import_job(job.id)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.chunk_size), (ImportJob.DONE, 2))
+        # 8 to 4 to 2 rows a chunk, then on in the same run.
+        self.assertEqual(requeue.call_count, 2)
+        self.assertEqual(plan.call_count, 1)
+        self.assertEqual(json.loads(job.report)['created'], 10)
+        self.assertEqual(Provider.objects.count(), 20)
+        self.assertFalse(os.listdir(self.import_root))
+
+
+class SyncImportTest(ImportTestCase):
+    rows = [
+        ['Sam', 'Xu', '5555550101', 'sx1', 'accA'],
+        ['Sam', 'Xu', '5555550101', 'sx1', 'accB'],
+    ]
+
+    def account_ids(self, client_member_id):
+        sub = Subscriber.objects.get(client_member_id=client_member_id)
+        return sorted(provider.account_id for provider in Provider.objects.filter(subscriber=sub))
+
+    def test_member_spanning_chunks(self):
+        job = self.run_job(self.rows, mode=ImportJob.SYNC)
+        self.assertEqual(job.status, ImportJob.DONE)
+        self.assertEqual(self.account_ids('sx1'), ['accA', 'accB'])
+        report = imports.job_data(job)['report']
+        self.assertEqual(report['created'], 1)
+        self.assertEqual(report.get('providers_removed', 0), 0)
+
+        job = self.run_job(self.rows, mode=ImportJob.SYNC)
+        report = imports.job_data(job)['report']
+        self.assertEqual(report['unchanged'], 1)
+        self.assertEqual(report.get('updated', 0), 0)
+        self.assertEqual(report.get('providers_removed', 0), 0)
+        self.assertEqual(self.account_ids('sx1'), ['accA', 'accB'])
+        self.assertFalse(Change.objects.filter(action=Change.DELETED).exists())
+
+
+class APIHandlerTest(TestCase):
+
+    def setUp(self):
+        # As the test client does, keep the test's connection open across the requests.
+        for signal in (request_started, request_finished):
+            signal.disconnect(close_old_connections)
+            self.addCleanup(signal.connect, close_old_connections)
+        self.middleware = list(settings.MIDDLEWARE)
+        self.application = APIDispatcher(WSGIHandler())
+
+    def call(self, path):
+        environ = RequestFactory().get(path, HTTP_COOKIE='sessionid=abc; csrftoken=def').environ
+        started = []
+        response = self.application(environ, lambda status, headers: started.append((status, headers)))
+        response.close()
+        response_status, headers = started[0]
+        cookies = ' '.join(value for name, value in headers if name == 'Set-Cookie')
+        return response_status, dict(headers), cookies
+
+    def test_api_skips_session_and_csrf(self):
+        response_status, headers, cookies = self.call(reverse('metrics'))
+        self.assertTrue(response_status.startswith('200'))
+        self.assertEqual(cookies, '')
+        self.assertNotIn('Cookie', headers.get('Vary', ''))
+        self.assertNotIn('X-Frame-Options', headers)
+        # Building the API chain leaves the site's middleware alone.
+        self.assertEqual(settings.MIDDLEWARE, self.middleware)
+        self.assertIn('csrftoken', self.client.get('/admin/login/').cookies)
+
+    def test_site_keeps_them(self):
+        for path in ('/admin/login/', '/api/generate_sub_batch/'):
+            response_status, headers, cookies = self.call(path)
+            self.assertTrue(response_status.startswith('200'), path)
+            self.assertIn('csrftoken=', cookies, path)
+            self.assertIn('Cookie', headers['Vary'], path)
+
+
+class ConnectionHealthTest(TestCase):
+
+    @override_settings(DB_CONN_HEALTH_CHECK_AFTER=60)
+    def test_idle_connections_are_checked(self):
+        Account.objects.exists()
+        metrics.reset()
+        connections.mark_connections_used()
+        connections.check_connections()
+        self.assertNotIn('db.connections.health_check', metrics.snapshot()['timers'])
+        with mock.patch('subscribers.connections.time.time', return_value=time.time() + 120):
+            connections.check_connections()
+        counters = metrics.snapshot()['counters']
+        # Every open connection is reused twice and checked the second time only.
+        checked = counters['db.connections.health_checks']
+        self.assertEqual(counters['db.connections.reused'], 2 * checked)
+        self.assertEqual(metrics.snapshot()['timers']['db.connections.health_check']['count'], checked)
+        self.assertNotIn('db.connections.stale', counters)
+
+
+class PhoneKeyTest(TestCase):
+
+    def test_normalize(self):
+        for phone_number in ('+1 (667) 016-1365', '001 667 016 1365', '6670161365', '16670161365'):
+            self.assertEqual(normalize_phone(phone_number), 16670161365)
+        self.assertIsNone(normalize_phone('no digits'))
+        self.assertIsNone(normalize_phone('1234567890123456'))
+
+    def test_lookup_in_any_formatting(self):
+        create_member('Ann', 'Lee', '+1 (555) 555-0102', 'al1', ['acc1'])
+        self.assertEqual(Subscriber.objects.get().phone_key, 15555550102)
+        response = self.client.get(reverse('get_member_by_phone', args=('15555550102',)))
+        self.assertEqual(json.loads(response.content)['providers'], ['acc1'])
+        # The same member sent with other formatting gets the new provider, not a second row.
+        create_member('Ann', 'Lee', '555.555.0102', 'al1', ['acc2'])
+        self.assertEqual(Subscriber.objects.count(), 1)
+        self.assertEqual(Subscriber.objects.get_by_phone_number('5555550102').providers.count(), 2)
+
+
+class SearchTest(TestCase):
+
+    def setUp(self):
+        for index, (first_name, last_name) in enumerate((('Ann', 'Lee'), ('Bob', 'Leeds'), ('Cal', 'Lee'),
+                                                        ('Dee', 'Moss'))):
+            create_member(first_name, last_name, '555555010{}'.format(index), 'cm{}'.format(index), ['acc1'])
+
+    def search(self, **params):
+        response = self.client.get(reverse('search_members'), params)
+        return response.status_code, json.loads(response.content)
+
+    def test_name_prefix_pages(self):
+        names, cursor = [], None
+        while True:
+            params = {'last_name': 'LEE', 'limit': 2}
+            if cursor:
+                params['cursor'] = cursor
+            response_status, data = self.search(**params)
+            self.assertEqual(response_status, 200)
+            names.extend(member['member'] for member in data['results'])
+            cursor = data['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(len(names), 3)
+        self.assertFalse([name for name in names if 'Moss' in name])
+
+    def test_phone_suffix_and_name(self):
+        response_status, data = self.search(phone_suffix='0102')
+        self.assertEqual((response_status, len(data['results'])), (200, 1))
+        self.assertIn('Cal', data['results'][0]['member'])
+        self.assertEqual(self.search(phone_suffix='0102', first_name='a')[1]['results'], [])
+
+    def test_admin_search(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        for term, expected in (('lee', ['Ann', 'Bob', 'Cal']), ('0103', ['Dee']), ('cm1', ['Bob'])):
+            response = self.client.get(reverse('admin:subscribers_subscriber_changelist'), {'q': term})
+            self.assertEqual(sorted(sub.first_name for sub in response.context['cl'].result_list), expected)
+
+    def test_bad_terms(self):
+        self.assertEqual(self.search()[0], 400)
+        self.assertEqual(self.search(last_name='Lee', cursor='not a cursor')[0], 400)
+
+
+class ExportTest(TestCase):
+
+    def setUp(self):
+        create_member('Ann', 'Lee', '5555550102', 'al1', ['acc1', 'acc2'])
+        create_member('Bob', 'Lee', '5555550103', 'bl1', ['acc1'])
+        create_member('Cal', 'Lee', '5555550104', 'cl1', [])
+
+    def test_csv_in_import_format(self):
+        response = self.client.get(reverse('export_members', args=('csv',)))
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertEqual(sorted(csv.reader(io.StringIO(content), **CSV_DIALECT)), [
+            ['Ann', 'Lee', '5555550102', 'al1', 'acc1'],
+            ['Ann', 'Lee', '5555550102', 'al1', 'acc2'],
+            ['Bob', 'Lee', '5555550103', 'bl1', 'acc1'],
+            ['Cal', 'Lee', '5555550104', 'cl1', ''],
+        ])
+
+    def test_ndjson_of_one_account(self):
+        response = self.client.get(reverse('export_members', args=('ndjson',)), {'account_id': 'acc2'})
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual([json.loads(line) for line in lines], [{
+            'first_name': 'Ann', 'last_name': 'Lee', 'phone_number': '5555550102', 'client_member_id': 'al1',
+            'providers': ['acc2']}])
+        self.assertEqual(list(export_members('ndjson', account_id='unknown')), [])
+
+    def test_chunks(self):
+        chunks = list(export_members('ndjson', chunk_size=2))
+        self.assertEqual([chunk.count('\n') for chunk in chunks], [2, 1])
+
+
+class AccountStatsTest(TestCase):
+
+    def counts(self, *account_ids):
+        response = self.client.get(reverse('account_stats'), {'account_id': ','.join(account_ids)})
+        return {account['account_id']: account['members'] for account in json.loads(response.content)['accounts']}
+
+    def test_counts_follow_providers(self):
+        create_member('Ann', 'Lee', '5555550102', 'al1', ['acc1', 'acc2'])
+        create_member('Bob', 'Lee', '5555550103', 'bl1', ['acc1'])
+        # Adding a provider the member already has changes nothing.
+        create_member('Bob', 'Lee', '5555550103', 'bl1', ['acc1'])
+        self.assertEqual(self.counts('acc1', 'acc2', 'acc3'), {'acc1': 2, 'acc2': 1, 'acc3': 0})
+        Provider.objects.for_account('acc1')[0].delete()
+        self.assertEqual(self.counts('acc1', 'acc2'), {'acc1': 1, 'acc2': 1})
+
+    def test_batch_writes_once_per_account(self):
+        with stats.batch():
+            create_member('Ann', 'Lee', '5555550102', 'al1', ['acc1'])
+            create_member('Bob', 'Lee', '5555550103', 'bl1', ['acc1'])
+            self.assertFalse(AccountStats.objects.exists())
+        self.assertEqual(AccountStats.objects.get(account_id='acc1').member_count, 2)
+
+    def test_rebuild(self):
+        create_member('Ann', 'Lee', '5555550102', 'al1', ['acc1'])
+        AccountStats.objects.update(member_count=7)
+        call_command('rebuild_account_stats', stdout=io.StringIO())
+        self.assertEqual(self.counts('acc1'), {'acc1': 1})
+
+
+class CoalesceTest(TestCase):
+
+    def setUp(self):
+        self.addCleanup(routers.unpin)
+
+    def test_concurrent_lookups_share_one_fetch(self):
+        release, waiting = threading.Event(), threading.Event()
+        fetches, results = [], []
+
+        def fetch():
+            fetches.append(1)
+            release.wait(5)
+            return 'members'
+
+        def incr(name, value=1):
+            if name == 'coalesce.shared':
+                waiting.set()
+
+        def lookup():
+            results.append(coalesce('account:acc1', fetch))
+
+        with mock.patch('subscribers.coalesce.metrics.incr', side_effect=incr):
+            leader = threading.Thread(target=lookup)
+            leader.start()
+            follower = threading.Thread(target=lookup)
+            follower.start()
+            self.assertTrue(waiting.wait(5))
+            release.set()
+            leader.join(5)
+            follower.join(5)
+        self.assertEqual((len(fetches), results), (1, ['members', 'members']))
+        # Nothing is kept once the fetch is done.
+        self.assertEqual(coalesce('account:acc1', lambda: 'again'), 'again')
+
+    def test_errors_reach_the_caller(self):
+        def fetch():
+            raise RuntimeError('database down')
+        with self.assertRaises(RuntimeError):
+            coalesce('account:acc1', fetch)
+        self.assertEqual(coalesce('account:acc1', lambda: 'members'), 'members')
+
+    def test_lookup_response(self):
+        create_member('Ann', 'Lee', '5555550102', 'al1', ['acc1'])
+        routers.unpin()
+        response = self.client.get(reverse('get_members_by_acc_id', args=('acc1',)))
+        self.assertEqual([member['providers'] for member in json.loads(response.content)], [['acc1']])
+        self.assertEqual(self.client.get(reverse('get_member_by_client_id', args=('nobody',))).status_code, 404)
+
+
+class WorkerQueueTest(TestCase):
+
+    def run_worker(self, queue):
+        with mock.patch('members.celery.app.worker_main') as worker_main:
+            call_command('run_worker', queue)
+        argv = worker_main.call_args[0][0]
+        return argv[argv.index('--queues') + 1]
+
+    def test_queues(self):
+        self.assertEqual(self.run_worker('interactive'), 'interactive,celery')
+        self.assertEqual(self.run_worker('bulk'), 'bulk')
+        with override_settings(WORKER_QUEUE_OPTIONS=dict(settings.WORKER_QUEUE_OPTIONS, interactive=dict(
+                settings.WORKER_QUEUE_OPTIONS['interactive'], legacy_queues=[]))):
+            self.assertEqual(self.run_worker('interactive'), 'interactive')
+
+    def test_routes(self):
+        from members.celery import app
+        self.assertEqual(app.amqp.router.route({}, 'subscribers.tasks.run_import_job')['queue'].name, 'bulk')
+        self.assertEqual(app.amqp.router.route({}, 'subscribers.tasks.create_patch')['queue'].name, 'interactive')
+
+
+class AccountAdminTest(TestCase):
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        self.account = Account.objects.create(account_id='acc1')
+
+    def test_read_only(self):
+        self.assertEqual(self.client.get(reverse('admin:subscribers_account_add')).status_code, 403)
+        self.assertEqual(self.client.get(
+            reverse('admin:subscribers_account_delete', args=(self.account.id,))).status_code, 403)
+        self.client.post(reverse('admin:subscribers_account_change', args=(self.account.id,)),
+                         {'account_id': 'renamed'})
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.account_id, 'acc1')
+
+    def test_provider_form(self):
+        sub = Subscriber.objects.create_subscriber('Ann', 'Lee', '5555550102', 'al1')
+        add_url = reverse('admin:subscribers_provider_add')
+        response = self.client.post(add_url, {'subscriber': sub.id + 1, 'account_id': 'acc2'})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Account.objects.filter(account_id='acc2').exists())
+        response = self.client.post(add_url, {'subscriber': sub.id, 'account_id': 'acc2'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual([str(provider) for provider in sub.providers.all()], ['acc2'])
+
+    def test_provider_of_missing_account(self):
+        sub = Subscriber.objects.create_subscriber('Ann', 'Lee', '5555550102', 'al1')
+        provider = Provider.objects.create(subscriber=sub, account_key=self.account.id + 1)
+        self.assertEqual(str(provider), '')
+
+
+class StaticFilesTest(TestCase):
+
+    def setUp(self):
+        self.static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.static_root)
+        settings_override = override_settings(STATIC_ROOT=self.static_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def get(self, url):
+        request = RequestFactory().get(url, HTTP_ACCEPT_ENCODING='gzip')
+        return static.serve(request, url[len(settings.STATIC_URL):], document_root=self.static_root)
+
+    def test_before_collectstatic(self):
+        url = staticfiles_storage.url('admin/css/base.css')
+        self.assertEqual(url, '/static/admin/css/base.css')
+        response = self.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('immutable', response['Cache-Control'])
+
+    def test_after_collectstatic(self):
+        call_command('collectstatic', interactive=False, verbosity=0)
+        url = staticfiles_storage.url('admin/css/base.css')
+        self.assertRegex(url, r'^/static/admin/css/base\.[0-9a-f]{12}\.css$')
+        response = self.get(url)
+        self.assertEqual((response.status_code, response['Content-Encoding']), (200, 'gzip'))
+        self.assertIn('immutable', response['Cache-Control'])
+
+
+class StartupTest(TestCase):
+
+    def test_import_skips_celery(self):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import members'], cwd=settings.BASE_DIR,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+        imported = [line.rsplit('|', 1)[-1].strip() for line in result.stderr.splitlines() if '|' in line]
+        self.assertIn('members', imported)
+        self.assertFalse([name for name in imported if name.split('.')[0] in ('celery', 'kombu')])
+
+    def test_lazy_attributes(self):
+        import members
+        from members.celery import app
+        self.assertIs(members.celery_app, app)
+        self.assertTrue(members.__version__)
+        with self.assertRaises(AttributeError):
+            members.missing
+
+
+class SnapshotTest(TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'members.snap')
+        settings_override = override_settings(MEMBER_SNAPSHOT_PATH=path)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        snapshot._checked_at = 0.0
+        self.addCleanup(setattr, snapshot, '_snapshot', None)
+
+        create_member('Ann', 'Lee', '5555550102', 'al1', ['acc1'])
+        snapshot.build(path)
+        routers.unpin()
+
+    def get(self, **extra):
+        return json.loads(self.client.get(reverse('get_member_by_client_id', args=('al1',)), **extra).content)
+
+    def test_read_your_writes(self):
+        self.assertEqual(snapshot.find_by_client_member_id('al1')['providers'], ['acc1'])
+        response = self.client.post(reverse('create_member'), {
+            'first_name': 'Ann', 'last_name': 'Lee', 'phone_number': '5555550102', 'client_member_id': 'al1',
+            'provider_info': ['acc2']}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        # Pinned to the primary by the write, the client reads it back.
+        self.assertEqual(sorted(self.get()['providers']), ['acc1', 'acc2'])
+        # Other clients keep being served from the snapshot.
+        self.client.cookies.clear()
+        self.assertEqual(self.get()['providers'], ['acc1'])
+
+
+class LoadProtectionTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        patcher = mock.patch.object(throttle, 'load', throttle._Load())
+        self.load = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get(self, url='/api/get_members_by_acc_id/acc1/'):
+        return self.client.get(url)
+
+    @override_settings(THROTTLE_ENDPOINT_RATES={'get_members_by_acc_id': (1, 2)})
+    def test_endpoint_rate(self):
+        self.assertEqual([self.get().status_code for _ in range(3)], [200, 200, 429])
+        self.assertEqual(self.get()['Retry-After'], '1')
+        # Other endpoints and other clients have buckets of their own.
+        self.assertEqual(self.get('/api/get_member_by_client_id/al1/').status_code, 404)
+        self.assertEqual(self.client.get('/api/get_members_by_acc_id/acc1/', REMOTE_ADDR='10.0.0.2').status_code, 200)
+
+    @override_settings(THROTTLE_CLIENT_RATE=1, THROTTLE_CLIENT_BURST=1)
+    def test_client_rate(self):
+        self.assertEqual([self.get().status_code for _ in range(2)], [200, 429])
+        self.assertEqual(self.get('/api/metrics/').status_code, 200)
+
+    def test_endpoint_rates_opt_in(self):
+        self.assertEqual(settings.THROTTLE_ENDPOINT_RATES, {})
+        self.assertEqual({self.get().status_code for _ in range(30)}, {200})
+
+    @override_settings(SHED_MAX_IN_FLIGHT=2)
+    def test_shed_in_flight(self):
+        self.load.in_flight = 2
+        response = self.get()
+        self.assertEqual((response.status_code, response['Retry-After']), (503, '1'))
+        self.assertEqual(self.get('/api/metrics/').status_code, 200)
+        self.load.in_flight = 0
+        self.assertEqual(self.get().status_code, 200)
+
+    @override_settings(SHED_MAX_QUERY_MS=500, SHED_MIN_QUERIES=20, SHED_LATENCY_WINDOW=5)
+    def test_one_slow_query(self):
+        self.load.record_query(0.6)
+        self.assertIsNone(self.load.shed_reason())
+        self.assertEqual(self.get().status_code, 200)
+
+    @override_settings(SHED_MAX_QUERY_MS=500, SHED_MIN_QUERIES=20, SHED_LATENCY_WINDOW=5)
+    def test_shed_slow_queries(self):
+        now = time.time()
+        with mock.patch('subscribers.throttle.time.time', return_value=now):
+            for _ in range(20):
+                self.load.record_query(0.6)
+            self.assertEqual(self.load.shed_reason(), 'query_latency')
+            self.assertEqual(self.get().status_code, 503)
+        # No query runs while shedding, the slow ones age out of the window.
+        with mock.patch('subscribers.throttle.time.time', return_value=now + 6):
+            self.assertIsNone(self.load.shed_reason())
+            self.assertEqual(self.get().status_code, 200)
+
+
+class TracingTest(TestCase):
+    traceparent = '00-{}-{}-01'.format('a' * 32, 'b' * 16)
+
+    def setUp(self):
+        self.trace_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.trace_dir)
+        settings_override = override_settings(TRACE_DIR=self.trace_dir, TRACE_SAMPLE_RATE=0, TRACE_TOKEN='secret')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def get(self, **headers):
+        middleware = tracing.TracingMiddleware(lambda request: HttpResponse())
+        return middleware(RequestFactory().get('/api/members/', HTTP_TRACEPARENT=self.traceparent, **headers))
+
+    def test_traceparent_needs_token(self):
+        self.assertNotIn('X-Trace-Id', self.get())
+        self.assertNotIn('X-Trace-Id', self.get(HTTP_X_TRACE_TOKEN='guess'))
+        self.assertFalse(os.listdir(self.trace_dir))
+        self.assertEqual(self.get(HTTP_X_TRACE_TOKEN='secret')['X-Trace-Id'], 'a' * 32)
+        self.assertEqual([event['args']['parent_id'] for event in tracing.read_events(self.trace_dir)], ['b' * 16])
+
+    @override_settings(TRACE_FILE_MAX_MB=1, TRACE_FILE_BACKUPS=1)
+    def test_rotation(self):
+        for index in range(3):
+            tracing._write([{'name': str(index), 'args': {'padding': 'x' * 1024 * 1024}}])
+        self.assertEqual(sorted(os.listdir(self.trace_dir)),
+                         ['trace-{}.1.json'.format(os.getpid()), 'trace-{}.json'.format(os.getpid())])
+        self.assertEqual([event['name'] for event in tracing.read_events(self.trace_dir)], ['1', '2'])
+
+
+class ChangeFeedTest(TestCase):
+
+    def test_created(self):
+        create_member('Ann', 'Lee', '5555550102', 'al1', ['acc1'])
+        self.assertEqual([(change['entity'], change['action']) for change in changes_since()['changes']],
+                         [(Change.SUBSCRIBER, Change.CREATED), (Change.PROVIDER, Change.CREATED)])
+
+    def test_holds_back_at_gap(self):
+        create_member('Ann', 'Lee', '5555550102', 'al1', ['acc1', 'acc2'])
+        first, missing, last = Change.objects.order_by('seq')
+        # As if the change in the middle belonged to a transaction that has not committed yet.
+        missing.delete()
+        feed = changes_since()
+        self.assertEqual([change['seq'] for change in feed['changes']], [first.seq])
+        self.assertEqual((feed['next_cursor'], feed['has_more']), (first.seq, False))
+        self.assertEqual(changes_since(first.seq)['changes'], [])
+
+        # Long after, the missing change was rolled back.
+        Change.objects.filter(seq=last.seq).update(changed_at=timezone.now() - timedelta(days=1))
+        feed = changes_since(first.seq)
+        self.assertEqual([change['seq'] for change in feed['changes']], [last.seq])
+
+
+@skipUnless('replica' in settings.DATABASES, 'needs the databases of members.test_settings')
+@override_settings(DATABASE_REPLICAS=['replica'], DATABASE_ROUTERS=settings.DATABASE_ROUTERS)
+class PrimaryReplicaRoutingTest(TestCase):
+    """The replica is a database of its own here, so rows read from it show where a query went."""
+    multi_db = True
+
+    def setUp(self):
+        self.addCleanup(routers.unpin)
+        routers.unpin()
+
+    def test_write_goes_to_primary_and_pins(self):
+        account = Account.objects.create(account_id='acc1')
+        self.assertEqual(account._state.db, 'default')
+        self.assertTrue(Account.objects.using('default').filter(account_id='acc1').exists())
+        self.assertFalse(Account.objects.using('replica').filter(account_id='acc1').exists())
+        self.assertTrue(routers.is_pinned())
+        self.assertTrue(Account.objects.filter(account_id='acc1').exists())
+
+    def test_read_goes_to_replica(self):
+        Account.objects.using('replica').create(account_id='replica-only')
+        self.assertEqual(list(Account.objects.values_list('account_id', flat=True)), ['replica-only'])
+        self.assertFalse(routers.is_pinned())
+
+    def test_read_inside_pin_goes_to_primary(self):
+        Account.objects.using('default').create(account_id='primary-only')
+        with routers.use_primary():
+            self.assertEqual(list(Account.objects.values_list('account_id', flat=True)), ['primary-only'])
+        self.assertFalse(routers.is_pinned())
+        self.assertFalse(Account.objects.exists())
+
+
+@skipUnless({'shard0', 'shard1'} <= set(settings.DATABASES), 'needs the databases of members.test_settings')
+@override_settings(SUBSCRIBER_SHARDS=['shard0', 'shard1'])
+class ShardedSubscriberTest(TestCase):
+    multi_db = True
+
+    def setUp(self):
+        # Phone numbers hashing to each shard.
+        numbers = ('55555501{:02d}'.format(n) for n in range(100))
+        self.phones = {}
+        for number in numbers:
+            self.phones.setdefault(sharding.shard_for_phone(number), number)
+            if len(self.phones) == 2:
+                break
+        self.subs = {shard: Subscriber.objects.create_subscriber('First', 'Last', phone, 'cm-' + shard)
+                     for shard, phone in self.phones.items()}
+
+    def test_create(self):
+        for shard, sub in self.subs.items():
+            self.assertEqual(sub._state.db, shard)
+            self.assertTrue(Subscriber.objects.using(shard).filter(id=sub.id).exists())
+            self.assertFalse(Subscriber.objects.using('default').filter(id=sub.id).exists())
+        self.assertNotEqual(self.subs['shard0'].id, self.subs['shard1'].id)
+
+    def test_directory(self):
+        for shard, sub in self.subs.items():
+            location = MemberLocation.objects.get(client_member_id=sub.client_member_id)
+            self.assertEqual((location.id, location.shard), (sub.id, shard))
+
+    def test_duplicate_client_member_id(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Subscriber.objects.create_subscriber('Other', 'Member', self.phones['shard1'] + '9', 'cm-shard0')
+        self.assertEqual(MemberLocation.objects.filter(client_member_id='cm-shard0').count(), 1)
+
+    def test_lookups(self):
+        for shard, sub in self.subs.items():
+            for found in (Subscriber.objects.get_by_id(sub.id),
+                          Subscriber.objects.get_by_phone_number(self.phones[shard]),
+                          Subscriber.objects.get_by_client_member_id(sub.client_member_id)):
+                self.assertEqual((found._state.db, found.id, found.client_member_id),
+                                 (shard, sub.id, sub.client_member_id))
+        missing = max(sub.id for sub in self.subs.values()) + 1
+        with self.assertRaises(Subscriber.DoesNotExist):
+            Subscriber.objects.get_by_id(missing)
+        with self.assertRaises(Subscriber.DoesNotExist):
+            Subscriber.objects.get_by_client_member_id('cm-missing')
+
+    def test_rebalance_from_default(self):
+        with override_settings(SUBSCRIBER_SHARDS=[]):
+            old = Subscriber.objects.create_subscriber('Old', 'Member', '5555550199', 'cm-old')
+            Provider.objects.create_provider(subscriber=old, account_id='acc1')
+        rebalancer = ShardRebalancer()
+        rebalancer.rebalance('default')
+        for shard in settings.SUBSCRIBER_SHARDS:
+            rebalancer.rebalance(shard)
+        self.assertEqual((rebalancer.moved, rebalancer.skipped), (1, 0))
+        self.assertFalse(Subscriber.objects.using('default').exists())
+        location = MemberLocation.objects.get(client_member_id='cm-old')
+        moved = Subscriber.objects.get_by_id(location.id)
+        self.assertEqual((moved._state.db, moved.client_member_id), (location.shard, 'cm-old'))
+        self.assertEqual([provider.account_id for provider in moved.providers.all()], ['acc1'])
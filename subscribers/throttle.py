@@ -0,0 +1,121 @@
+# coding=utf-8
+"""Token bucket rate limits and load shedding for the API.
+
+Every client has a bucket for the whole API and one per endpoint listed in
+``THROTTLE_ENDPOINT_RATES``. Buckets live in ``THROTTLE_CACHE``: a cache shared by the web
+processes makes the limits hold across them, the default local memory cache per process. Reads and
+writes of a bucket aren't atomic, so concurrent requests of one client can now and then get a token
+more than they should.
+
+Load shedding is per process: requests are turned away while too many are in flight, or while the
+queries of the last few seconds were too slow on average. The average is taken over one second
+buckets, so it follows the clock rather than the queries: a shed request runs no query, and the
+slow ones age out of the window all the same.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from members import metrics
+
+
+def client_id(request):
+    """Return what identifies the client of a request for its buckets."""
+    if settings.THROTTLE_CLIENT_HEADER:
+        forwarded = request.META.get(settings.THROTTLE_CLIENT_HEADER, '')
+        if forwarded:
+            return forwarded.split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def take(key, rate, burst):
+    """Take a token from a bucket, return 0 or the seconds until the bucket has one again."""
+    cache = caches[settings.THROTTLE_CACHE]
+    now = time.time()
+    tokens, updated = cache.get(key, (burst, now))
+    tokens = min(burst, tokens + (now - updated) * rate)
+    if tokens < 1:
+        return (1 - tokens) / rate
+    # An expired bucket would have filled up again anyway.
+    cache.set(key, (tokens - 1, now), int(burst / rate) + 1)
+    return 0
+
+
+def throttle(request, endpoint):
+    """Return the seconds the client must wait before calling this endpoint, 0 if it may now."""
+    client = client_id(request)
+    limits = [('throttle:{}'.format(client), settings.THROTTLE_CLIENT_RATE, settings.THROTTLE_CLIENT_BURST)]
+    if endpoint in settings.THROTTLE_ENDPOINT_RATES:
+        rate, burst = settings.THROTTLE_ENDPOINT_RATES[endpoint]
+        limits.append(('throttle:{}:{}'.format(client, endpoint), rate, burst))
+    for key, rate, burst in limits:
+        if rate:
+            wait = take(key, rate, burst)
+            if wait:
+                metrics.incr('throttle.throttled')
+                metrics.incr('throttle.throttled.{}'.format(endpoint))
+                return wait
+    return 0
+
+
+class _Load(object):
+    """Requests in flight and the recent query latency of this process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        # {second: [queries, seconds spent]} of the last SHED_LATENCY_WINDOW seconds.
+        self.buckets = {}
+
+    def record_query(self, seconds):
+        """Add one query to the bucket of the current second."""
+        now = int(time.time())
+        with self.lock:
+            bucket = self.buckets.get(now)
+            if bucket is None:
+                for second in [second for second in self.buckets if second <= now - settings.SHED_LATENCY_WINDOW]:
+                    del self.buckets[second]
+                bucket = self.buckets[now] = [0, 0.0]
+            bucket[0] += 1
+            bucket[1] += seconds
+
+    def query_latency(self):
+        """Return the average query time within the window, 0 below SHED_MIN_QUERIES queries."""
+        horizon = int(time.time()) - settings.SHED_LATENCY_WINDOW
+        with self.lock:
+            recent = [bucket for second, bucket in self.buckets.items() if second > horizon]
+        queries = sum(count for count, _ in recent)
+        if not queries or queries < settings.SHED_MIN_QUERIES:
+            return 0.0
+        return sum(seconds for _, seconds in recent) / queries
+
+    def shed_reason(self):
+        """Return why a new request should be turned away, None to take it."""
+        # The request asking is already counted.
+        if settings.SHED_MAX_IN_FLIGHT and self.in_flight > settings.SHED_MAX_IN_FLIGHT:
+            return 'in_flight'
+        if settings.SHED_MAX_QUERY_MS and self.query_latency() * 1000 > settings.SHED_MAX_QUERY_MS:
+            return 'query_latency'
+        return None
+
+    def enter(self):
+        with self.lock:
+            self.in_flight += 1
+
+    def leave(self):
+        with self.lock:
+            self.in_flight -= 1
+
+
+load = _Load()
+
+
+def time_query(execute, sql, params, many, context):
+    """Database execute wrapper feeding the query latency of the load shedding."""
+    start = time.time()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        load.record_query(time.time() - start)
@@ -1,43 +1,63 @@
 import logging
 import simplejson
 import datetime
+import codecs
 import csv
-import io
 
 from rest_framework import status
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import render
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from subscribers.models import Subscriber, Provider
+from subscribers.models import Subscriber, Provider, ImportJob
 from rest_framework.renderers import JSONRenderer
 from rest_framework.parsers import MultiPartParser
-from subscribers.tasks import create_subscriber_patch
-from members import settings
+from subscribers.tasks import run_import_job
+from subscribers.imports import create_job, job_data
+from subscribers.routers import pin_to_primary
+from subscribers.search import search_members
+from subscribers.changes import changes_since
+from subscribers.export import export_members, CONTENT_TYPES
+from subscribers.preflight import Preflight
+from subscribers import stats, snapshot
+from subscribers.coalesce import coalesce
+from members import settings, tracing
 
 log = logging.getLogger('.'.join((settings.LOG_NAME.split('.')[0], __name__,)))
 
 
+def _member_data(sub):
+    return {
+        "member": str(sub),
+        "providers": [str(provider) for provider in sub.providers.all()]
+    }
+
+
+def _lookup_response(key, fetch):
+    """Respond with the data fetch returns, rendered once for identical lookups running at the same time."""
+    def render():
+        try:
+            with tracing.span('fetch'):
+                data = fetch()
+        except Subscriber.DoesNotExist:
+            return status.HTTP_404_NOT_FOUND, JSONRenderer().render({})
+        with tracing.span('serialize'):
+            return status.HTTP_200_OK, JSONRenderer().render(data)
+    response_status, content = coalesce(key, render)
+    return HttpResponse(content, status=response_status, content_type='application/json')
+
+
 class GetSubsByAccountId(APIView):
     """Return all subscribers by a given account id."""
 
     renderer_classes = (JSONRenderer,)
 
     def get(self, request, account_id):  # noqa request
-        try:
-            log.info("Received request to get Member with account_id: %s", account_id,
-                     extra={'request_time': str(datetime.datetime.utcnow())})
-            data = Provider.objects.filter(account_id=account_id)
-            data = [
-                {
-                    "member": str(sub.subscriber),
-                    "providers": [str(provider) for provider in sub.subscriber.providers.all()]
-                }
-                for sub in data]
-            return Response(data=data,
-                            status=status.HTTP_200_OK)
-        except Provider.DoesNotExist:
-            return Response(data={}, status=status.HTTP_404_NOT_FOUND)
+        log.info("Received request to get Member with account_id: %s", account_id,
+                 extra={'request_time': str(datetime.datetime.utcnow())})
+        return _lookup_response('account:' + account_id, lambda: [
+            _member_data(provider.subscriber) for provider in Provider.objects.for_account(account_id)])
 
 
 class GetSubById(APIView):
@@ -46,18 +66,10 @@ class GetSubById(APIView):
     renderer_classes = (JSONRenderer,)
 
     def get(self, request, id):  # noqa request
-        try:
-            log.info("Received request to get Member with id: %s", id,
-                     extra={'request_time': str(datetime.datetime.utcnow())})
-            data = Subscriber.objects.get(id=id)
-            data = {
-                "member": str(data),
-                "providers": [str(provider) for provider in data.providers.all()]
-            }
-            return Response(data=data,
-                            status=status.HTTP_200_OK)
-        except Subscriber.DoesNotExist:
-            return Response(data={}, status=status.HTTP_404_NOT_FOUND)
+        log.info("Received request to get Member with id: %s", id,
+                 extra={'request_time': str(datetime.datetime.utcnow())})
+        return _lookup_response('id:' + id, lambda: (
+            snapshot.find_by_id(id) or _member_data(Subscriber.objects.get_by_id(id))))
 
 
 class GetSubByPhoneNumber(APIView):
@@ -66,18 +78,11 @@ class GetSubByPhoneNumber(APIView):
     renderer_classes = (JSONRenderer,)
 
     def get(self, request, phone_number):  # noqa request
-        try:
-            log.info("Received request to get Member with phone_number: %s", phone_number,
-                     extra={'request_time': str(datetime.datetime.utcnow())})
-            data = Subscriber.objects.get(phone_number=phone_number)
-            data = {
-                "member": str(data),
-                "providers": [str(provider) for provider in data.providers.all()]
-            }
-            return Response(data=data,
-                            status=status.HTTP_200_OK)
-        except Subscriber.DoesNotExist:
-            return Response(data={}, status=status.HTTP_404_NOT_FOUND)
+        log.info("Received request to get Member with phone_number: %s", phone_number,
+                 extra={'request_time': str(datetime.datetime.utcnow())})
+        return _lookup_response('phone:' + phone_number, lambda: (
+            snapshot.find_by_phone_number(phone_number) or
+            _member_data(Subscriber.objects.get_by_phone_number(phone_number))))
 
 
 class GetSubByClientMemberId(APIView):
@@ -86,18 +91,124 @@ class GetSubByClientMemberId(APIView):
     renderer_classes = (JSONRenderer,)
 
     def get(self, request, client_member_id):  # noqa request
+        log.info("Received request to get Member with client_member_id: %s", client_member_id,
+                 extra={'request_time': str(datetime.datetime.utcnow())})
+        return _lookup_response('client_member_id:' + client_member_id, lambda: (
+            snapshot.find_by_client_member_id(client_member_id) or
+            _member_data(Subscriber.objects.get_by_client_member_id(client_member_id))))
+
+
+class SearchMembers(APIView):
+    """Return subscribers by first or last name prefix and phone number suffix, a page at a time."""
+
+    renderer_classes = (JSONRenderer,)
+
+    def get(self, request):
+        params = request.query_params
+        log.info("Received request to search Members with: %s", dict(params.items()),
+                 extra={'request_time': str(datetime.datetime.utcnow())})
         try:
-            log.info("Received request to get Member with client_member_id: %s", client_member_id,
-                     extra={'request_time': str(datetime.datetime.utcnow())})
-            data = Subscriber.objects.get(client_member_id=client_member_id)
-            data = {
-                "member": str(data),
-                "providers": [str(provider) for provider in data.providers.all()]
-            }
-            return Response(data=data,
-                            status=status.HTTP_200_OK)
-        except Subscriber.DoesNotExist:
+            subs, next_cursor = search_members(
+                first_name=params.get('first_name'), last_name=params.get('last_name'),
+                phone_suffix=params.get('phone_suffix'), limit=params.get('limit', 50),
+                cursor=params.get('cursor'))
+        except ValueError as e:
+            return Response(data=str(e), status=status.HTTP_400_BAD_REQUEST)
+        data = {
+            "results": [
+                {
+                    "member": str(sub),
+                    "providers": [str(provider) for provider in sub.providers.all()]
+                }
+                for sub in subs],
+            "next_cursor": next_cursor,
+        }
+        return Response(data=data,
+                        status=status.HTTP_200_OK)
+
+
+class GetChanges(APIView):
+    """Return the member and provider changes after a cursor, for downstream sync."""
+
+    renderer_classes = (JSONRenderer,)
+
+    def get(self, request):
+        since = request.query_params.get('since', 0)
+        log.info("Received request to get Changes since: %s", since,
+                 extra={'request_time': str(datetime.datetime.utcnow())})
+        try:
+            data = changes_since(since, request.query_params.get('limit', 500))
+        except ValueError:
+            return Response(data="since and limit must be integers.", status=status.HTTP_400_BAD_REQUEST)
+        return Response(data=data,
+                        status=status.HTTP_200_OK)
+
+
+class GetImportJob(APIView):
+    """Return the progress of an import job."""
+
+    renderer_classes = (JSONRenderer,)
+
+    def get(self, request, job_id):
+        log.info("Received request to get ImportJob for id: %s", job_id,
+                 extra={'request_time': str(datetime.datetime.utcnow())})
+        try:
+            job = ImportJob.objects.get(pk=job_id)
+        except ImportJob.DoesNotExist:
             return Response(data={}, status=status.HTTP_404_NOT_FOUND)
+        return Response(data=job_data(job),
+                        status=status.HTTP_200_OK)
+
+
+class ResumeImportJob(APIView):
+    """Queue an unfinished import job again, it carries on from its last committed chunk."""
+
+    renderer_classes = (JSONRenderer,)
+
+    def post(self, request, job_id):
+        log.info("Received request to resume ImportJob for id: %s", job_id,
+                 extra={'request_time': str(datetime.datetime.utcnow())})
+        try:
+            job = ImportJob.objects.get(pk=job_id)
+        except ImportJob.DoesNotExist:
+            return Response(data={}, status=status.HTTP_404_NOT_FOUND)
+        if job.status == ImportJob.DONE:
+            return Response(data="Import job is already done", status=status.HTTP_409_CONFLICT)
+        run_import_job.delay(job.id)
+        return Response(data=job_data(job),
+                        status=status.HTTP_202_ACCEPTED)
+
+
+class GetAccountStats(APIView):
+    """Return the member count of one or more accounts, given as account_id=1&account_id=2 or account_id=1,2."""
+
+    renderer_classes = (JSONRenderer,)
+
+    def get(self, request):
+        account_ids = [account_id for value in request.query_params.getlist('account_id')
+                       for account_id in value.split(',') if account_id]
+        log.info("Received request to get AccountStats for: %s", account_ids,
+                 extra={'request_time': str(datetime.datetime.utcnow())})
+        if not account_ids:
+            return Response(data="Give at least one account_id.", status=status.HTTP_400_BAD_REQUEST)
+        if len(account_ids) > stats.MAX_ACCOUNTS:
+            return Response(data="At most {} accounts at a time.".format(stats.MAX_ACCOUNTS),
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(data={"accounts": stats.account_counts(account_ids)},
+                        status=status.HTTP_200_OK)
+
+
+class ExportMembers(APIView):
+    """Stream every member, or the members of one account, as CSV or NDJSON."""
+
+    def get(self, request, export_format):
+        account_id = request.query_params.get('account_id')
+        log.info("Received request to export Members as %s for account_id: %s", export_format, account_id,
+                 extra={'request_time': str(datetime.datetime.utcnow())})
+        response = StreamingHttpResponse(export_members(export_format, account_id),
+                                         content_type=CONTENT_TYPES[export_format])
+        response['Content-Disposition'] = 'attachment; filename="members.{}"'.format(export_format)
+        return response
 
 
 class CreateMember(APIView):
@@ -117,6 +228,8 @@ class CreateMember(APIView):
         phone_number = data.get('phone_number', None)
         client_member_id = data.get('client_member_id', None)
         provider_info = data.get("provider_info", [])
+        # Read and write on the primary, and keep the client there for its next reads.
+        pin_to_primary()
         return create_member(first_name,last_name,phone_number,client_member_id,provider_info)
 
 
@@ -125,15 +238,24 @@ class SubscriberBatchProcess(APIView):
 
     def post(self, request):
         data_file = request.FILES['myfile']
-        decoded_file = data_file.read().decode('utf-8')
-        io_string = io.StringIO(decoded_file)
-        file_content = csv.reader(io_string, delimiter=',', quotechar='|')
-        members = []
-        for row in file_content:
-            members.append(row)
-        create_subscriber_patch.delay(members)
+        # Rows are decoded and checked line by line, straight into the job's rows file.
+        file_content = csv.reader(codecs.iterdecode(data_file, 'utf-8'), delimiter=',', quotechar='|')
+        preflight = Preflight()
+        if request.data.get('dry_run'):
+            for _ in preflight.check(file_content):
+                pass
+            return Response(data=preflight.report, status=status.HTTP_200_OK)
+        sync = request.data.get('mode') == ImportJob.SYNC
+        # A sync applies only the delta, scoped to one account's roster when one is given.
+        job = create_job(preflight.check(file_content), mode=ImportJob.SYNC if sync else ImportJob.CREATE,
+                         account_id=request.data.get('account_id') if sync else '')
+        log.info(simplejson.dumps({'Member file preflight.': preflight.report}))
+        run_import_job.delay(job.id)
         return render(request, '{}/subscribers/templates/subscriber_upload.html'.format(settings.BASE_DIR), {
-            'upload_file': True
+            'upload_file': True,
+            'sync': sync,
+            'job': job,
+            'report': preflight.report,
         })
 
     def get(self, request):
@@ -149,10 +271,7 @@ def create_member(first_name, last_name, phone_number, client_member_id, provide
                         status=status.HTTP_400_BAD_REQUEST)
     try:
         try:
-            sub_result = list(Subscriber.objects.filter(
-                phone_number=phone_number, client_member_id=client_member_id))
-            if sub_result:
-                sub = sub_result[0]
+            sub = Subscriber.objects.find_member(phone_number, client_member_id)
         except Exception:  # noqa Not expecting this to ever hit.
             pass
         if not sub:
@@ -160,15 +279,15 @@ def create_member(first_name, last_name, phone_number, client_member_id, provide
                 first_name=first_name, last_name=last_name,
                 phone_number=phone_number, client_member_id=client_member_id
             )
-            sub.save()
-        for provider_id in provider_info:
-            try:
-                provider = Provider.objects.create_provider(subscriber=sub,
-                                                            account_id=str(provider_id))
-                provider.save()
-            except IntegrityError:
-                log.info("Provider and subscriber combo already exists, skipping.")
-                pass
+        # The providers and their account counts commit together.
+        with transaction.atomic(using=sub._state.db), stats.batch():
+            for provider_id in provider_info:
+                try:
+                    with transaction.atomic(using=sub._state.db):
+                        Provider.objects.create_provider(subscriber=sub, account_id=str(provider_id))
+                except IntegrityError:
+                    log.info("Provider and subscriber combo already exists, skipping.")
+                    pass
 
     except IntegrityError as e:
         return Response(